@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+Peak RSS of the full-page and bulk-sync workloads, once with response.json() and once with the streaming parser.
+Every run happens in its own process against a local server serving synthetic NVD pages, so nothing hits the real API.
+
+    python benchmarks/bench_memory.py [--records 2000] [--pages 10]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from stub_server import Dataset, fake_record, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+"""
+Peak RSS of the current process in MB. On Linux ru_maxrss survives exec() (the child would report the server's peak), so
+VmHWM is read from /proc there instead.
+"""
+def peak_rss() -> float:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+"""
+Runs one workload inside the child process and prints its peak RSS, and how much of it the workload added on top of the imports.
+"""
+def run_workload(workload, url) -> None:
+    from core.transport import Transport
+    from core.ratelimit import RateLimiter
+    from core.pager import Pager
+    from core.mirror import Mirror
+
+    transport = Transport(rate_limiter=RateLimiter(10000, 1), pool_size=8)
+    pager = Pager(transport.get_json, max_workers=4, get_stream=transport.get_stream)
+    baseline = peak_rss()
+    count = 0
+
+    if workload == 'page-json':
+        for vulnerability in transport.get_json(pager.page_url(url, 0))['vulnerabilities']:
+            count += len(vulnerability['cve']['id'])
+
+    elif workload == 'page-stream':
+        for vulnerability in transport.get_stream(pager.page_url(url, 0)):
+            count += len(vulnerability['cve']['id'])
+
+    elif workload in ('sync-json', 'sync-stream'):
+        with tempfile.TemporaryDirectory() as directory:
+            mirror = Mirror(os.path.join(directory, 'mirror.db'))
+            if workload == 'sync-json':
+                # What the sync did before: whole pages decoded with response.json()
+                for page in pager.iter_pages(url):
+                    count += mirror.store(page)
+            else:
+                sys.stdout = open(os.devnull, 'w')
+                count = mirror.sync(pager, url)
+                sys.stdout = sys.__stdout__
+            mirror.close()
+
+    peak = peak_rss()
+    print(json.dumps({'workload': workload, 'peak_mb': round(peak, 1), 'growth_mb': round(peak - baseline, 1), 'count': count}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak RSS of the JSON vs. streaming parsing paths')
+    parser.add_argument('--records', type=int, default=2000, help='Records per page')
+    parser.add_argument('--pages', type=int, default=10, help='Pages served for the sync workloads')
+    parser.add_argument('--workload', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.workload:
+        run_workload(args.workload, args.url)
+        return
+
+    # No latency and no compression, only the parsing paths should differ
+    server = serve(Dataset([fake_record(index) for index in range(args.records * args.pages)]), page_size=args.records, compress=False)
+    url = f'http://127.0.0.1:{server.server_address[1]}/rest/json/cves/2.0'
+
+    print(f'{args.records} records per page, {args.pages} pages for the sync workloads\n')
+    print(f'{"workload":<14}{"peak RSS":>12}{"growth":>12}')
+
+    for workload in ('page-json', 'page-stream', 'sync-json', 'sync-stream'):
+        output = subprocess.run([sys.executable, __file__, '--workload', workload, '--url', url], capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{result["workload"]:<14}{result["peak_mb"]:>9} MB{result["growth_mb"]:>9} MB')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
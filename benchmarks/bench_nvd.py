@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+"""
+Throughput and latency of the search mode (Fetcher.fetch_cve_keywords) and of N orbit cycles (Orbit.cycle) against the
+local NVD stand-in of stub_server.py. Reports requests/sec, records/sec, p50/p99 latency (per search run and per orbit
+cycle) and the peak RSS of every phase. Every phase runs in its own process, the server in another one.
+
+    python benchmarks/bench_nvd.py [--records 20000] [--latency 0.05] [--error-rate 0.02] [--cycles 20]
+    python benchmarks/bench_nvd.py --save baseline.json
+    python benchmarks/bench_nvd.py --compare baseline.json    # exits with 1 if a number got worse than --tolerance
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+from bench_memory import peak_rss
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_server.py')
+PHASES = ('search', 'orbit-keyword', 'orbit-delta')
+
+
+"""
+Nearest-rank percentile, good enough for a few dozen samples.
+"""
+def percentile(values, p) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values) + 0.5) - 1))]
+
+
+def server_stats(url) -> dict:
+    with urllib.request.urlopen(url.split('/rest/')[0] + '/_stats') as response:
+        return json.loads(response.read())
+
+
+"""
+Runs one phase inside the child process and prints its numbers as a JSON line.
+"""
+def run_phase(phase, url, args) -> None:
+    from core.transport import Transport
+    from core.ratelimit import RateLimiter
+    from core.retry import RetryPolicy
+    from core.search import Fetcher
+    from core.orbit import Orbit
+    from core.query import QuerySpec
+    from core.render import NullRenderer
+
+    class CountingRenderer(NullRenderer):
+        def __init__(self):
+            super().__init__()
+            self.records = 0
+
+        def record(self, record) -> None:
+            self.records += 1
+
+    # The quota of the real API would be all we measure, the default is "as fast as the server answers"
+    rate_limiter = RateLimiter(args.rate, 1) if args.rate else RateLimiter(1000000, 1)
+    retry_policy = RetryPolicy(max_retries=args.retries, backoff_base=args.backoff)
+    transport = Transport(rate_limiter=rate_limiter, retry_policy=retry_policy, pool_size=args.window_workers * (args.workers + 1))
+    renderer = CountingRenderer()
+    now = datetime.now()
+
+    # The messages of the modes would only measure the terminal
+    sys.stdout = open(os.devnull, 'w')
+    before = server_stats(url)
+    latencies = []
+    started = time.perf_counter()
+
+    if phase == 'search':
+        fetch = Fetcher(transport, max_workers=args.workers)
+        fetch.base_url = url
+        fetch.renderer = renderer
+        fetch.window_workers = args.window_workers
+        # The whole dataset, so the range is split into 120 days windows like a real long search
+        spec = QuerySpec.create(args.keywords, filters={
+            'pubStartDate': (now - timedelta(days=args.days + 1)).strftime('%Y-%m-%dT%H:%M:%S.000'),
+            'pubEndDate': now.strftime('%Y-%m-%dT%H:%M:%S.000')
+        })
+        for _ in range(args.runs):
+            run_started = time.perf_counter()
+            fetch.fetch_cve_keywords(spec)
+            latencies.append(time.perf_counter() - run_started)
+
+    else:
+        orbit = Orbit(transport, strategy=phase.split('-')[1])
+        orbit.base_url = url
+        orbit.renderer = renderer
+        orbit.window_workers = args.window_workers
+        if args.track_updates:
+            orbit.track_updates()
+        # The first cycle catches up on the last "--catch-up" days, the following ones are the steady state of a running monitor
+        start_time = (now - timedelta(days=args.catch_up)).strftime('%Y-%m-%dT%H:%M:%S.000')
+        spec = QuerySpec.create(args.keywords)
+        for _ in range(args.cycles):
+            cycle_started = time.perf_counter()
+            orbit.cycle(spec, start_time)
+            latencies.append(time.perf_counter() - cycle_started)
+
+    elapsed = time.perf_counter() - started
+    after = server_stats(url)
+    sys.stdout = sys.__stdout__
+
+    requests = after['requests'] - before['requests']
+    print(json.dumps({
+        'phase': phase,
+        'seconds': round(elapsed, 3),
+        'requests': requests,
+        'errors': after['errors'] + after['throttled'] - before['errors'] - before['throttled'],
+        'records': renderer.records,
+        'requests_per_sec': round(requests / elapsed, 1),
+        'records_per_sec': round(renderer.records / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'peak_mb': round(peak_rss(), 1)
+    }))
+
+
+"""
+Starts stub_server.py on a free port and returns the process and the URL it printed.
+"""
+def start_server(args):
+    command = [
+        sys.executable, STUB, '--port', '0', '--records', str(args.records), '--days', str(args.days),
+        '--page-size', str(args.page_size), '--latency', str(args.latency), '--jitter', str(args.jitter),
+        '--error-rate', str(args.error_rate), '--throttle-rate', str(args.throttle_rate), '--seed', str(args.seed)
+    ]
+    if args.replay:
+        command += ['--replay', args.replay]
+
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line:
+        raise RuntimeError('The stub server did not start')
+    return server, line.split()[0]
+
+
+"""
+Compares the results to a saved baseline. Lower throughput or higher latency/memory than the tolerance allows is a regression.
+"""
+def compare(results, baseline, tolerance) -> list:
+    regressions = []
+    higher_is_better = ('requests_per_sec', 'records_per_sec')
+
+    for phase, result in results.items():
+        for metric in ('requests_per_sec', 'records_per_sec', 'p50_ms', 'p99_ms', 'peak_mb'):
+            old = baseline.get(phase, {}).get(metric)
+            if not old:
+                continue
+
+            change = (result[metric] - old) / old
+            if (metric in higher_is_better and change < -tolerance) or (metric not in higher_is_better and change > tolerance):
+                regressions.append(f'{phase}: {metric} {old} -> {result[metric]} ({change:+.0%})')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search and orbit benchmarks against a local NVD stand-in')
+    parser.add_argument('--replay', help='Directory with recorded NVD responses, synthetic records otherwise')
+    parser.add_argument('--records', type=int, default=20000, help='Synthetic records served')
+    parser.add_argument('--days', type=int, default=365, help='Days the synthetic records are spread over')
+    parser.add_argument('--page-size', type=int, default=2000, help='Most records per page')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds the server adds to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency of up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of the requests answered with a 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of the requests answered with a 429')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the injected latency and errors')
+    parser.add_argument('--keywords', nargs='+', default=['apache', 'linux kernel', 'cisco', 'openssl'], help='Keywords searched and watched')
+    parser.add_argument('--runs', type=int, default=3, help='Search runs')
+    parser.add_argument('--cycles', type=int, default=20, help='Orbit cycles per strategy')
+    parser.add_argument('--catch-up', type=int, default=7, help='Days the first orbit cycle catches up on')
+    parser.add_argument('--track-updates', action='store_true', help='Orbit cycles with the lastModified poll')
+    parser.add_argument('--workers', type=int, default=4, help='Pages fetched at the same time')
+    parser.add_argument('--window-workers', type=int, default=2, help='Date windows fetched at the same time')
+    parser.add_argument('--rate', type=int, help='Requests per second the rate limiter allows (unlimited by default)')
+    parser.add_argument('--retries', type=int, default=5, help='Retries of a failed request')
+    parser.add_argument('--backoff', type=float, default=0.05, help='Base of the retry backoff in seconds')
+    parser.add_argument('--phases', nargs='+', choices=PHASES, default=list(PHASES), help='Phases to run')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file (see --save) to compare the results to')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed change against the baseline (0.2 = 20%%)')
+    parser.add_argument('--phase', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        run_phase(args.phase, args.url, args)
+        return
+
+    server, url = start_server(args)
+    print(f'Stub server: {url}, latency {args.latency}s, {args.error_rate:.0%} 503 and {args.throttle_rate:.0%} 429 responses\n')
+    print(f'{"phase":<15}{"requests/s":>12}{"records/s":>12}{"p50":>11}{"p99":>11}{"peak RSS":>12}{"errors":>8}')
+
+    results = {}
+    try:
+        for phase in args.phases:
+            command = [sys.executable, __file__, *sys.argv[1:], '--phase', phase, '--url', url]
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results[phase] = result
+            print(f'{phase:<15}{result["requests_per_sec"]:>12}{result["records_per_sec"]:>12}{result["p50_ms"]:>8} ms{result["p99_ms"]:>8} ms{result["peak_mb"]:>9} MB{result["errors"]:>8}')
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('\nRegressions against the baseline:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print('\nNo regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+"""
+A local stand-in for the NVD CVE API (/rest/json/cves/2.0), so the benchmarks never depend on the load of the real service
+or on our quota. It serves either recorded NVD responses (every *.json / *.json.gz file of a directory, as saved from the
+API) or synthetic records, and it understands the parameters CVE Orbit sends: keywordSearch, cveId, the severity filters,
+the published/last modified ranges (longer than 120 days is rejected like NVD does), startIndex and resultsPerPage.
+Latency, 5xx errors and 429 throttling can be injected. GET /_stats returns the counters of the server.
+
+    python benchmarks/stub_server.py [--port 8765] [--replay recordings/] [--records 20000] [--latency 0.05] [--error-rate 0.02]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+# Same as the real API: the page size when "resultsPerPage" is missing, and the longest date range it accepts
+MAX_PAGE_SIZE = 2000
+MAX_RANGE_DAYS = 120
+
+VENDORS = {
+    'apache': ('tomcat', 'http server', 'struts', 'log4j'),
+    'microsoft': ('windows', 'exchange server', 'office'),
+    'linux': ('linux kernel',),
+    'cisco': ('ios xe', 'asa', 'webex'),
+    'oracle': ('mysql', 'weblogic server', 'java se'),
+    'openssl': ('openssl',),
+    'gitlab': ('gitlab',),
+    'jenkins': ('jenkins',)
+}
+
+SCORES = ((9.8, 'CRITICAL'), (7.5, 'HIGH'), (5.3, 'MEDIUM'), (3.1, 'LOW'))
+
+
+"""
+A record roughly the size of a real NVD entry (long description, several metrics, a configurations block). The vendors
+and products rotate, so a keyword search matches a realistic share of the records.
+"""
+def fake_record(index, published='2024-01-01T00:00:00.000', last_modified='2024-02-01T00:00:00.000') -> dict:
+    vendor = list(VENDORS)[index % len(VENDORS)]
+    product = VENDORS[vendor][index // len(VENDORS) % len(VENDORS[vendor])]
+    score, severity = SCORES[index % len(SCORES)]
+
+    return {
+        'cve': {
+            'id': f'CVE-{published[:4]}-{index:05d}',
+            'sourceIdentifier': 'cve@mitre.org',
+            'published': published,
+            'lastModified': last_modified,
+            'vulnStatus': 'Analyzed',
+            'descriptions': [{'lang': 'en', 'value': f'Benchmark vulnerability {index} in {vendor.title()} {product.title()}. ' + 'A remote attacker could exploit this issue. ' * 20}],
+            'metrics': {
+                'cvssMetricV31': [{'source': 'nvd@nist.gov', 'type': 'Primary', 'cvssData': {'version': '3.1', 'vectorString': 'CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H', 'baseScore': score, 'baseSeverity': severity}, 'exploitabilityScore': 3.9, 'impactScore': 5.9}],
+                'cvssMetricV2': [{'source': 'nvd@nist.gov', 'type': 'Primary', 'cvssData': {'version': '2.0', 'vectorString': 'AV:N/AC:L/Au:N/C:P/I:P/A:P', 'baseScore': 7.5}, 'baseSeverity': 'HIGH'}]
+            },
+            'weaknesses': [{'source': 'nvd@nist.gov', 'type': 'Primary', 'description': [{'lang': 'en', 'value': 'CWE-787'}]}],
+            'configurations': [{'nodes': [{'operator': 'OR', 'negate': False, 'cpeMatch': [
+                {'vulnerable': True, 'criteria': f'cpe:2.3:a:{vendor}:{product.replace(" ", "_")}:*:*:*:*:*:*:*:*', 'versionEndExcluding': f'{index % 10}.{n}', 'matchCriteriaId': '00000000-0000-0000-0000-000000000000'}
+                for n in range(5)
+            ]}]}],
+            'references': [{'url': f'https://example.com/advisory/{index}/{n}', 'source': 'cve@mitre.org'} for n in range(10)]
+        }
+    }
+
+
+"""
+"records" synthetic records, published evenly over the last "days" days (the newest one right now) and modified a day later.
+"""
+def synthetic(records, days=365) -> list:
+    now = datetime.now()
+    step = timedelta(days=days) / max(1, records)
+    vulnerabilities = []
+
+    for index in range(records):
+        published = now - timedelta(days=days) + step * (index + 1)
+        last_modified = min(now, published + timedelta(days=1))
+        vulnerabilities.append(fake_record(index, published.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3], last_modified.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]))
+
+    return vulnerabilities
+
+
+"""
+Loads the vulnerabilities of every recorded response of a directory. A CVE found in several recordings is kept once, in
+its last modified version.
+"""
+def load_recordings(path) -> list:
+    vulnerabilities = {}
+
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(('.json', '.json.gz')):
+            continue
+
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(os.path.join(path, name), 'rt', encoding='utf-8') as f:
+            for vulnerability in json.load(f).get('vulnerabilities', []):
+                cve = vulnerability['cve']
+                known = vulnerabilities.get(cve['id'])
+                if known is None or known['cve'].get('lastModified', '') <= cve.get('lastModified', ''):
+                    vulnerabilities[cve['id']] = vulnerability
+
+    return list(vulnerabilities.values())
+
+
+class Dataset:
+
+    # Filtered results kept per query, the orbit asks the same questions every cycle
+    cache_size = 256
+
+    def __init__(self, vulnerabilities):
+        # Sorted by publication date like NVD does. Every record is encoded once, the pages are joined from the bytes.
+        self.vulnerabilities = sorted(vulnerabilities, key=lambda vulnerability: vulnerability['cve'].get('published', ''))
+        self.encoded = [json.dumps(vulnerability, separators=(',', ':')).encode('utf-8') for vulnerability in self.vulnerabilities]
+        self.descriptions = [
+            ' '.join(description['value'] for description in vulnerability['cve'].get('descriptions', [])).lower()
+            for vulnerability in self.vulnerabilities
+        ]
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def __len__(self) -> int:
+        return len(self.vulnerabilities)
+
+
+    def matches(self, position, query) -> bool:
+        cve = self.vulnerabilities[position]['cve']
+
+        if 'cveId' in query and cve['id'] != query['cveId'].upper():
+            return False
+
+        if 'keywordSearch' in query:
+            # Like NVD: every word of the keyword has to be in the description
+            if not all(word in self.descriptions[position] for word in query['keywordSearch'].lower().split()):
+                return False
+
+        for field, start, end in (('published', 'pubStartDate', 'pubEndDate'), ('lastModified', 'lastModStartDate', 'lastModEndDate')):
+            if start in query and not query[start] <= cve.get(field, '') <= query[end]:
+                return False
+
+        for parameter, metric in (('cvssV3Severity', ('cvssMetricV31', 'cvssMetricV30')), ('cvssV4Severity', ('cvssMetricV40',))):
+            if parameter in query:
+                severities = [
+                    entry['cvssData'].get('baseSeverity')
+                    for name in metric for entry in cve.get('metrics', {}).get(name, [])
+                ]
+                if query[parameter].upper() not in severities:
+                    return False
+
+        return True
+
+
+    """
+    The positions of the records matching a query (without its paging parameters).
+    """
+    def select(self, query) -> list:
+        key = tuple(sorted(query.items()))
+
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+
+        positions = [position for position in range(len(self.vulnerabilities)) if self.matches(position, query)]
+
+        with self.lock:
+            self.results[key] = positions
+            while len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+
+        return positions
+
+
+"""
+Checks a query the way NVD would and returns an error message, or None if it's fine.
+"""
+def validate(query):
+    for start, end in (('pubStartDate', 'pubEndDate'), ('lastModStartDate', 'lastModEndDate')):
+        if (start in query) != (end in query):
+            return f'{start} and {end} have to be given together'
+        if start in query:
+            try:
+                days = (datetime.fromisoformat(query[end]) - datetime.fromisoformat(query[start])).total_seconds() / 86400
+            except ValueError:
+                return f'Invalid date in {start}/{end}'
+            if days > MAX_RANGE_DAYS:
+                return f'The {start}/{end} range is longer than {MAX_RANGE_DAYS} days'
+
+    return None
+
+
+"""
+Starts the server in a background thread and returns it. "latency" (plus a random "jitter") in seconds is added to every
+response, "error_rate" and "throttle_rate" are the shares of the requests answered with a 503 or a 429.
+"""
+def serve(dataset, port=0, page_size=MAX_PAGE_SIZE, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=None, seed=None, compress=True):
+    generator = random.Random(seed)
+    lock = threading.Lock()
+    stats = {'requests': 0, 'pages': 0, 'records': 0, 'errors': 0, 'throttled': 0, 'rejected': 0}
+
+    def count(**counters):
+        with lock:
+            for name, value in counters.items():
+                stats[name] += value
+
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 keep-alive, so the connection reuse of the transport is part of what we measure
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Headers and body are two writes, without this Nagle and the delayed ACKs add 40 ms to every response
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body, headers=None):
+            if compress and 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 1024:
+                body = gzip.compress(body, compresslevel=1)
+                headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path == '/_stats':
+                with lock:
+                    self.reply(200, json.dumps(dict(stats, dataset=len(dataset))).encode())
+                return
+
+            count(requests=1)
+            with lock:
+                roll = generator.random()
+                delay = latency + generator.uniform(0, jitter)
+            if delay:
+                time.sleep(delay)
+
+            if roll < throttle_rate:
+                count(throttled=1)
+                self.reply(429, b'{"message":"Too Many Requests"}', {'Retry-After': str(retry_after)} if retry_after is not None else None)
+                return
+            if roll < throttle_rate + error_rate:
+                count(errors=1)
+                self.reply(503, b'{"message":"Service Unavailable"}')
+                return
+
+            query = dict(parse_qsl(parsed.query))
+            start = int(query.pop('startIndex', 0))
+            per_page = min(int(query.pop('resultsPerPage', page_size)), page_size)
+
+            message = validate(query)
+            if message is not None:
+                # NVD answers invalid parameters with a 404 and the reason in a header
+                count(rejected=1)
+                self.reply(404, b'', {'message': message})
+                return
+
+            positions = dataset.select(query)
+            page = positions[start:start + per_page]
+            count(pages=1, records=len(page))
+
+            body = b''.join((
+                json.dumps({
+                    'resultsPerPage': len(page), 'startIndex': start, 'totalResults': len(positions),
+                    'format': 'NVD_CVE', 'version': '2.0', 'timestamp': datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+                })[:-1].encode(),
+                b', "vulnerabilities": [',
+                b','.join(dataset.encoded[position] for position in page),
+                b']}'
+            ))
+            self.reply(200, body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the NVD CVE API')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (0 picks a free one)')
+    parser.add_argument('--replay', help='Directory with recorded NVD responses (*.json, *.json.gz) to serve')
+    parser.add_argument('--records', type=int, default=20000, help='Synthetic records to serve when nothing is replayed')
+    parser.add_argument('--days', type=int, default=365, help='Days the synthetic records are spread over')
+    parser.add_argument('--page-size', type=int, default=MAX_PAGE_SIZE, help='Most records per page')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency of up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of the requests answered with a 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of the requests answered with a 429')
+    parser.add_argument('--retry-after', type=float, help='Retry-After header of the 429 responses')
+    parser.add_argument('--seed', type=int, help='Seed of the injected latency and errors')
+    parser.add_argument('--no-gzip', action='store_true', help='Never compress the responses')
+    args = parser.parse_args()
+
+    vulnerabilities = load_recordings(args.replay) if args.replay else synthetic(args.records, args.days)
+    server = serve(
+        Dataset(vulnerabilities), args.port, args.page_size, args.latency, args.jitter,
+        args.error_rate, args.throttle_rate, args.retry_after, args.seed, not args.no_gzip
+    )
+
+    # The first line is read by bench_nvd.py to find the server
+    print(f'http://127.0.0.1:{server.server_address[1]}/rest/json/cves/2.0 ({len(vulnerabilities)} records)', flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
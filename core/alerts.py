@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+import abc
+import queue
+import random
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+import requests
+
+from core.colors import Colors
+
+
+class Channel(abc.ABC):
+
+    name = 'channel'
+    max_length = 4000 # Most chat services refuse longer messages
+
+    # Parts of the configuration that must never end up in the console or the logs (tokens, webhook URLs)
+    secrets = ()
+
+
+    """
+    Turns a batch of CveRecords into one digest message.
+    """
+    def format(self, records) -> str:
+        lines = [f'CVEOrbit: {len(records)} new CVE(s)']
+        for record in records:
+            lines.append(f'- {record.cve_id} [{record.severity} {record.base_score}] {record.description[:200]}')
+
+        message = '\n'.join(lines)
+        if len(message) > self.max_length:
+            message = message[:self.max_length - 20] + '\n... (truncated)'
+        return message
+
+
+    """
+    An error message without the secrets of the channel. The requests errors quote the whole URL, and the URL of a webhook
+    or of the Telegram API holds the token.
+    """
+    def redact(self, message) -> str:
+        for secret in self.secrets:
+            if secret:
+                message = message.replace(secret, '***')
+        return message
+
+
+    @abc.abstractmethod
+    def send(self, records) -> None:
+        pass
+
+
+class WebhookChannel(Channel):
+
+    def __init__(self):
+        self.session = requests.Session()
+
+
+    def post(self, url, payload) -> None:
+        response = self.session.post(url, json=payload, timeout=(10, 30))
+        response.raise_for_status()
+
+
+class DiscordChannel(WebhookChannel):
+
+    name = 'discord'
+    max_length = 2000
+
+    def __init__(self, webhook):
+        super().__init__()
+        self.webhook = webhook
+        self.secrets = (webhook,)
+
+    def send(self, records) -> None:
+        self.post(self.webhook, {'content': self.format(records)})
+
+
+class SlackChannel(WebhookChannel):
+
+    name = 'slack'
+
+    def __init__(self, webhook):
+        super().__init__()
+        self.webhook = webhook
+        self.secrets = (webhook,)
+
+    def send(self, records) -> None:
+        self.post(self.webhook, {'text': self.format(records)})
+
+
+class TeamsChannel(WebhookChannel):
+
+    name = 'teams'
+
+    def __init__(self, webhook):
+        super().__init__()
+        self.webhook = webhook
+        self.secrets = (webhook,)
+
+    def send(self, records) -> None:
+        self.post(self.webhook, {'text': self.format(records).replace('\n', '\n\n')}) # Teams needs blank lines to break lines
+
+
+class TelegramChannel(WebhookChannel):
+
+    name = 'telegram'
+    api_url = 'https://api.telegram.org'
+
+    def __init__(self, token, chat_id):
+        super().__init__()
+        self.token = token
+        self.chat_id = chat_id
+        self.secrets = (token,)
+
+    def send(self, records) -> None:
+        self.post(f'{self.api_url}/bot{self.token}/sendMessage', {'chat_id': self.chat_id, 'text': self.format(records)})
+
+
+class EmailChannel(Channel):
+
+    name = 'email'
+    max_length = 100000
+
+    def __init__(self, to, server='localhost:25', sender='cveorbit@localhost', user=None, password=None, starttls=False):
+        self.to = to
+        host, _, port = server.partition(':')
+        self.host = host
+        self.port = int(port) if port else 25
+        self.sender = sender
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.secrets = (password,)
+
+    def send(self, records) -> None:
+        message = EmailMessage()
+        message['Subject'] = f'CVEOrbit: {len(records)} new CVE(s)'
+        message['From'] = self.sender
+        message['To'] = self.to
+        message.set_content(self.format(records))
+
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password or '')
+            smtp.send_message(message)
+
+
+class AlertDispatcher:
+
+    def __init__(self, channels, window=60.0, max_queue=1000, retries=3, DEBUG=False):
+        # Every channel gets its own bounded queue and worker thread, so a slow webhook only slows down its own alerts.
+        # "window" is how long a worker collects new CVEs before sending them as one digest message.
+        self.channels = channels
+        self.window = window
+        self.retries = retries
+        self.debug = DEBUG
+        self.colors = Colors()
+        self.queues = {channel.name: queue.Queue(maxsize=max_queue) for channel in channels}
+        self.dropped = 0
+        self.stopping = threading.Event()
+        self.workers = []
+
+        for channel in channels:
+            worker = threading.Thread(target=self.run, args=(channel,), name=f'alerts-{channel.name}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+
+    """
+    Hands a new CVE to every channel. Never blocks: if a channel is so far behind that its queue is full, the CVE is dropped
+    for that channel instead of delaying the next poll cycle.
+    """
+    def submit(self, record) -> None:
+        for name, channel_queue in self.queues.items():
+            try:
+                channel_queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+                if self.debug:
+                    print(self.colors.red(f'[ERR] The {name} alert queue is full, dropping {record.cve_id}'))
+
+
+    """
+    Worker loop of one channel: wait for a CVE, collect everything else arriving within the window, send it as one digest.
+    """
+    def run(self, channel) -> None:
+        channel_queue = self.queues[channel.name]
+
+        while not (self.stopping.is_set() and channel_queue.empty()):
+            try:
+                batch = [channel_queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.window
+            while not self.stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(channel_queue.get(timeout=min(remaining, 0.5)))
+                except queue.Empty:
+                    continue
+
+            # Whatever is still queued when stopping goes into this last digest
+            while True:
+                try:
+                    batch.append(channel_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self.deliver(channel, batch)
+
+
+    """
+    Sends a digest with a few retries (exponential backoff with jitter).
+    """
+    def deliver(self, channel, batch) -> bool:
+        for attempt in range(self.retries + 1):
+            try:
+                channel.send(batch)
+                if self.debug:
+                    print(self.colors.light_yellow(f'[DBG] Sent {len(batch)} CVE(s) to {channel.name}'))
+                return True
+
+            except Exception as e:
+                if attempt == self.retries:
+                    print(self.colors.red(f'[ERR] Could not send the {channel.name} alert: {channel.redact(str(e))}'))
+                    return False
+
+                delay = random.uniform(0, 2 ** attempt)
+                if self.debug:
+                    print(self.colors.light_yellow(f'[DBG] {channel.name} alert failed ({channel.redact(str(e))}), retrying in {delay:.2f} seconds'))
+                time.sleep(delay)
+
+
+    """
+    Flushes the pending digests and stops the workers.
+    """
+    def close(self, timeout=10.0) -> None:
+        self.stopping.set()
+        for worker in self.workers:
+            worker.join(timeout)
+
+
+"""
+Builds the channels from the --alert-* arguments of the orbit mode.
+"""
+def channels_from_args(args) -> list:
+    channels = []
+
+    if args.alert_discord:
+        channels.append(DiscordChannel(args.alert_discord))
+    if args.alert_slack:
+        channels.append(SlackChannel(args.alert_slack))
+    if args.alert_teams:
+        channels.append(TeamsChannel(args.alert_teams))
+    if args.alert_telegram:
+        if not args.alert_telegram_chat:
+            raise ValueError('--alert-telegram needs the chat to send to (--alert-telegram-chat)')
+        channels.append(TelegramChannel(args.alert_telegram, args.alert_telegram_chat))
+    if args.alert_email:
+        channels.append(EmailChannel(args.alert_email, args.smtp_server, args.smtp_from, args.smtp_user, args.smtp_password, args.smtp_starttls))
+
+    return channels
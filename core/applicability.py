@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import csv
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass
+from functools import lru_cache
+
+from core.watchlist import CPE_COLUMNS, VENDOR_COLUMNS, PRODUCT_COLUMNS, component_cpe, sbom_components
+
+
+# CSV columns of the inventories, next to the CPE/vendor/product ones of the watchlists
+ASSET_COLUMNS = ('asset', 'host', 'hostname', 'device', 'system', 'server', 'machine')
+VERSION_COLUMNS = ('version', 'product version', 'product_version', 'installed version', 'versioninfo')
+
+# Words that make a version older than the release they are attached to ("2.0.0-rc1" < "2.0.0"). Any other letters come
+# after it, like the OpenSSL letter releases ("1.1.1k" > "1.1.1") or "p1", "sp2", "update3".
+PRE_RELEASE = ('alpha', 'beta', 'rc', 'pre', 'preview', 'dev', 'snapshot', 'milestone', 'cr', 'ea')
+
+RANGE_OPERATORS = (('versionStartIncluding', '>='), ('versionStartExcluding', '>'), ('versionEndIncluding', '<='), ('versionEndExcluding', '<'))
+
+VERSION_TOKEN = re.compile(r'\d+|[a-z]+')
+
+# A version is a tuple of (kind, value) tokens ending with END: pre-release words < END < other words < numbers.
+# LOWEST and HIGHEST are below and above every version, they are the open ends of the ranges.
+END = (1,)
+LOWEST = ()
+HIGHEST = ((9,),)
+
+
+"""
+Turns a version into a tuple that compares the way versions do: "1.10" > "1.9", "1.2" == "1.2.0", "2.0-rc1" < "2.0" <
+"2.0.1". Returns None for an empty version or the "*"/"-" of a CPE. The same few thousand versions come back in every
+CPE range of the corpus, so they are only parsed once.
+"""
+@lru_cache(maxsize=65536)
+def version_key(version):
+    version = (version or '').strip().lower()
+    if version in ('', '*', '-'):
+        return None
+
+    tokens = []
+    for token in VERSION_TOKEN.findall(version):
+        if token.isdigit():
+            tokens.append((3, int(token)))
+            continue
+        # The zeros right before a word don't count, "1.0.0-beta" is "1-beta"
+        while tokens and tokens[-1] == (3, 0):
+            tokens.pop()
+        tokens.append((0, token) if token in PRE_RELEASE else (2, token))
+
+    while tokens and tokens[-1] == (3, 0):
+        tokens.pop()
+    tokens.append(END)
+    return tuple(tokens)
+
+
+def clean(name) -> str:
+    return '_'.join(name.strip().lower().split())
+
+
+"""
+The vendor, product and version of a CPE 2.3 ("cpe:2.3:a:apache:tomcat:9.0.1:...") or 2.2 ("cpe:/a:apache:tomcat:9.0.1") name.
+"""
+def cpe_parts(cpe) -> tuple:
+    if cpe.startswith('cpe:2.3:'):
+        parts = cpe.split(':')[3:6]
+    elif cpe.startswith('cpe:/'):
+        parts = cpe[5:].split(':')[1:4]
+    else:
+        return '', '', ''
+
+    parts = [part.replace('\\', '').lower() for part in parts] + [''] * (3 - len(parts))
+    return parts[0], parts[1], '' if parts[2] in ('*', '-') else parts[2]
+
+
+@dataclass(slots=True)
+class InventoryItem:
+    asset: str
+    vendor: str # Empty if the inventory doesn't say, the product is then matched under any vendor
+    product: str
+    version: str
+
+
+@dataclass(slots=True)
+class Match:
+    cve_id: str
+    asset: str
+    product: str # "vendor:product" of the CPE criteria
+    version: str
+    constraint: str # The version range of the criteria, e.g. ">= 9.0.0, < 9.0.50"
+
+    def __str__(self) -> str:
+        return f'{self.cve_id} affects asset {self.asset} at version {self.version or "(unknown)"}'
+
+    def to_dict(self) -> dict:
+        return {'Asset': self.asset, 'Product': self.product, 'Version': self.version, 'Constraint': self.constraint}
+
+
+class CpeIndex:
+
+    def __init__(self, inventory=None):
+        # With an inventory only the CPE matches of its products are indexed, the others can't match anything of it anyway
+        # (an AND node missing one of them fails the same way) and parsing their versions is most of the work
+        self.inventory = inventory
+        # Every "vendor:product" maps to its version intervals (low, low included, high, high included, reference, cpeMatch).
+        # The reference is (cve, configuration, node, match, vulnerable), where cve is the position in self.cves.
+        self.intervals = {}
+        self.cves = []
+        # Per key, the intervals sorted by their low end and the highest high end up to every position, rebuilt lazily
+        self.sorted = {}
+
+
+    """
+    Adds the "configurations" of one NVD vulnerability. Every configuration keeps its structure (AND/OR of nodes, which are
+    AND/OR of CPE matches, all of them maybe negated), the intervals only point into it.
+    """
+    def add(self, vulnerability) -> None:
+        cve = vulnerability['cve']
+        position = len(self.cves)
+        configurations = []
+
+        for c, configuration in enumerate(cve.get('configurations', [])):
+            nodes = []
+            for n, node in enumerate(configuration.get('nodes', [])):
+                matches = node.get('cpeMatch', [])
+                products = set()
+                # From every match of the node, also the ones the inventory filter skips: a vulnerable node for a product
+                # the asset doesn't have must fail, not pass as a platform we know nothing about
+                vulnerable_node = any(cpe_match.get('vulnerable', True) for cpe_match in matches)
+
+                for m, cpe_match in enumerate(matches):
+                    criteria = cpe_match.get('criteria', '')
+                    if self.inventory is not None and not self.inventory.knows(criteria):
+                        continue
+                    vendor, product, version = cpe_parts(criteria)
+                    if not product:
+                        continue
+
+                    key = f'{vendor}:{product}'
+                    vulnerable = cpe_match.get('vulnerable', True)
+                    products.update((key, f':{product}'))
+                    self.intervals.setdefault(key, []).append((*self.bounds(version, cpe_match), (position, c, n, m, vulnerable), cpe_match))
+                    self.sorted.pop(key, None)
+
+                nodes.append((node.get('operator', 'OR'), node.get('negate', False), len(matches), products, vulnerable_node))
+            configurations.append((configuration.get('operator', 'OR'), nodes))
+
+        self.cves.append((cve['id'], configurations))
+
+
+    def add_all(self, vulnerabilities) -> None:
+        for vulnerability in vulnerabilities:
+            self.add(vulnerability)
+
+
+    """
+    The interval of a CPE match: the exact version of the criteria, or the versionStart*/versionEnd* range if the
+    criteria has "*" (or "-") as its version. No version and no range means every version.
+    """
+    @staticmethod
+    def bounds(version, cpe_match) -> tuple:
+        if version:
+            key = version_key(version)
+            return key, True, key, True
+
+        low, low_included = LOWEST, True
+        if cpe_match.get('versionStartIncluding'):
+            low = version_key(cpe_match['versionStartIncluding']) or LOWEST
+        elif cpe_match.get('versionStartExcluding'):
+            low, low_included = version_key(cpe_match['versionStartExcluding']) or LOWEST, False
+
+        high, high_included = HIGHEST, True
+        if cpe_match.get('versionEndIncluding'):
+            high = version_key(cpe_match['versionEndIncluding']) or HIGHEST
+        elif cpe_match.get('versionEndExcluding'):
+            high, high_included = version_key(cpe_match['versionEndExcluding']) or HIGHEST, False
+
+        return low, low_included, high, high_included
+
+
+    def build(self, key) -> tuple:
+        intervals = sorted(self.intervals[key], key=lambda interval: interval[0])
+        lows = [interval[0] for interval in intervals]
+        highest = []
+        for interval in intervals:
+            highest.append(max(interval[2], highest[-1]) if highest else interval[2])
+        self.sorted[key] = (intervals, lows, highest)
+        return self.sorted[key]
+
+
+    """
+    Every interval of "key" containing "version" (a version_key() tuple). The intervals are sorted by their low end, so
+    only the ones before the bisect position can contain it, and walking them backwards stops as soon as the highest high
+    end up to there is below the version. A version we don't know (None) is only in the "every version" intervals.
+    """
+    def stab(self, key, version) -> list:
+        intervals, lows, highest = self.sorted.get(key) or self.build(key)
+
+        if version is None:
+            return [interval for interval in intervals if interval[0] == LOWEST and interval[2] == HIGHEST]
+
+        found = []
+        i = bisect.bisect_right(lows, version) - 1
+        while i >= 0 and highest[i] >= version:
+            low, low_included, high, high_included = intervals[i][:4]
+            if (low < version or low_included) and (version < high or (version == high and high_included)):
+                found.append(intervals[i])
+            i -= 1
+        return found
+
+
+    """
+    Checks every item of the inventory against the indexed CVEs. Only the keys both sides know are looked at, every
+    item is one stab into the intervals of its key. A vulnerable match only counts if its configuration holds for the
+    asset: the other CPEs of an AND node, the platform of a "running on/with" configuration, ...
+    """
+    def evaluate(self, inventory) -> list:
+        matched = {} # (cve, asset) -> {(configuration, node): {match, ...}}
+        vulnerable = {} # (cve, asset) -> [(configuration, node, item, interval), ...]
+
+        for key in self.intervals:
+            for version, item in inventory.lookup(key):
+                for interval in self.stab(key, version):
+                    position, c, n, m, is_vulnerable = interval[4]
+                    matched.setdefault((position, item.asset), {}).setdefault((c, n), set()).add(m)
+                    if is_vulnerable:
+                        vulnerable.setdefault((position, item.asset), []).append((c, n, item, interval))
+
+        results = {}
+        for (position, asset), hits in vulnerable.items():
+            cve_id, configurations = self.cves[position]
+            state = matched[(position, asset)]
+            asset_products = inventory.assets.get(asset, set())
+
+            def holds(c, n) -> bool:
+                operator, negate, count, products, vulnerable_node = configurations[c][1][n]
+                # A platform the inventory says nothing about can't rule the CVE out, we only drop it if the asset has
+                # that product at a version outside the criteria
+                if not vulnerable_node and not products & asset_products:
+                    return True
+                found = state.get((c, n), set())
+                satisfied = len(found) == count if operator == 'AND' else bool(found)
+                return satisfied != negate
+
+            for c, n, item, interval in hits:
+                operator, nodes = configurations[c]
+                if nodes[n][1] or not holds(c, n):
+                    continue
+                if operator == 'AND' and not all(holds(c, other) for other in range(len(nodes))):
+                    continue
+
+                product = f'{item.vendor}:{item.product}' if item.vendor else item.product
+                results.setdefault((cve_id, asset, product, item.version), Match(cve_id, asset, product, item.version, self.describe(interval)))
+
+        return list(results.values())
+
+
+    """
+    The versions a CPE match covers, as NVD wrote them: "= 9.0.1", ">= 9.0.0, < 9.0.50" or "all versions".
+    """
+    @staticmethod
+    def describe(interval) -> str:
+        cpe_match = interval[5]
+        version = cpe_parts(cpe_match.get('criteria', ''))[2]
+        if version:
+            return f'= {version}'
+
+        parts = []
+        for key, operator in RANGE_OPERATORS:
+            if cpe_match.get(key):
+                parts.append(f'{operator} {cpe_match[key]}')
+        return ', '.join(parts) or 'all versions'
+
+
+"""
+The matches grouped by CVE ID, in the order they were found.
+"""
+def by_cve(matches) -> dict:
+    grouped = {}
+    for match in matches:
+        grouped.setdefault(match.cve_id, []).append(match)
+    return grouped
+
+
+class Inventory:
+
+    def __init__(self):
+        # "vendor:product" -> (version_key, item) sorted by version, and the products whose vendor we don't know
+        self.versions = {}
+        self.anonymous = {}
+        # Every asset and the "vendor:product" / ":product" keys it has, for the platforms of the configurations
+        self.assets = {}
+        self.items = 0
+
+
+    def add(self, asset, vendor='', product='', version='', cpe='') -> bool:
+        if cpe:
+            cpe_vendor, cpe_product, cpe_version = cpe_parts(cpe)
+            vendor, product, version = cpe_vendor or vendor, cpe_product or product, version or cpe_version
+
+        vendor, product = clean(vendor), clean(product)
+        # "Microsoft" + "Microsoft Exchange Server" is microsoft:exchange_server in the CPE dictionary
+        if vendor and product.startswith(vendor + '_'):
+            product = product[len(vendor) + 1:]
+        if not product:
+            return False
+
+        item = InventoryItem(asset, vendor, product, version.strip())
+        entry = (version_key(version), item)
+        if vendor:
+            self.versions.setdefault(f'{vendor}:{product}', []).append(entry)
+            self.assets.setdefault(asset, set()).update((f'{vendor}:{product}', f':{product}'))
+        else:
+            self.anonymous.setdefault(product, []).append(entry)
+            self.assets.setdefault(asset, set()).add(f':{product}')
+
+        self.items += 1
+        return True
+
+
+    """
+    Whether the inventory has the product of a CPE 2.3 criteria, without parsing the rest of it.
+    """
+    def knows(self, criteria) -> bool:
+        parts = criteria.split(':', 6)
+        if len(parts) < 6:
+            return False
+        vendor, product = parts[3].replace('\\', '').lower(), parts[4].replace('\\', '').lower()
+        return f'{vendor}:{product}' in self.versions or product in self.anonymous
+
+
+    """
+    The (version_key, item) pairs of "vendor:product", including the ones with that product and no vendor.
+    """
+    def lookup(self, key) -> list:
+        return self.versions.get(key, []) + self.anonymous.get(key.split(':', 1)[1], [])
+
+
+    """
+    The inventory items the given NVD vulnerabilities affect, in one pass over the ones sharing a product with them.
+    """
+    def match(self, vulnerabilities) -> list:
+        index = CpeIndex(self)
+        index.add_all(vulnerabilities)
+        return index.evaluate(self)
+
+
+    """
+    Reads an inventory file. The format comes from the extension: .csv/.tsv (asset/host, vendor, product, version and
+    cpe columns), .json (CycloneDX or SPDX), .xml (CycloneDX) and .spdx (SPDX tag-value). The SBOMs describe a single
+    asset, it's named after the file.
+    """
+    def add_file(self, path) -> int:
+        extension = os.path.splitext(path)[1].lower()
+        asset = os.path.splitext(os.path.basename(path))[0]
+        before = self.items
+
+        if extension in ('.csv', '.tsv'):
+            with open(path, encoding='utf-8-sig', newline='') as f:
+                for row in csv_items(f, asset):
+                    self.add(*row)
+        elif extension == '.json':
+            for component in sbom_components(path):
+                self.add(asset, component.get('publisher', ''), component.get('name', ''), component.get('version') or component.get('versionInfo', ''), component_cpe(component) or '')
+        elif extension == '.xml':
+            for row in xml_items(path, asset):
+                self.add(*row)
+        elif extension == '.spdx':
+            with open(path, encoding='utf-8') as f:
+                for row in spdx_items(f, asset):
+                    self.add(*row)
+        else:
+            raise ValueError(f'Unknown inventory format "{extension}", use .csv, .tsv, .json, .xml or .spdx')
+
+        return self.items - before
+
+
+    @classmethod
+    def from_files(cls, paths):
+        inventory = cls()
+        for path in paths:
+            inventory.add_file(path)
+        return inventory
+
+
+    def __len__(self) -> int:
+        return self.items
+
+
+"""
+(asset, vendor, product, version, cpe) of every row of a CSV inventory. Rows without an asset column belong to "asset".
+"""
+def csv_items(f, asset):
+    sample = f.read(64 * 1024)
+    f.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.reader(f, dialect)
+    header = [column.strip().lower() for column in next(reader, [])]
+
+    def find(names):
+        return next((header.index(name) for name in names if name in header), None)
+
+    columns = [find(ASSET_COLUMNS), find(VENDOR_COLUMNS), find(PRODUCT_COLUMNS), find(VERSION_COLUMNS), find(CPE_COLUMNS)]
+    if columns[2] is None and columns[4] is None:
+        raise ValueError('An inventory needs a product (or name) or a cpe column')
+
+    for row in reader:
+        cells = [row[index].strip() if index is not None and index < len(row) else '' for index in columns]
+        yield (cells[0] or asset, *cells[1:])
+
+
+def xml_items(path, asset):
+    def child(element, name):
+        for item in element:
+            if item.tag.rsplit('}', 1)[-1] == name:
+                return (item.text or '').strip()
+        return ''
+
+    for _, element in ElementTree.iterparse(path, events=('end',)):
+        if element.tag.rsplit('}', 1)[-1] != 'component':
+            continue
+        yield asset, child(element, 'publisher'), child(element, 'name'), child(element, 'version'), child(element, 'cpe')
+        element.clear()
+
+
+def spdx_items(f, asset):
+    package = None
+    for line in f:
+        tag, _, value = line.partition(':')
+        value = value.strip()
+
+        if tag == 'PackageName':
+            if package is not None:
+                yield package
+            package = [asset, '', value, '', '']
+        elif package is None:
+            continue
+        elif tag == 'PackageVersion':
+            package[3] = value
+        elif tag == 'ExternalRef' and value.split()[1:2] in (['cpe23Type'], ['cpe22Type']):
+            package[4] = value.split()[2]
+
+    if package is not None:
+        yield package
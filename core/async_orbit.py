@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from core.orbit import Orbit
+
+
+class AsyncOrbit(Orbit):
+
+    def __init__(self, transport=None, concurrency=8, strategy='keyword', state=None, dedupe_window=30 * 24 * 3600):
+        super().__init__(transport, strategy, state, dedupe_window)
+        self.concurrency = max(1, int(concurrency))
+
+        # One event loop for the whole run instead of a new one every cycle. The blocking requests run in a thread pool
+        # sized to the concurrency, so they go through the same pooled session, rate limiter and retry policy as the plain engine.
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.loop.set_default_executor(self.executor)
+
+
+    """
+    Schedules every keyword query of the cycle at once. The semaphore keeps at most "concurrency" requests in flight and the
+    rate limiter keeps the whole thing inside the NVD quota, so a cycle takes about one round-trip instead of one per keyword.
+    The results come back in the same order as the URLs, so the dedupe and the "pubStartDate" watermark work exactly as before.
+    """
+    async def fetch_all_async(self, l_params, DEBUG=False, labels=None) -> list:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_one(param, label):
+            async with semaphore:
+                return await self.loop.run_in_executor(None, self.fetch, param, DEBUG, label)
+
+        return await asyncio.gather(*(fetch_one(param, label) for param, label in zip(l_params, labels or [None] * len(l_params))))
+
+
+    def fetch_all(self, l_params, DEBUG=False, labels=None) -> list:
+        return self.loop.run_until_complete(self.fetch_all_async(l_params, DEBUG, labels))
+
+
+    """
+    Cancels what a Ctrl+C left of the cycle, waits for the requests that are still running (they are bounded by the
+    request timeouts) and closes the thread pool and the event loop. Closing twice is fine.
+    """
+    def close(self) -> None:
+        if self.loop.is_closed():
+            return
+
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.loop.close()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+class ResponseCache:
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path='cveorbit_cache', ttl=600, max_bytes=256 * 1024 * 1024):
+        # The bodies are stored gzip compressed under the SHA-256 of their content, so two queries giving the same page
+        # (all the empty result pages, for example) share one file. The SQLite index maps the normalized URL to its body.
+        # "ttl" is how many seconds a response is used without asking NVD, "max_bytes" the size the bodies are kept under.
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        os.makedirs(path, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(path, 'index.db'), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries(accessed_at);
+            CREATE TABLE IF NOT EXISTS bodies (digest TEXT PRIMARY KEY, size INTEGER NOT NULL);
+        ''')
+        self.conn.commit()
+
+
+    """
+    Two URLs asking for the same thing give the same key: the parameters are sorted and the host is lower case.
+    """
+    @staticmethod
+    def normalize(url) -> str:
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))
+
+
+    def key(self, url) -> str:
+        return hashlib.sha256(self.normalize(url).encode('utf-8')).hexdigest()
+
+
+    def body_path(self, digest) -> str:
+        return os.path.join(self.path, digest[:2], f'{digest}.gz')
+
+
+    def count(self, counter) -> None:
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+    """
+    Returns the index row of a URL (digest, etag, last_modified, stored_at) or None.
+    """
+    def lookup(self, url):
+        with self.lock:
+            return self.conn.execute('SELECT digest, etag, last_modified, stored_at FROM entries WHERE key = ?', (self.key(url),)).fetchone()
+
+
+    def is_fresh(self, entry) -> bool:
+        return time.time() - entry[3] < self.ttl
+
+
+    """
+    The headers of a conditional request, empty if the server never gave us a validator for this response.
+    """
+    def conditional_headers(self, entry) -> dict:
+        headers = {}
+        if entry[1]:
+            headers['If-None-Match'] = entry[1]
+        if entry[2]:
+            headers['If-Modified-Since'] = entry[2]
+        return headers
+
+
+    """
+    Opens a cached body and yields it in chunks, like the body of a response. The file is opened right away, so a body
+    evicted in the meantime raises here (OSError) and not in the middle of the parsing.
+    """
+    def open_body(self, url, entry):
+        f = gzip.open(self.body_path(entry[0]), 'rb')
+
+        with self.lock:
+            self.conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), self.key(url)))
+            self.conn.commit()
+
+        def chunks():
+            with f:
+                while True:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return chunks()
+
+
+    """
+    The server answered 304 Not Modified, the cached body is good for another TTL.
+    """
+    def refresh(self, url) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.execute('UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, self.key(url)))
+            self.conn.commit()
+
+
+    """
+    Passes the chunks of a response through while compressing them into a temporary file. Only once the body was read to
+    the end it is moved to its content address and indexed, a response abandoned halfway is never cached.
+    """
+    def store_chunks(self, url, chunks, headers):
+        digest = hashlib.sha256()
+        temporary = os.path.join(self.path, f'.{threading.get_ident()}.{time.time_ns()}.tmp')
+
+        try:
+            with gzip.open(temporary, 'wb', compresslevel=6) as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    yield chunk
+
+            target = self.body_path(digest.hexdigest())
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(temporary, target)
+            self.index(url, digest.hexdigest(), os.path.getsize(target), headers)
+
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+
+    def index(self, url, digest, size, headers) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO bodies (digest, size) VALUES (?, ?)', (digest, size))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO entries (key, url, digest, etag, last_modified, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.key(url), self.normalize(url), digest, headers.get('ETag'), headers.get('Last-Modified'), now, now)
+            )
+            self.conn.commit()
+            self.evict()
+
+
+    """
+    Drops the least recently used entries until the bodies fit into "max_bytes", then deletes the bodies nothing points to.
+    Called with the lock held.
+    """
+    def evict(self) -> int:
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM bodies').fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+
+        evicted = 0
+        for key, digest in self.conn.execute('SELECT key, digest FROM entries ORDER BY accessed_at').fetchall():
+            self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            evicted += 1
+
+            if self.conn.execute('SELECT 1 FROM entries WHERE digest = ? LIMIT 1', (digest,)).fetchone() is None:
+                size = self.conn.execute('SELECT size FROM bodies WHERE digest = ?', (digest,)).fetchone()
+                self.conn.execute('DELETE FROM bodies WHERE digest = ?', (digest,))
+                try:
+                    os.remove(self.body_path(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size[0] if size else 0
+
+            if total <= self.max_bytes:
+                break
+
+        self.conn.commit()
+        return evicted
+
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses}
+
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from datetime import datetime
+
+from core.jsonl import read_jsonl
+from core.record import CveRecord
+
+
+# The formats we can export to, besides the plain JSON files
+FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow'
+}
+
+
+"""
+pyarrow is only needed for the columnar exports, so it is imported when we actually use it.
+"""
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise RuntimeError('The parquet and arrow formats need pyarrow. Install it with "pip install pyarrow"')
+    return pyarrow
+
+
+def parse_timestamp(value):
+    if not value or value == 'N/A':
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def parse_score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None # 'N/A'
+
+
+"""
+Builds an Arrow table with typed columns: the score is a float, the dates are timestamps and the severity is a dictionary
+(categorical) column, so filtering a year of results does not need to parse any string.
+"""
+def build_table(records):
+    pa = require_pyarrow()
+
+    columns = {
+        'cve_id': [],
+        'cvss_version': [],
+        'severity': [],
+        'base_score': [],
+        'published': [],
+        'last_modified': [],
+        'description': [],
+        'products': []
+    }
+
+    for record in records:
+        if isinstance(record, dict):
+            record = CveRecord.from_dict(record)
+
+        columns['cve_id'].append(record.cve_id)
+        columns['cvss_version'].append(None if record.version == 'N/A' else str(record.version))
+        columns['severity'].append(None if record.severity == 'N/A' else record.severity)
+        columns['base_score'].append(parse_score(record.base_score))
+        columns['published'].append(parse_timestamp(record.published))
+        columns['last_modified'].append(parse_timestamp(record.last_modified))
+        columns['description'].append(record.description)
+        columns['products'].append(list(record.products))
+
+    schema = pa.schema([
+        ('cve_id', pa.string()),
+        ('cvss_version', pa.string()),
+        ('severity', pa.dictionary(pa.int8(), pa.string())),
+        ('base_score', pa.float64()),
+        ('published', pa.timestamp('ms')),
+        ('last_modified', pa.timestamp('ms')),
+        ('description', pa.string()),
+        ('products', pa.list_(pa.string()))
+    ])
+
+    return pa.table({
+        'cve_id': pa.array(columns['cve_id'], pa.string()),
+        'cvss_version': pa.array(columns['cvss_version'], pa.string()),
+        'severity': pa.array(columns['severity'], pa.string()).dictionary_encode().cast(schema.field('severity').type),
+        'base_score': pa.array(columns['base_score'], pa.float64()),
+        'published': pa.array(columns['published'], pa.timestamp('ms')),
+        'last_modified': pa.array(columns['last_modified'], pa.timestamp('ms')),
+        'description': pa.array(columns['description'], pa.string()),
+        'products': pa.array(columns['products'], pa.list_(pa.string()))
+    }, schema=schema)
+
+
+"""
+Writes records (CveRecord objects or the dicts of the JSON exports) to a Parquet or Arrow IPC file.
+"""
+def write_records(records, path, fmt='parquet') -> int:
+    pa = require_pyarrow()
+    table = build_table(records)
+
+    if fmt == 'parquet':
+        pa.parquet.write_table(table, path, compression='zstd')
+    elif fmt == 'arrow':
+        with pa.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f'Unknown export format: {fmt}')
+
+    return table.num_rows
+
+
+"""
+Reads the result records of any of the JSON outputs we ever wrote:
+- the JSON Lines orbit output (with its rotated segments)
+- the old cveorbit_monitoring.json, which is several pretty printed JSON arrays appended to each other
+- the search exports (cveorbit_results_*.json), which are one JSON array
+"""
+def read_json_output(path):
+    if path.endswith('.jsonl') or os.path.exists(f'{path}.index.json'):
+        yield from read_jsonl(path)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+
+    position = 0
+    while position < len(content):
+        # Skipping the newlines between two appended arrays
+        while position < len(content) and content[position].isspace():
+            position += 1
+        if position >= len(content):
+            break
+
+        try:
+            chunk, position = decoder.raw_decode(content, position)
+        except json.JSONDecodeError:
+            break # The file was cut off (the old writer truncated it at 200 MB), keeping what we have
+
+        if isinstance(chunk, list):
+            yield from chunk
+        else:
+            yield chunk
+
+
+"""
+Converts existing JSON outputs into one Parquet or Arrow file. Duplicates (the same CVE appended twice) are dropped.
+"""
+def convert(sources, target, fmt='parquet') -> int:
+    seen = set()
+    records = []
+
+    for source in sources:
+        for record in read_json_output(source):
+            if record.get('CVE ID') in seen:
+                continue
+            seen.add(record.get('CVE ID'))
+            records.append(record)
+
+    return write_records(records, target, fmt)
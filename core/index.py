@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+import json
+import re
+import sqlite3
+
+from core.record import CveRecord
+
+
+# Higher is more severe, used to rank the matches
+SEVERITY_RANK = {
+    'CRITICAL': 4,
+    'HIGH': 3,
+    'MEDIUM': 2,
+    'LOW': 1
+}
+
+# Query field prefixes and the indexed columns they search. A term without prefix searches all of them.
+FIELDS = {
+    'id': 'cve_id',
+    'description': 'description',
+    'vendor': 'vendor',
+    'product': 'product'
+}
+
+TOKEN = re.compile(r'[0-9a-z]+')
+
+
+"""
+Lower case alphanumeric words, the same way SQLite's unicode61 tokenizer splits the text ("CVE-2024-1234" gives
+"cve", "2024", "1234" and "http_server" gives "http", "server").
+"""
+def tokenize(text) -> list:
+    return TOKEN.findall(text.lower())
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+class QueryParser:
+
+    """
+    Parses the query language of the "query" mode into a small tree:
+        apache tomcat               both words (AND is implicit)
+        tomcat OR jetty             either of them
+        tomcat NOT jetty, -jetty    without jetty
+        "remote code execution"     the words next to each other
+        (tomcat OR jetty) rce       grouping
+        vendor:apache product:"http server" id:CVE-2024-1234
+        tomc*                       prefix
+    The nodes are tuples: ('term', field, words, prefix), ('and', [nodes]), ('or', [nodes]) and ('not', node).
+    """
+    lexer = re.compile(r'\s*(?:(\()|(\))|(-)(?=\S)|(?:(\w+):)?(?:"([^"]*)"|([^\s()"]+)))')
+
+    def __init__(self, query):
+        self.tokens = self.lex(query)
+        self.position = 0
+
+
+    def lex(self, query) -> list:
+        tokens = []
+        position = 0
+        query = query.strip()
+
+        while position < len(query):
+            match = self.lexer.match(query, position)
+            if match is None or match.end() == position:
+                raise QuerySyntaxError(f'Unexpected character at position {position}: {query[position:]}')
+            position = match.end()
+
+            opening, closing, minus, field, phrase, word = match.groups()
+            if opening:
+                tokens.append(('(',))
+            elif closing:
+                tokens.append((')',))
+            elif minus:
+                tokens.append(('NOT',))
+            elif phrase is None and field is None and word in ('AND', 'OR', 'NOT'):
+                tokens.append((word,))
+            else:
+                if field is not None and field.lower() not in FIELDS:
+                    # Not one of our fields ("http://..."), just text with a colon in it
+                    word = f'{field}:{word if phrase is None else phrase}'
+                    field = phrase = None
+                tokens.append(('TERM', field.lower() if field else None, phrase if phrase is not None else word, phrase is not None))
+
+        return tokens
+
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError('The query is empty')
+
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f'Unexpected "{self.peek()[0]}"')
+        return node
+
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == ('OR',):
+            self.next()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() is not None and self.peek()[0] in ('AND', 'NOT', 'TERM', '('):
+            if self.peek() == ('AND',):
+                self.next()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+
+    def parse_not(self):
+        if self.peek() == ('NOT',):
+            self.next()
+            return ('not', self.parse_not())
+        return self.parse_atom()
+
+
+    def parse_atom(self):
+        token = self.next()
+        if token is None:
+            raise QuerySyntaxError('The query ends too early')
+
+        if token == ('(',):
+            node = self.parse_or()
+            if self.next() != (')',):
+                raise QuerySyntaxError('Missing ")"')
+            return node
+
+        if token[0] != 'TERM':
+            raise QuerySyntaxError(f'Unexpected "{token[0]}"')
+
+        _, field, text, quoted = token
+        prefix = not quoted and text.endswith('*')
+        words = tokenize(text)
+        if not words:
+            raise QuerySyntaxError(f'"{text}" has nothing to search for')
+        return ('term', field, tuple(words), prefix)
+
+
+class CveIndex:
+
+    def __init__(self, path='cveorbit_index.db'):
+        # The documents (the records of the orbit outputs and the search exports) plus an inverted index over their CVE IDs,
+        # descriptions and CPE vendors/products. Same as the mirror: FTS5 if SQLite has it, LIKE queries otherwise.
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.create_tables()
+
+
+    def create_tables(self) -> None:
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS documents (
+                rowid INTEGER PRIMARY KEY,
+                cve_id TEXT UNIQUE NOT NULL,
+                severity_rank INTEGER NOT NULL,
+                base_score REAL,
+                published TEXT,
+                last_modified TEXT,
+                document TEXT NOT NULL
+            );
+        ''')
+
+        try:
+            self.conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5(cve_id, description, vendor, product)')
+            self.fts = True
+        except sqlite3.OperationalError:
+            # The fallback keeps the words separated by single spaces (and padded), so LIKE '% word %' matches whole words only
+            self.conn.execute('CREATE TABLE IF NOT EXISTS terms (rowid INTEGER PRIMARY KEY, cve_id TEXT, description TEXT, vendor TEXT, product TEXT)')
+            self.fts = False
+
+        self.conn.commit()
+
+
+    def columns(self, record) -> tuple:
+        vendors = ' '.join(product.split(':', 1)[0] for product in record.products)
+        products = ' '.join(product.split(':', 1)[-1] for product in record.products)
+        values = (record.cve_id, record.description, vendors, products)
+
+        if self.fts:
+            return values
+        return tuple(f' {" ".join(tokenize(value))} ' for value in values)
+
+
+    """
+    Adds (or updates) records. A CVE already in the index is only replaced by a version modified later, so indexing the
+    outputs in any order gives the same result.
+    """
+    def add(self, records) -> int:
+        added = 0
+
+        for record in records:
+            if isinstance(record, dict):
+                record = CveRecord.from_dict(record)
+
+            row = self.conn.execute('SELECT rowid, last_modified FROM documents WHERE cve_id = ?', (record.cve_id,)).fetchone()
+            if row is not None:
+                if row[1] and record.last_modified != 'N/A' and record.last_modified <= row[1]:
+                    continue
+                self.conn.execute('DELETE FROM documents WHERE rowid = ?', (row[0],))
+                self.conn.execute('DELETE FROM terms WHERE rowid = ?', (row[0],))
+
+            try:
+                base_score = float(record.base_score)
+            except (TypeError, ValueError):
+                base_score = None
+
+            cursor = self.conn.execute(
+                'INSERT INTO documents (cve_id, severity_rank, base_score, published, last_modified, document) VALUES (?, ?, ?, ?, ?, ?)',
+                (record.cve_id, SEVERITY_RANK.get(str(record.severity).upper(), 0), base_score, record.published, record.last_modified, json.dumps(record.to_dict()))
+            )
+            self.conn.execute('INSERT INTO terms (rowid, cve_id, description, vendor, product) VALUES (?, ?, ?, ?, ?)', (cursor.lastrowid, *self.columns(record)))
+            added += 1
+
+        self.conn.commit()
+        return added
+
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+
+    """
+    Compiles a query tree into a FTS5 MATCH expression. FTS5 only knows NOT between two expressions ("a NOT b"), so the
+    negated parts of an AND are moved behind the positive ones.
+    """
+    def compile_fts(self, node) -> str:
+        kind = node[0]
+
+        if kind == 'term':
+            _, field, words, prefix = node
+            expression = '"' + ' '.join(words) + '"' + (' *' if prefix else '')
+            return f'{FIELDS[field]} : {expression}' if field else expression
+
+        if kind == 'or':
+            if any(child[0] == 'not' for child in node[1]):
+                raise QuerySyntaxError('"OR NOT" is not supported, put the NOT into an AND')
+            return '(' + ' OR '.join(self.compile_fts(child) for child in node[1]) + ')'
+
+        if kind == 'and':
+            positive = [child for child in node[1] if child[0] != 'not']
+            negative = [child[1] for child in node[1] if child[0] == 'not']
+            if not positive:
+                raise QuerySyntaxError('A query needs at least one term that is not negated')
+            expression = '(' + ' AND '.join(self.compile_fts(child) for child in positive) + ')'
+            for child in negative:
+                expression += f' NOT {self.compile_fts(child)}'
+            return f'({expression})'
+
+        raise QuerySyntaxError('A query needs at least one term that is not negated')
+
+
+    """
+    Same for the LIKE fallback: a WHERE clause and its parameters.
+    """
+    def compile_like(self, node):
+        kind = node[0]
+
+        if kind == 'term':
+            _, field, words, prefix = node
+            pattern = f'% {" ".join(words)}' + ('%' if prefix else ' %')
+            columns = [FIELDS[field]] if field else list(FIELDS.values())
+            return '(' + ' OR '.join(f'terms.{column} LIKE ?' for column in columns) + ')', [pattern] * len(columns)
+
+        if kind == 'not':
+            clause, args = self.compile_like(node[1])
+            return f'(NOT {clause})', args
+
+        clauses = []
+        args = []
+        for child in node[1]:
+            clause, child_args = self.compile_like(child)
+            clauses.append(clause)
+            args.extend(child_args)
+        return '(' + f' {kind.upper()} '.join(clauses) + ')', args
+
+
+    """
+    Runs a query and returns the matching records, the most severe and most recent first.
+    """
+    def search(self, query, limit=50, min_severity=None, sort='severity') -> list:
+        tree = QueryParser(query).parse()
+
+        if self.fts:
+            where, args = 'terms MATCH ?', [self.compile_fts(tree)]
+        else:
+            where, args = self.compile_like(tree)
+
+        if min_severity:
+            where += ' AND documents.severity_rank >= ?'
+            args.append(SEVERITY_RANK[min_severity.upper()])
+
+        if sort == 'recent':
+            order = 'documents.published DESC, documents.severity_rank DESC'
+        else:
+            order = 'documents.severity_rank DESC, documents.base_score DESC, documents.published DESC'
+
+        rows = self.conn.execute(f'''
+            SELECT documents.document FROM terms JOIN documents ON documents.rowid = terms.rowid
+            WHERE {where} ORDER BY {order} LIMIT ?
+        ''', (*args, limit))
+
+        return [CveRecord.from_dict(json.loads(row[0])) for row in rows]
+
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import os
+import shutil
+import time
+
+
+class JsonlWriter:
+
+    def __init__(self, path='cveorbit_monitoring.jsonl', max_bytes=200 * 1024 * 1024, max_age=None, compress=True, fsync='cycle'):
+        # "max_bytes" and "max_age" (seconds) decide when the active file is rotated into a numbered segment.
+        # "fsync" is "always" (after every record), "cycle" (on every flush(), i.e. once per orbit cycle) or "never".
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.fsync = fsync
+        self.index_path = f'{path}.index.json'
+
+        # Time range of the records in the active file, for the segment index
+        self.first_published = None
+        self.last_published = None
+        self.opened_at = time.time()
+
+        self.file = open(self.path, 'a', encoding='utf-8', buffering=64 * 1024)
+        self.size = self.file.tell()
+        self.load_active_range()
+
+
+    """
+    If we append to an active file left over from a previous run, we need its time range back for the index.
+    """
+    def load_active_range(self) -> None:
+        if self.size == 0:
+            return
+
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    self.track(json.loads(line).get('Published'))
+                except json.JSONDecodeError:
+                    continue # A line cut in half by a crash, the next records are still fine
+
+
+    def track(self, published) -> None:
+        if not published:
+            return
+        if self.first_published is None or published < self.first_published:
+            self.first_published = published
+        if self.last_published is None or published > self.last_published:
+            self.last_published = published
+
+
+    """
+    Appends one record as a single compact line.
+    """
+    def write(self, record) -> None:
+        line = json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n'
+        self.file.write(line)
+        self.size += len(line.encode('utf-8'))
+        self.track(record.get('Published'))
+
+        if self.fsync == 'always':
+            self.sync()
+
+        if self.should_rotate():
+            self.rotate()
+
+
+    def write_many(self, records) -> None:
+        for record in records:
+            self.write(record)
+        self.flush()
+
+
+    def sync(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+
+    def flush(self) -> None:
+        if self.fsync in ('always', 'cycle'):
+            self.sync()
+        else:
+            self.file.flush()
+
+
+    def should_rotate(self) -> bool:
+        if self.max_bytes and self.size >= self.max_bytes:
+            return True
+        if self.max_age and self.size and time.time() - self.opened_at >= self.max_age:
+            return True
+        return False
+
+
+    def load_index(self) -> list:
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+    """
+    Moves the active file to the next numbered segment (gzip compressed if enabled) and records its time range in the index.
+    Nothing is ever truncated, the history just moves into segments.
+    """
+    def rotate(self) -> None:
+        self.sync()
+        self.file.close()
+
+        index = self.load_index()
+        number = index[-1]['segment'] + 1 if index else 1
+        segment = f'{self.path}.{number:05d}' + ('.gz' if self.compress else '')
+
+        if self.compress:
+            with open(self.path, 'rb') as source, gzip.open(segment, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(self.path)
+        else:
+            os.replace(self.path, segment)
+
+        index.append({
+            'segment': number,
+            'file': os.path.basename(segment),
+            'first_published': self.first_published,
+            'last_published': self.last_published,
+            'bytes': self.size
+        })
+
+        # Writing the index atomically, a reader never sees half of it
+        with open(f'{self.index_path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        os.replace(f'{self.index_path}.tmp', self.index_path)
+
+        self.file = open(self.path, 'a', encoding='utf-8', buffering=64 * 1024)
+        self.size = 0
+        self.first_published = None
+        self.last_published = None
+        self.opened_at = time.time()
+
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+"""
+Reads the records back, oldest segment first and the active file last. With "start"/"end" (ISO-8601 strings, compared to
+the "Published" field) only the segments whose time range overlaps are opened, the rest is skipped thanks to the index.
+"""
+def read_jsonl(path, start=None, end=None):
+    index_path = f'{path}.index.json'
+    directory = os.path.dirname(path)
+    files = []
+
+    if os.path.exists(index_path):
+        with open(index_path, encoding='utf-8') as f:
+            for entry in json.load(f):
+                if start and entry['last_published'] and entry['last_published'] < start:
+                    continue
+                if end and entry['first_published'] and entry['first_published'] > end:
+                    continue
+                files.append(os.path.join(directory, entry['file']))
+
+    if os.path.exists(path):
+        files.append(path)
+
+    for file in files:
+        opener = gzip.open if file.endswith('.gz') else open
+        with opener(file, 'rt', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                published = record.get('Published', '')
+                if start and published < start:
+                    continue
+                if end and published > end:
+                    continue
+                yield record
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from collections import deque
+
+
+class KeywordMatcher:
+
+    def __init__(self, keywords):
+        # A keyword like "apache tomcat" matches if every one of its words shows up, same as the NVD "keywordSearch"
+        self.keywords = list(dict.fromkeys(keywords))
+        self.keyword_words = {keyword: set(keyword.lower().split()) for keyword in self.keywords}
+
+        words = set()
+        for keyword_words in self.keyword_words.values():
+            words.update(keyword_words)
+
+        self.build(sorted(words))
+
+
+    """
+    Builds the Aho-Corasick automaton over all the words. After that a text is scanned only once, no matter how many
+    keywords we watch.
+    """
+    def build(self, words) -> None:
+        self.goto = [{}]     # Transitions of every state
+        self.fail = [0]      # Failure links
+        self.output = [[]]   # Words ending in every state
+
+        for word in words:
+            state = 0
+            for char in word:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(word)
+
+        # Breadth first walk to compute the failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+
+    """
+    Returns the set of words found in the text. Only whole words count, so "linux" does not match "linuxfoo".
+    """
+    def find_words(self, text) -> set:
+        text = text.lower()
+        found = set()
+        state = 0
+
+        for position, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+
+            for word in self.output[state]:
+                start = position - len(word) + 1
+                end = position + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    found.add(word)
+
+        return found
+
+
+    """
+    Returns the keywords matching a NVD vulnerability entry. The description and the CPE criteria of the "configurations"
+    block are both searched ("cpe:2.3:a:apache:tomcat:..." is split on the colons, so "apache tomcat" matches it).
+    """
+    def match(self, vulnerability) -> list:
+        cve = vulnerability.get('cve', vulnerability)
+        texts = [description.get('value', '') for description in cve.get('descriptions', [])]
+
+        for configuration in cve.get('configurations', []):
+            for node in configuration.get('nodes', []):
+                for cpe_match in node.get('cpeMatch', []):
+                    texts.append(cpe_match.get('criteria', '').replace(':', ' ').replace('_', ' '))
+
+        found = self.find_words('\n'.join(texts))
+        return [keyword for keyword in self.keywords if self.keyword_words[keyword] and self.keyword_words[keyword] <= found]
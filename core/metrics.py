@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# (name, type, help) of everything the orbit reports. Declared up front, so the endpoint lists them before the first cycle.
+METRICS = [
+    ('cveorbit_requests_total', 'counter', 'HTTP requests sent to NVD by status code ("error" if no response came back)'),
+    ('cveorbit_request_seconds', 'histogram', 'Time to fetch one query including the retries, per keyword ("*" is the delta window)'),
+    ('cveorbit_parse_seconds', 'histogram', 'Time spent decoding responses and extracting the records, per batch'),
+    ('cveorbit_render_seconds', 'histogram', 'Time spent rendering the records, per batch'),
+    ('cveorbit_records_total', 'counter', 'Records handled by the orbit: "new" ones and the "duplicate" ones already seen'),
+    ('cveorbit_events_total', 'counter', 'Rescored and updated CVEs found by the modification poll'),
+    ('cveorbit_poll_delay_seconds', 'histogram', 'How late a keyword was polled after its deadline (used up budget, slow cycles)'),
+    ('cveorbit_cycles_total', 'counter', 'Completed polling cycles'),
+    ('cveorbit_cycle_seconds', 'histogram', 'Duration of a polling cycle'),
+    ('cveorbit_seconds_total', 'counter', 'Time spent "working" (polling) and "sleeping" (waiting for the next cycle)'),
+    ('cveorbit_watermark_lag_seconds', 'gauge', 'How far the watermark of a keyword is behind now'),
+    ('cveorbit_seen_cves', 'gauge', 'CVE IDs in the dedupe index'),
+    ('cveorbit_shard_restarts_total', 'counter', 'Shard processes restarted by the supervisor')
+]
+
+# Upper bounds in seconds, from a cached response to a request that went through all its retries
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Metrics:
+
+    def __init__(self, buckets=BUCKETS):
+        # Every metric maps its label sets (sorted tuples of name/value pairs) to a value. A histogram value is the count of
+        # every bucket (not cumulative, that's done when rendering), the sum and the count.
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.types = {}
+        self.help = {}
+        self.values = {}
+
+        for name, kind, description in METRICS:
+            self.declare(name, kind, description)
+
+
+    def declare(self, name, kind, description='') -> None:
+        self.types[name] = kind
+        self.help[name] = description
+        self.values.setdefault(name, {})
+
+
+    def inc(self, name, value=1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.values[name]
+            values[key] = values.get(key, 0) + value
+
+
+    def set(self, name, value, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[name][key] = value
+
+
+    def observe(self, name, value, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.values[name].get(key)
+            if histogram is None:
+                histogram = self.values[name][key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+
+    """
+    Observes how long the block took:  with metrics.timer('cveorbit_cycle_seconds'): ...
+    """
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+
+    @staticmethod
+    def format_labels(key, extra=()) -> str:
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+    """
+    Everything in the Prometheus text format (version 0.0.4).
+    """
+    def render(self) -> str:
+        lines = []
+
+        with self.lock:
+            for name, values in self.values.items():
+                kind = self.types[name]
+                lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+                for key, value in sorted(values.items()):
+                    if kind != 'histogram':
+                        lines.append(f'{name}{self.format_labels(key)} {value}')
+                        continue
+
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                        cumulative += bucket
+                        lines.append(f'{name}_bucket{self.format_labels(key, [("le", bound)])} {cumulative}')
+                    lines.append(f'{name}_sum{self.format_labels(key)} {total}')
+                    lines.append(f'{name}_count{self.format_labels(key)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+    """
+    The same as a dict for the JSON snapshots. Histograms get their average next to the buckets.
+    """
+    def snapshot(self) -> dict:
+        metrics = {}
+
+        with self.lock:
+            for name, values in self.values.items():
+                kind = self.types[name]
+                entries = []
+                for key, value in sorted(values.items()):
+                    if kind == 'histogram':
+                        counts, total, count = value
+                        entries.append({
+                            'labels': dict(key), 'count': count, 'sum': round(total, 6), 'avg': round(total / count, 6) if count else 0.0,
+                            'buckets': {str(bound): bucket for bound, bucket in zip(self.buckets + ('+Inf',), counts)}
+                        })
+                    else:
+                        entries.append({'labels': dict(key), 'value': value})
+                metrics[name] = {'type': kind, 'values': entries}
+
+        return {'timestamp': time.time(), 'uptime': round(time.time() - self.started, 3), 'metrics': metrics}
+
+
+class NullMetrics(Metrics):
+
+    """
+    Used when nobody looks at the metrics. Skips all the bookkeeping.
+    """
+    def inc(self, name, value=1, **labels) -> None:
+        pass
+
+
+    def set(self, name, value, **labels) -> None:
+        pass
+
+
+    def observe(self, name, value, **labels) -> None:
+        pass
+
+
+class MetricsServer:
+
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        # Local only by default, the endpoint tells everyone which products we watch
+        self.metrics = metrics
+        registry = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+
+    def start(self) -> None:
+        self.thread.start()
+
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SnapshotWriter:
+
+    def __init__(self, metrics, path='cveorbit_metrics.json', interval=60):
+        # Writes the snapshot every "interval" seconds from a background thread. The file is replaced atomically, a reader
+        # never sees half a snapshot.
+        self.metrics = metrics
+        self.path = path
+        self.interval = max(1, interval)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='metrics-snapshot', daemon=True)
+
+
+    def write(self) -> None:
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.metrics.snapshot(), f, indent=4)
+        os.replace(temporary, self.path)
+
+
+    def run(self) -> None:
+        while not self.stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                pass # The next interval tries again, the monitor must not die because of its metrics
+
+
+    def start(self) -> None:
+        self.thread.start()
+
+
+    def close(self) -> None:
+        self.stop.set()
+        self.thread.join()
+        self.write()
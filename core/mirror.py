@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import json
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+
+from core.colors import Colors
+
+
+class Mirror:
+
+    # NVD refuses "lastModStartDate"/"lastModEndDate" ranges longer than 120 days. If the mirror is older than that we simply bootstrap again.
+    max_sync_range = timedelta(days=120)
+    batch_size = 1000 # Records written per transaction during a sync
+
+    def __init__(self, path='cveorbit_mirror.db'):
+        self.path = path
+        self.colors = Colors()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.create_tables()
+
+
+    """
+    Creating the tables if they don't exist yet. The whole NVD document is stored as JSON so the offline search can hand back
+    exactly what the API would have returned. The other columns are only there for the filters.
+    """
+    def create_tables(self) -> None:
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS cves (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                published TEXT,
+                last_modified TEXT,
+                cvss3_severity TEXT,
+                cvss4_severity TEXT,
+                document TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS cves_published ON cves(published);
+            CREATE INDEX IF NOT EXISTS cves_last_modified ON cves(last_modified);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+
+        # Full-text index over the descriptions, this is what makes keyword searches fast. Some SQLite builds come without FTS5,
+        # in that case we fall back to LIKE queries (slower, but still offline).
+        try:
+            self.conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS cves_fts USING fts5(description)')
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS cves_fts (rowid INTEGER PRIMARY KEY, description TEXT)')
+            self.fts = False
+
+        self.conn.commit()
+
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+
+    def set_meta(self, key, value) -> None:
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+
+    """
+    Inserts or updates a page of NVD "vulnerabilities" entries.
+    """
+    def store(self, vulnerabilities) -> int:
+        for vulnerability in vulnerabilities:
+            cve = vulnerability['cve']
+            metrics = cve.get('metrics', {})
+
+            cvss3 = metrics.get('cvssMetricV31') or metrics.get('cvssMetricV30') or [{}]
+            cvss4 = metrics.get('cvssMetricV40') or [{}]
+            description = cve['descriptions'][0]['value'] if cve.get('descriptions') else ''
+
+            self.conn.execute('''
+                INSERT INTO cves (id, published, last_modified, cvss3_severity, cvss4_severity, document)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    published = excluded.published,
+                    last_modified = excluded.last_modified,
+                    cvss3_severity = excluded.cvss3_severity,
+                    cvss4_severity = excluded.cvss4_severity,
+                    document = excluded.document
+            ''', (
+                cve['id'],
+                cve.get('published'),
+                cve.get('lastModified'),
+                cvss3[0].get('cvssData', {}).get('baseSeverity'),
+                cvss4[0].get('cvssData', {}).get('baseSeverity'),
+                json.dumps(vulnerability, separators=(',', ':'))
+            ))
+
+            rowid = self.conn.execute('SELECT rowid FROM cves WHERE id = ?', (cve['id'],)).fetchone()[0]
+            self.conn.execute('DELETE FROM cves_fts WHERE rowid = ?', (rowid,))
+            self.conn.execute('INSERT INTO cves_fts (rowid, description) VALUES (?, ?)', (rowid, description))
+
+        self.conn.commit()
+        return len(vulnerabilities)
+
+
+    """
+    Synchronizes the mirror with NVD. The first run downloads everything, every run after that only pulls what changed
+    since the last sync via "lastModStartDate"/"lastModEndDate".
+    """
+    def sync(self, pager, base_url, full=False, DEBUG=False) -> int:
+
+        now = datetime.now()
+        last_sync = self.get_meta('last_sync')
+
+        if last_sync and not full and now - datetime.fromisoformat(last_sync) < self.max_sync_range:
+            url = f'{base_url}?lastModStartDate={last_sync}&lastModEndDate={now.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]}'
+            print(self.colors.blue(f'[INF] Incremental sync of changes since {last_sync}'))
+        else:
+            url = base_url
+            print(self.colors.blue('[INF] Full sync of the NVD database, this will take a while...'))
+
+        if DEBUG:
+            print(self.colors.light_yellow(f'[DBG] Syncing the mirror with: [{url}]'))
+
+        # Streaming the records and storing them in batches, so the memory usage stays flat during a full download
+        count = 0
+        batch = []
+        total, records = pager.stream(url)
+
+        if DEBUG:
+            print(self.colors.light_yellow(f'[DBG] NVD reports {total} CVEs to sync'))
+
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                count += self.store(batch)
+                batch = []
+                if DEBUG:
+                    print(self.colors.light_yellow(f'[DBG] Stored {count} CVEs so far'))
+
+        count += self.store(batch)
+
+        self.set_meta('last_sync', now.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3])
+        self.conn.commit()
+
+        return count
+
+
+    """
+    Answers an NVD API URL from the local mirror. Takes the exact same URLs the Fetcher constructs, that way the search mode
+    does not need to know if it is talking to NVD or to the mirror.
+    """
+    def fetch(self, url) -> list:
+
+        query = parse_qs(urlparse(url).query)
+        clauses = []
+        args = []
+
+        if 'keywordSearch' in query:
+            # NVD matches every word of the keyword, so we do the same
+            words = query['keywordSearch'][0].split()
+            if self.fts:
+                clauses.append('rowid IN (SELECT rowid FROM cves_fts WHERE cves_fts MATCH ?)')
+                args.append(' '.join('"' + word.replace('"', '""') + '"' for word in words))
+            else:
+                for word in words:
+                    clauses.append('rowid IN (SELECT rowid FROM cves_fts WHERE description LIKE ?)')
+                    args.append(f'%{word}%')
+
+        if 'cveId' in query:
+            clauses.append('id = ?')
+            args.append(query['cveId'][0].upper())
+
+        if 'cvssV3Severity' in query:
+            clauses.append('cvss3_severity = ?')
+            args.append(query['cvssV3Severity'][0].upper())
+
+        if 'cvssV4Severity' in query:
+            clauses.append('cvss4_severity = ?')
+            args.append(query['cvssV4Severity'][0].upper())
+
+        # The dates are ISO-8601 strings, comparing them as text works just fine
+        for key, column, operator in [
+            ('pubStartDate', 'published', '>='),
+            ('pubEndDate', 'published', '<='),
+            ('lastModStartDate', 'last_modified', '>='),
+            ('lastModEndDate', 'last_modified', '<=')
+        ]:
+            if key in query:
+                clauses.append(f'{column} {operator} ?')
+                args.append(query[key][0])
+
+        sql = 'SELECT document FROM cves'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY published'
+
+        return [json.loads(row[0]) for row in self.conn.execute(sql, args)]
+
+
+    """
+    Streams every stored NVD document in batches, so the whole mirror never has to be in memory. With "modified_since"
+    only the CVEs modified from then on.
+    """
+    def documents(self, modified_since=None):
+        sql = 'SELECT document FROM cves'
+        args = []
+        if modified_since:
+            sql += ' WHERE last_modified >= ?'
+            args.append(modified_since)
+
+        cursor = self.conn.execute(sql, args)
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                return
+            yield [json.loads(row[0]) for row in rows]
+
+
+    def close(self) -> None:
+        self.conn.close()
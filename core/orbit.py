@@ -1,305 +1,537 @@
 # -*- coding: utf-8 -*-
 
 from core.colors import Colors
-from functools import reduce
+from core.transport import Transport
+from core.retry import CircuitOpenError
+from core.pager import Pager
+from core.matcher import KeywordMatcher
+from core.record import extract_record
+from core.render import HumanRenderer
+from core.state import SeenIndex, FingerprintIndex
+from core.jsonl import JsonlWriter
+from core.metrics import NullMetrics
+from core.query import QuerySpec
+from core.scheduler import KeywordScheduler
+from core.applicability import by_cve
 import requests
-import textwrap
 import json
 import time
 import os
 from datetime import datetime
 import sys
 
+# (start parameter, end parameter, watermark prefix) of the two polls: the new publications, and the modifications of the
+# CVEs we already know (--track-updates). The modification watermarks are stored as "lastMod:<keyword>".
+PUBLISHED = ('pubStartDate', 'pubEndDate', '')
+MODIFIED = ('lastModStartDate', 'lastModEndDate', 'lastMod:')
+
+
 class Orbit:
 
-    def __init__(self):
+    # Shortest poll interval the budget is spread to, the tiers can go below it
+    min_interval = 60
+
+    def __init__(self, transport=None, strategy='keyword', state=None, dedupe_window=30 * 24 * 3600):
         self.base_url = 'https://services.nvd.nist.gov/rest/json/cves/2.0'
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.80 Safari/537.36',
-            'Content-Type': 'application/json'
-        }
-        self.params = { }
-        self.names = { }
+        # The transport holds the pooled session, the rate limiter and the retry policy. It can be shared with the Fetcher class.
+        self.transport = transport if transport is not None else Transport()
+        self.pager = Pager(self.transport.get_json, get_stream=self.transport.get_stream)
+        # "keyword" sends one request per keyword, "delta" fetches everything published since the last poll once and matches the keywords locally
+        self.strategy = strategy
+        self.matcher = None
+        self.window_workers = 2 # How many date windows the delta strategy fetches at the same time
         self.colors = Colors()
+        self.renderer = HumanRenderer() # Replaced at startup depending on --render / --silent
         self.last_fetched_timestamp = None
-        self.seen_cve_ids = set()
+
+        # With a core.state.StateStore the watermarks and the dedupe index survive restarts, so we resume exactly where we stopped.
+        # "watermarks" holds the "pubStartDate" of the next request per keyword ('*' is the global window of the delta strategy).
+        self.state = state
+        if state is not None:
+            self.watermarks = state.load_watermarks()
+            self.seen_cve_ids = state.load_seen(dedupe_window)
+        else:
+            self.watermarks = { }
+            self.seen_cve_ids = SeenIndex(dedupe_window)
+
+        # JSON Lines output of the orbit mode, set up by continuous_monitoring() if it's not given from outside
+        self.writer = None
+
+        # Set to a core.alerts.AlertDispatcher to get the new CVEs sent to the --alert-* channels
+        self.alerts = None
+
+        # Fingerprint of the last version of every CVE, only kept with track_updates()
+        self.fingerprints = None
+
+        # Set to a core.metrics.Metrics (and the same on the transport) to get the counters and timings of the hot paths
+        self.metrics = NullMetrics()
+
+        # Set to a core.applicability.Inventory to check the new CVEs against the assets. With "only_affected" the CVEs
+        # that apply to none of them are only remembered as seen, not printed, written or alerted.
+        self.inventory = None
+        self.only_affected = False
 
 
     """
-    This function is used to flatten nested lists
+    Also polls the "lastModified" window every cycle and compares the modified CVEs to the fingerprint of the version we
+    saw before. A CVE published as N/A and scored CRITICAL a week later shows up again as "rescored".
     """
-    @staticmethod
-    def flatten_list(lst) -> list:
-        return list(reduce(lambda x, y: x + (y if isinstance(y, list) else [y]), lst, []))
-    
-    
-    '''
-    I use this to check if the list is nested. If it is, I flatten it. 
-    '''
-    def flatten_if_nested(self, lst) -> list:
-        # Checking if any element in the list is a list itself
-        if any(isinstance(i, list) for i in lst):
-            return self.flatten_list(lst)
-        return lst
-    
-    
-    def search_engine(self, names, filters=None, SAVE_TO_JSON=False, DEBUG=False) -> list:
-        
-        # The "l_params" list is used to store each URL for each vendor or product
-        l_params = []
-
-        # I have made two separate dictionaries for the so called "names", which are basically vendors and/or products you would search for. And then
-        # we have the filters, which are the filtering mechanism you can use to narrow down the search (refer to the -h flag).
-        # I'm not sure if this is the "elegant" way to do this, but for now it can "dnyamically" construct the URL depending on your filters.
-        if names:
-            for key, value in names.items():
-                self.names.update({ key: value })
-
-        if filters:
-            for key, value in filters.items():
-                self.params.update({ key: value })
-
-        # Separating the key and the values for felixbility
-        keys = list(self.names.keys())
-        values = list(self.names.values())
-
-        # Same as above but for the filters
-        f_keys = list(self.params.keys())
-        f_values = list(self.params.values())
-
-        # Flattening the lists (it's a nested list)
-        f_value = self.flatten_if_nested(values)
-
-        # This is the URL "construction" mechanism. It will dynamically construct the URL depending on the filters you provide.
-        # If you do not provide any filters, the standard URL will be only based on the keywordSearch key, which contains the "names" you provide.
-        if not filters:
-            for x in values:
-                if isinstance(x, list): # If the value is a list, we need to iterate through it
-                    for y in x:
-                        l_params.append(f'{self.base_url}?{keys[0]}={y}')
-                else:
-                    l_params.append(f'{self.base_url}?{keys[0]}={x}')
-        
+    def track_updates(self, window=180 * 24 * 3600) -> None:
+        if self.state is not None:
+            self.fingerprints = self.state.load_fingerprints(window)
         else:
-            for x in values:
-                if isinstance(x, list): # Same as above
-                    for y in x:
-                        url = f'{self.base_url}?{keys[0]}={y}'
-                        for z, n in zip(f_keys, f_values):
-                            url += f'&{z}={n}'
-                        l_params.append(url)
-                else:
-                    url = f'{self.base_url}?{keys[0]}={x}'
-                    for z, n in zip(f_keys, f_values):
-                        url += f'&{z}={n}'
-                    l_params.append(url)
+            self.fingerprints = FingerprintIndex(window)
+
+
+    """
+    Fetches a single URL. Returns the decoded JSON or None if the request failed. "label" is the keyword the request
+    is for, its latency is recorded under it.
+    """
+    def fetch(self, param, DEBUG=False, label=None):
+
+        # Debug info
+        if DEBUG:
+            print(self.colors.light_yellow(f'[DBG] Requesting the following URL: [{param}]'))
+
+        # The API can be overloaded, or unreachable for some reason. The retry policy backs off and retries transient errors,
+        # and if NVD is down for good the circuit breaker makes us skip this cycle instead of blocking the whole monitor.
+        data = None
+        start = time.perf_counter()
+        try:
+            response = self.transport.get(param, DEBUG)
+            response.raise_for_status()
+            fetched = time.perf_counter()
+            data = response.json()
+            self.metrics.observe('cveorbit_parse_seconds', time.perf_counter() - fetched)
+
+            if DEBUG:
+                print(self.colors.light_yellow(f'[DBG] HTTP response code: \t{response.status_code} OK'))
+
+        except CircuitOpenError as e:
+            if DEBUG:
+                print(self.colors.red(f'[ERR] {e}'))
+
+        # Handling HTTP errors
+        except requests.exceptions.RequestException as e:
+            if DEBUG:
+                print(self.colors.red(f'[ERR] HTTP error occurred: {e}'))
+
+        except json.decoder.JSONDecodeError as e:
+            if DEBUG:
+                print(self.colors.red(f'[ERR] JSON error occurred: {e}'))
+
+        if label is not None:
+            self.metrics.observe('cveorbit_request_seconds', time.perf_counter() - start, keyword=label)
+
+        return data
+
+
+    def fetch_all(self, l_params, DEBUG=False, labels=None) -> list:
+        return [self.fetch(param, DEBUG, label) for param, label in zip(l_params, labels or [None] * len(l_params))]
+
+
+    """
+    Called once the orbit is over. The plain engine holds nothing of its own, core.async_orbit shuts down its event loop and threads.
+    """
+    def close(self) -> None:
+        pass
+
+
+    """
+    Prints and collects the vulnerabilities we haven't seen yet, and moves the "pubStartDate" watermark forward.
+    """
+    def process(self, vulnerabilities, f_value, DEBUG=False) -> list:
 
-        # The "results" list is used to store the fetched CVEs if you want to save them to a JSON file
         results = []
-        for param in l_params:
-                            
-                # Debug info
+
+        # Getting the amount of vulnerabilities found (amount of keys inside the 'vulnerabilities' key)
+        amount = len(vulnerabilities)
+        if amount == 0:
+            #print(self.colors.blue(f'[INF] Found 0 vulnerabilities for {f_value}'))
+            return results
+
+        # Timing the parsing and the rendering of the whole batch, not every record on its own
+        parse_time = render_time = 0.0
+        duplicates = 0
+
+        # The new CVEs of the batch are checked against the inventory in one pass
+        affected = None
+        if self.inventory is not None:
+            affected = by_cve(self.inventory.match([vulnerability for vulnerability in vulnerabilities if vulnerability['cve']['id'] not in self.seen_cve_ids]))
+        found = []
+
+        # Looping through the amount of vulnerabilities found
+        for i, vulnerability in enumerate(vulnerabilities):
+
+            # Printing this only once. Quick and dirty way xD
+            if i == 0:
+                self.renderer.header(f_value, amount)
+
+            cve_id = vulnerability['cve']['id']
+            if cve_id in self.seen_cve_ids:
+                duplicates += 1
+                continue # Skip this CVE if we have already seen it
+
+            # Extracting the fields (and the highest priority CVSS metric) from the JSON response
+            start = time.perf_counter()
+            record = extract_record(vulnerability)
+            parse_time += time.perf_counter() - start
+            if self.fingerprints is not None:
+                record.event = 'new'
+
+            if DEBUG:
+                print(self.colors.light_yellow(f'[DBG] Found the following metrics: {json.dumps(vulnerability["cve"].get("metrics", {}), indent=5)}'))
+
+            if affected is not None and record.cve_id in affected:
+                record.affects = [match.to_dict() for match in affected[record.cve_id]]
+                found.extend(affected[record.cve_id])
+
+            if affected is None or record.affects or not self.only_affected:
+                # The renderer does the (buffered) printing, or nothing at all in silent mode
+                start = time.perf_counter()
+                self.renderer.record(record)
+                render_time += time.perf_counter() - start
+
+                # Saving the results into a list
+                results.append(record)
+
+                # Queuing the alert. This never blocks, the dispatcher sends it in the background.
+                if self.alerts is not None:
+                    self.alerts.submit(record)
+
+            # Adding the CVE ID to the set
+            if cve_id not in self.seen_cve_ids:
+                self.seen_cve_ids.add(cve_id)
+
+            # Remembering this version, the modification poll compares the next ones to it
+            if self.fingerprints is not None:
+                self.fingerprints.add(cve_id, record.fingerprint(), record.score())
+
+            # Update the last fetched timestamp
+            if self.last_fetched_timestamp is None or record.published > self.last_fetched_timestamp:
                 if DEBUG:
-                    print(self.colors.light_yellow(f'[DBG] Requesting the following URL: [{param}]'))
-
-                # The API can be overloaded, or unreachable for some reason, so I decided to still continue the requests until it is back to "normal"
-                while True:
-
-                    # Some error handling in case there is an issue with the API, internet connection, etc.
-                    try:
-                        response = requests.get(param, headers=self.headers)
-                        response.raise_for_status()
-                        data = response.json()
-
-                        if response.status_code == 200:
-                            if DEBUG:
-                                print(self.colors.light_yellow(f'[DBG] HTTP response code: \t{response.status_code} OK'))
-                            break
-
-                    # Handling HTTP errors
-                    except requests.exceptions.HTTPError as e:
-                        if response.status_code >= 500:
-                            if DEBUG:
-                                print(self.colors.red(f'[ERR] HTTP error occurred: {e}'))
-                            time.sleep(1800) # Sleep for 30 minutes in case of server error
-                            continue
-
-                        else:
-                            if DEBUG:
-                                print(self.colors.red(f'[ERR] HTTP error occurred: {e}'))
-                            break
-                    
-                    except json.decoder.JSONDecodeError as e:
-                        if DEBUG:
-                            print(self.colors.red(f'[ERR] JSON error occurred: {e}'))
-                        break
-
-                # Checking the data variable for NoneType
-                if data is None:
-                    print(self.colors.red(f'[ERR] No data found for {f_value}'))
-                    continue # Skip this vendor or product
-                
-                # Getting the amount of vulnerabilities found (amount of keys inside the 'vulnerabilities' key)
-                amount = len(data['vulnerabilities'])
-                if amount == 0:
-                    #print(self.colors.blue(f'[INF] Found 0 vulnerabilities for {f_value}'))
-                    continue
+                    print(self.colors.light_yellow(f'[DBG] Updating the "pubStartDate" to: {record.published}'))
 
-                # Looping through the amount of vulnerabilities found
-                for i in range(amount):
-                    
-                    # Printing this only once. Quick and dirty way xD
-                    if i == 0:
-                        print(self.colors.blue(f'[INF] Found {amount} vulnerabilities for {f_value}'))
-                        print(Colors.bold(Colors.green(f'\nResults for {f_value}:\n')))
-                    
-                    # We can now fetch the keys and values from the JSON response
-                    cve_id = data['vulnerabilities'][i]['cve']['id']
-                    description = data['vulnerabilities'][i]['cve']['descriptions'][0]['value']
-                    timestamp = data['vulnerabilities'][i]['cve']['published']
-                    last_modified = data['vulnerabilities'][i]['cve']['lastModified']
-
-                    if cve_id in self.seen_cve_ids:
-                        continue # Skip this CVE if we have already seen it
-
-                    # Default values for CVSS metrics
-                    base_score = 'N/A'
-                    base_severity = 'N/A'
-                    version = 'N/A'
-
-                    # I'm leaving it like this for now. Maybe I'll find a more elegant way to do this.
-                    if 'metrics' in data['vulnerabilities'][i]['cve']:
-                        metrics = data['vulnerabilities'][i]['cve']['metrics']
+                self.last_fetched_timestamp = record.published
 
-                    if DEBUG:
-                        print(self.colors.light_yellow(f'[DBG] Found the following metrics: {json.dumps(metrics, indent=5)}'))
-
-                    # Handling version 3.0
-                    if 'cvssMetricV30' in metrics:
-                        version = metrics['cvssMetricV30'][0]['cvssData']['version']
-                        base_score = metrics['cvssMetricV30'][0]['cvssData']['baseScore']
-                        base_severity = metrics['cvssMetricV30'][0]['cvssData']['baseSeverity']
-
-                    # Handling version 3.1
-                    if 'cvssMetricV31' in metrics:
-                        version = metrics['cvssMetricV31'][0]['cvssData']['version']
-                        base_score = metrics['cvssMetricV31'][0]['cvssData']['baseScore']
-                        base_severity = metrics['cvssMetricV31'][0]['cvssData']['baseSeverity']
-
-                    # I'm not sure for this one
-                    if 'cvssMetricV40' in metrics:
-                        version = metrics['cvssMetricV40'][0]['cvssData']['version']
-                        base_score = metrics['cvssMetricV40'][0]['cvssData']['baseScore']
-                        base_severity = metrics['cvssMetricV40'][0]['cvssData']['baseSeverity']
-
-                    # Using textwrap to align long descriptions properly
-                    wrapped_desc = textwrap.fill(description, width=90, subsequent_indent=' ' * 24)
-
-                    # Pretty printing everything :D                   
-                    print(f'\tCVE ID: \t{cve_id}')
-                    print(f'\tCVSS Version: \t{version}')
-                    print(f'\tSeverity: \t{Colors.bold(base_severity)}')
-                    print(f'\tBase Score: \t{base_score}')
-                    print(f'\tPublished: \t{timestamp}')
-                    print(f'\tLast Modified: \t{last_modified}')
-                    print(f'\tDescription: \t{wrapped_desc}\n')
-
-                   
-                    # Saving the results into a list
-                    results.append({
-                        'CVE ID': cve_id,
-                        'CVSS Version': version,
-                        'Severity': base_severity,
-                        'Base Score': base_score,
-                        'Published': timestamp,
-                        'Last Modified': last_modified,
-                        'Description': description
-                        
-                    })
-
-                    # Adding the CVE ID to the set
-                    if cve_id not in self.seen_cve_ids:
-                        self.seen_cve_ids.add(cve_id)
-
-                    # Update the last fetched timestamp
-                    if self.last_fetched_timestamp is None or timestamp > self.last_fetched_timestamp:
-                        if DEBUG:
-                            print(self.colors.light_yellow(f'[DBG] Updating the "pubStartDate" to: {timestamp}'))
-
-                        self.last_fetched_timestamp = timestamp
+        start = time.perf_counter()
+        self.renderer.flush()
+        render_time += time.perf_counter() - start
+
+        for match in found:
+            print(self.colors.blue(f'[INF] {match}'))
+
+        self.metrics.inc('cveorbit_records_total', len(results), result='new')
+        self.metrics.inc('cveorbit_records_total', duplicates, result='duplicate')
+        self.metrics.observe('cveorbit_parse_seconds', parse_time)
+        self.metrics.observe('cveorbit_render_seconds', render_time)
+
+        return results
+
+
+    """
+    Handles the result of the modification poll: a CVE whose fingerprint changed comes back as "rescored" (severity or score
+    changed) or "updated" (description, CPEs, ...). A CVE we never saw before only gets its fingerprint stored, it was
+    published before we started watching and every old CVE NVD touches would flood the output otherwise.
+    """
+    def process_updates(self, vulnerabilities, f_value, DEBUG=False) -> list:
+        results = []
+
+        for vulnerability in vulnerabilities:
+            record = extract_record(vulnerability)
+            fingerprint = record.fingerprint()
+            known = self.fingerprints.get(record.cve_id)
+
+            if known is not None and known[0] == fingerprint:
+                continue
+            self.fingerprints.add(record.cve_id, fingerprint, record.score())
+            if known is None:
+                continue
+
+            if known[1] != record.score():
+                record.event = 'rescored'
+                print(self.colors.blue(f'[INF] {record.cve_id} was rescored: {known[1]} -> {record.score()}'))
+            else:
+                record.event = 'updated'
+                if DEBUG:
+                    print(self.colors.light_yellow(f'[DBG] {record.cve_id} was updated'))
+
+            self.metrics.inc('cveorbit_events_total', event=record.event)
+            results.append(record)
+
+        # An update often is NVD adding the CPEs, that's when a CVE starts to apply to the inventory
+        found = []
+        if self.inventory is not None and results:
+            updated = {record.cve_id for record in results}
+            affected = by_cve(self.inventory.match([vulnerability for vulnerability in vulnerabilities if vulnerability['cve']['id'] in updated]))
+            for record in results:
+                if record.cve_id in affected:
+                    record.affects = [match.to_dict() for match in affected[record.cve_id]]
+                    found.extend(affected[record.cve_id])
+            if self.only_affected:
+                results = [record for record in results if record.affects]
+
+        if results:
+            self.renderer.header(f'{f_value} (updates)', len(results))
+            for record in results:
+                self.renderer.record(record)
+                if self.alerts is not None:
+                    self.alerts.submit(record)
+            self.renderer.flush()
+
+        for match in found:
+            print(self.colors.blue(f'[INF] {match}'))
+
+        return results
+
+
+    """
+    Keyword strategy: one request per keyword. "window" holds the "pubStartDate"/"pubEndDate" (or with MODIFIED the
+    "lastModStartDate"/"lastModEndDate") of this cycle, on top of the filters of the core.query.QuerySpec.
+    """
+    def search_engine(self, spec, window, SAVE_TO_JSON=False, DEBUG=False, poll=PUBLISHED) -> list:
+        start_parameter, end_parameter, prefix = poll
+        handle = self.process if poll is PUBLISHED else self.process_updates
+
+        # Every keyword starts at its own watermark, so a keyword that failed last cycle (or before a restart) catches up on what it missed.
+        overrides = {keyword: {start_parameter: self.watermarks[prefix + keyword]} for keyword in spec.keywords if prefix + keyword in self.watermarks}
+        plans = spec.plan(self.base_url, extra=window, overrides=overrides)
+
+        # The "results" list is used to store the fetched CVEs if you want to save them to a JSON file
+        results = []
+        # A keyword whose watermark is more than 120 days old (the monitor was stopped for a while) has several date windows,
+        # its watermark only moves once all of them came through
+        failed = set()
+        # Fetching every URL first. The plain engine does one request after the other, AsyncOrbit overrides fetch_all() to do them concurrently.
+        labels = [plan.label for plan in plans]
+        for keyword, data in zip(labels, self.fetch_all([plan.url for plan in plans], DEBUG, labels)):
+
+            # Checking the data variable for NoneType
+            if data is None:
+                print(self.colors.red(f'[ERR] No data found for {keyword}'))
+                failed.add(keyword)
+                continue # Skip this vendor or product, its watermark stays where it was
+
+            results.extend(handle(data['vulnerabilities'], keyword, DEBUG))
+
+        # Everything published (or modified) up to the end of the window has been seen for these keywords
+        if end_parameter in window:
+            for keyword in spec.keywords:
+                if keyword not in failed:
+                    self.watermarks[prefix + keyword] = window[end_parameter]
 
         return results
     
 
-    def continuous_monitoring(self, names, filters, update_period, request_limit, SAVE_TO_JSON=False, DEBUG=False):
-        
-        request_count = 0
-        timer = time.time()
+    """
+    Delta strategy: instead of one request per keyword, we fetch the global "published since the last poll" window once
+    (all pages of it) and match every keyword locally with the Aho-Corasick matcher. A cycle costs a handful of requests,
+    no matter if we watch 5 or 5000 products.
+    """
+    def search_delta(self, spec, window, SAVE_TO_JSON=False, DEBUG=False, poll=PUBLISHED) -> list:
+        start_parameter, end_parameter, prefix = poll
+        handle = self.process if poll is PUBLISHED else self.process_updates
+
+        keywords = list(spec.keywords)
+        if self.matcher is None or self.matcher.keywords != keywords:
+            self.matcher = KeywordMatcher(keywords)
+
+        # Same filters as the keyword strategy, only without the "keywordSearch"
+        filters = dict(spec.filters)
+        filters.update(window)
+        if start_parameter in filters and prefix + '*' in self.watermarks:
+            filters[start_parameter] = self.watermarks[prefix + '*']
+
+        # Split into several windows if the last poll is more than 120 days ago
+        urls = spec.window_urls(self.base_url, filters)
+
+        if DEBUG:
+            print(self.colors.light_yellow(f'[DBG] Requesting the delta window: {urls}'))
+
+        # Fanning the CVEs out to the keywords they match. The records are streamed, so only the matching ones are kept in memory.
+        matches = {keyword: [] for keyword in keywords}
+        count = 0
+        start = time.perf_counter()
+        try:
+            for vulnerability in self.pager.stream_many(urls, self.window_workers):
+                count += 1
+                for keyword in self.matcher.match(vulnerability):
+                    matches[keyword].append(vulnerability)
+
+            self.metrics.observe('cveorbit_request_seconds', time.perf_counter() - start, keyword='*')
+
+        except CircuitOpenError as e:
+            if DEBUG:
+                print(self.colors.red(f'[ERR] {e}'))
+            return []
+
+        except (requests.exceptions.RequestException, json.decoder.JSONDecodeError) as e:
+            print(self.colors.red(f'[ERR] An error occured while fetching the delta window: {e}'))
+            return []
+
+        if DEBUG:
+            print(self.colors.light_yellow(f'[DBG] Matched {count} CVEs against {len(keywords)} keyword(s)'))
+
+        results = []
+        for keyword, matched in matches.items():
+            results.extend(handle(matched, keyword, DEBUG))
+
+        if end_parameter in filters:
+            self.watermarks[prefix + '*'] = filters[end_parameter]
+
+        return results
+
+
+    """
+    One polling cycle: fetches everything published since the last one (plus the modifications with track_updates()), writes
+    the new records and persists the state. continuous_monitoring() calls it as often as the request limit allows.
+    """
+    def cycle(self, spec, start_time, SAVE_TO_JSON=False, DEBUG=False) -> list:
+        started = time.perf_counter()
+
+        # I've got some weird issues during testing: when the orbit mode found a CVE, it would fetch the same CVE again and again
+        # So the plan is to "dynamically" update the "pubStartDate" filter to the last fetched timestamp
+        # This way we can avoid fetching the same CVEs (in theory :D)
+        # With the keyword strategy every keyword has its own watermark, the window start only matters for its first poll.
+        # The keywords are polled at different times, so that one has to be the start time and not what other keywords found.
+        window = { }
+        if self.last_fetched_timestamp is None or self.strategy != 'delta':
+            window['pubStartDate'] = start_time
+        else:
+            window['pubStartDate'] = self.last_fetched_timestamp
+
+        window['pubEndDate'] = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+        search = self.search_delta if self.strategy == 'delta' else self.search_engine
+        results = search(spec, window, SAVE_TO_JSON, DEBUG)
+
+        # Second poll over what was modified since the last cycle, for the rescored/updated CVEs
+        if self.fingerprints is not None:
+            modified = {'lastModStartDate': start_time, 'lastModEndDate': window['pubEndDate']}
+            results.extend(search(spec, modified, SAVE_TO_JSON, DEBUG, poll=MODIFIED))
+
+        if SAVE_TO_JSON and results: # If there are any results, we save them into the JSON Lines file
+            self.writer.write_many(record.to_dict() for record in results)
+
+        # Persisting the watermarks and the dedupe index after every cycle
+        self.seen_cve_ids.evict()
+        if self.fingerprints is not None:
+            self.fingerprints.evict()
+        if self.state is not None:
+            self.state.save(self.watermarks, self.seen_cve_ids, self.fingerprints)
+
+        elapsed = time.perf_counter() - started
+        self.metrics.inc('cveorbit_cycles_total')
+        self.metrics.inc('cveorbit_seconds_total', elapsed, activity='working')
+        self.metrics.observe('cveorbit_cycle_seconds', elapsed)
+        self.report_lag()
+
+        return results
+
+
+    """
+    Sets the watermark lag of every keyword: how far behind "now" the next request starts. A lag growing from cycle to
+    cycle means the poller can't keep up with the update period and request limit it was given.
+    """
+    def report_lag(self) -> None:
+        now = datetime.now()
+        for key, watermark in list(self.watermarks.items()):
+            poll = 'modified' if key.startswith(MODIFIED[2]) else 'published'
+            try:
+                lag = (now - datetime.fromisoformat(watermark)).total_seconds()
+            except (TypeError, ValueError):
+                continue
+            self.metrics.set('cveorbit_watermark_lag_seconds', round(lag, 3), poll=poll, keyword=key[len(MODIFIED[2]):] if poll == 'modified' else key)
+
+        self.metrics.set('cveorbit_seen_cves', len(self.seen_cve_ids))
+
+
+    """
+    Builds the scheduler of continuous_monitoring(). The keywords of a tier are polled at the interval of their tier, the
+    others share what is left of the budget ("request_limit" keyword polls per "update_period") evenly, instead of
+    using it up in one burst and idling for the rest of the period. The delta strategy is a single job, it fetches the
+    same window for every keyword.
+    """
+    def schedule(self, spec, update_period, request_limit, tiers=None) -> KeywordScheduler:
+        if self.strategy == 'delta':
+            return KeywordScheduler({'*': max(self.min_interval, update_period / request_limit)}, request_limit, update_period)
+
+        tiers = {keyword.lower(): interval for keyword, interval in (tiers or {}).items()}
+        tiered = {keyword: tiers[keyword.lower()] for keyword in spec.keywords if keyword.lower() in tiers}
+        others = [keyword for keyword in spec.keywords if keyword not in tiered]
+
+        # What the tiers cost per period, the rest goes to the other keywords. Like it always was, every keyword is polled at
+        # least once per period, even if --limit-requests allows fewer polls than there are keywords.
+        tier_cost = sum(update_period / interval for interval in tiered.values())
+        budget = max(request_limit, tier_cost + len(others))
+        if budget > request_limit:
+            needed = f'the {len(tiered)} tiered keyword(s) need {tier_cost:.0f} and the other {len(others)} one each' if tiered else f'the {len(others)} keywords need one each'
+            print(self.colors.blue(f'[INF] --limit-requests allows {request_limit} polls per period but {needed}, polling {budget:.0f} per period (every keyword at least once every {update_period} seconds)'))
+
+        interval = update_period * len(others) / (budget - tier_cost) if others else update_period
+        interval = min(update_period, max(self.min_interval, interval))
+
+        return KeywordScheduler(dict(tiered, **{keyword: interval for keyword in others}), budget, update_period)
+
+
+    def continuous_monitoring(self, spec, update_period, request_limit, SAVE_TO_JSON=False, DEBUG=False, tiers=None):
+
         start_time = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.000')
-        file_path = 'cveorbit_monitoring.json'
-        file_size_limit = 200 * 1024 * 1024 # 200 MB
+
+        # One compact JSON record per line, rotated into numbered (compressed) segments instead of truncating the file
+        if SAVE_TO_JSON and self.writer is None:
+            self.writer = JsonlWriter()
 
         # This is useless but I love it! xD
         spinner = ['|', '/', '-', '\\']
 
-        # If there are more than 1 vendor or products, the search engine will do a GET request for each of them.
-        values = list(names.values())
-        f_values = self.flatten_if_nested(values)
-        
-        # To reduce the amount of requests (otherwise it will do a GET request for each vendor and count it as ONE) we divide the request limit by the amount of vendors
-        if len(f_values) > 1:
-            request_limit /= len(f_values)
+        # Every keyword has its own deadline. The due ones are polled together in one cycle, then we sleep until the next
+        # deadline (or until the request budget frees up), measured on the monotonic clock so the cadence doesn't drift.
+        scheduler = self.schedule(spec, update_period, request_limit, tiers)
+        if DEBUG:
+            for keyword, interval in scheduler.intervals.items():
+                print(self.colors.light_yellow(f'[DBG] Polling {keyword} every {interval:g} seconds'))
 
         try:
             while True:
-                if request_count < request_limit:
-                   
-                    # I've got some weird issues during testing: when the orbit mode found a CVE, it would fetch the same CVE again and again
-                    # So the plan is to "dynamically" update the "pubStartDate" filter to the last fetched timestamp
-                    # This way we can avoid fetching the same CVEs (in theory :D)
-                    if self.last_fetched_timestamp is None:
-                        filters['pubStartDate'] = start_time
-                    
-                    else:
-                        filters['pubStartDate'] = self.last_fetched_timestamp
-                    
-                    filters['pubEndDate'] = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
-
-                    results = self.search_engine(names, filters, SAVE_TO_JSON, DEBUG)
-
-                    if SAVE_TO_JSON:
-                        if os.path.exists(file_path) and os.path.getsize(file_path) < file_size_limit:
-                            mode = 'a'
-                        else:
-                            mode = 'w'
-
-                        if results: # If there are any results, we save them into the JSON file
-                            with open(file_path, mode) as f:
-                                json.dump(results, f, indent=5)
-                                f.write('\n')
-                    
-                    request_count += 1
+                polls = scheduler.due()
+
+                if polls:
+                    for keyword, delay in polls:
+                        self.metrics.observe('cveorbit_poll_delay_seconds', delay, keyword=keyword)
+
+                    keywords = tuple(keyword for keyword, _ in polls)
+                    batch = spec if self.strategy == 'delta' else QuerySpec(keywords, (), spec.filters)
+                    self.cycle(batch, start_time, SAVE_TO_JSON, DEBUG)
+
                     if DEBUG:
-                        print(self.colors.light_yellow(f'[DBG] Request count: \t\t{request_count}'))
-
-                else:
-                    elapsed_time = time.time() - timer
-
-                    if elapsed_time < update_period:
-
-                        if DEBUG:
-                            print(self.colors.light_yellow(f'[DBG] Sleeping for: \t\t{update_period} seconds'))
-                        
-                        # Visual timer
-                        for remaining in range(int(update_period), 0, -1):
-                            for symbol in spinner:
-                                sys.stdout.write(self.colors.blue(f"\r[INF] Sleeping: {remaining} second(s) remaining {symbol}"))
-                                sys.stdout.flush()
-                                time.sleep(0.25)
-
-                    request_count = 0
-                    timer = time.time()
-        
+                        print(self.colors.light_yellow(f'[DBG] Polled: \t\t\t{", ".join(keywords)}'))
+                        self.transport.print_stats()
+                    continue
+
+                wait = scheduler.wait()
+                if DEBUG:
+                    print(self.colors.light_yellow(f'[DBG] Sleeping for: \t\t{wait:.1f} seconds'))
+
+                # Visual timer, until the deadline and not for a fixed amount of quarter seconds
+                sleep_started = time.monotonic()
+                wake = sleep_started + wait
+                symbol = 0
+                while (remaining := wake - time.monotonic()) > 0:
+                    sys.stdout.write(self.colors.blue(f"\r[INF] Sleeping: {int(remaining) + 1} second(s) remaining {spinner[symbol % len(spinner)]}"))
+                    sys.stdout.flush()
+                    symbol += 1
+                    time.sleep(min(0.25, remaining))
+
+                self.metrics.inc('cveorbit_seconds_total', time.monotonic() - sleep_started, activity='sleeping')
+
         except KeyboardInterrupt:
+            if self.alerts is not None:
+                self.alerts.close()
+            if self.writer is not None:
+                self.writer.close()
+            if self.state is not None:
+                self.state.save(self.watermarks, self.seen_cve_ids, self.fingerprints)
+                self.state.close()
             print(self.colors.blue(f'\n[INF] You aborted the fetching process. Exiting...'))
             exit(0)
\ No newline at end of file
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+
+"""
+Closes a streamed page, or the records of stream(), we are done with. The JSON pages of iter_pages() and the empty
+results have nothing to release.
+"""
+def release(page) -> None:
+    close = getattr(page, 'close', None)
+    if close is not None:
+        close()
+
+
+class Pager:
+
+    def __init__(self, get_json, results_per_page=2000, max_workers=4, get_stream=None):
+        # "get_json" is whatever callable the caller uses to do a GET request and decode the JSON body, "get_stream" the same
+        # but returning a core.stream.StreamingPage. This way the pager does not care about headers, sessions, etc.
+        self.get_json = get_json
+        self.get_stream = get_stream
+        self.results_per_page = results_per_page
+        self.max_workers = max(1, int(max_workers))
+
+
+    """
+    Appends the NVD paging parameters to an already constructed URL.
+    """
+    def page_url(self, url, start_index) -> str:
+        separator = '&' if '?' in url else '?'
+        return f'{url}{separator}resultsPerPage={self.results_per_page}&startIndex={start_index}'
+
+
+    """
+    Fetches the remaining "startIndex" windows of a query once we know the first page. Only "max_workers" pages are in flight
+    at once, so even a full NVD download never holds more than a handful of pages in memory. Waiting on the oldest window
+    first keeps the pages in the same order NVD would give us.
+    """
+    def iter_windows(self, url, header, get):
+        total = header.get('totalResults', 0)
+        # NVD can return fewer results per page than we asked for, so I'm using whatever the server actually sent us
+        per_page = header.get('resultsPerPage', 0)
+
+        if per_page == 0 or total <= per_page:
+            return
+
+        starts = iter(range(per_page, total, per_page))
+        in_flight = deque()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for start in starts:
+                in_flight.append(pool.submit(get, self.page_url(url, start)))
+                if len(in_flight) >= self.max_workers:
+                    break
+
+            try:
+                while in_flight:
+                    page = in_flight.popleft().result()
+                    start = next(starts, None)
+                    if start is not None:
+                        in_flight.append(pool.submit(get, self.page_url(url, start)))
+                    yield page
+            finally:
+                # A page failed or the caller stopped reading: the pages still in flight are never going to be read, but the
+                # streamed ones hold a connection until they are closed
+                for future in in_flight:
+                    if future.cancel():
+                        continue
+                    try:
+                        release(future.result())
+                    except Exception:
+                        pass # A page that failed has nothing to release
+
+
+    """
+    Yields the "vulnerabilities" list of every page of a query, in order. The first page tells us how many results there are
+    ("totalResults"), the remaining windows are then fetched concurrently.
+    """
+    def iter_pages(self, url):
+        first = self.get_json(self.page_url(url, 0))
+        yield first.get('vulnerabilities', [])
+
+        for page in self.iter_windows(url, first, self.get_json):
+            yield page.get('vulnerabilities', [])
+
+
+    """
+    Streaming version: returns the total amount of results and a generator yielding the records one at a time, parsed
+    straight from the response bodies. No page is ever decoded as a whole. Falls back to iter_pages() if the caller
+    did not give us a "get_stream" callable.
+    """
+    def stream(self, url):
+        if self.get_stream is None:
+            vulnerabilities = self.fetch(url)
+            return len(vulnerabilities), iter(vulnerabilities)
+
+        first = self.get_stream(self.page_url(url, 0))
+        total = first.header.get('totalResults', 0)
+
+        # Nobody is going to iterate over an empty result, so the page has to be released right away
+        if total == 0:
+            first.close()
+            return 0, iter(())
+
+        # Every page is closed once we are done with it, also when the caller stops early or a later page fails
+        def records():
+            try:
+                yield from first
+            finally:
+                first.close()
+
+            for page in self.iter_windows(url, first.header, self.get_stream):
+                try:
+                    yield from page
+                finally:
+                    page.close()
+
+        return total, records()
+
+
+    """
+    Streams several queries (the date windows of one search) as one. Up to "max_windows" windows are fetched at the same
+    time, each by its own producer thread, and their records are merged through a bounded queue, so the memory use stays
+    flat no matter how many windows there are. A CVE showing up in two windows is only yielded once. The windows finish in
+    any order, so the records are not sorted across windows.
+    """
+    def stream_many(self, urls, max_windows=2):
+        if len(urls) == 1:
+            yield from self.stream(urls[0])[1]
+            return
+
+        records = queue.Queue(maxsize=self.results_per_page)
+        stopping = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            # Giving up if the consumer went away, otherwise the producer would wait on the full queue forever
+            while not stopping.is_set():
+                try:
+                    records.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce(url):
+            try:
+                records_of_window = self.stream(url)[1]
+                try:
+                    for record in records_of_window:
+                        if not put(record):
+                            return
+                finally:
+                    # Releases the page the producer is on when the consumer went away
+                    release(records_of_window)
+                put(done)
+            except Exception as e:
+                put(e)
+
+        pool = ThreadPoolExecutor(max_workers=max(1, int(max_windows)))
+        for url in urls:
+            pool.submit(produce, url)
+
+        seen = set()
+        remaining = len(urls)
+        try:
+            while remaining:
+                item = records.get()
+                if item is done:
+                    remaining -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+
+                cve_id = item.get('cve', {}).get('id')
+                if cve_id in seen:
+                    continue
+                seen.add(cve_id)
+                yield item
+        finally:
+            stopping.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+    """
+    Same as iter_pages() but merges everything into a single list.
+    """
+    def fetch(self, url) -> list:
+        vulnerabilities = []
+        for page in self.iter_pages(url):
+            vulnerabilities.extend(page)
+        return vulnerabilities
@@ -26,15 +26,55 @@ def common_args(parser, monitoring=True, search=True):
         filtering_group.add_argument('-fpsd', '--filter-published-start-date', type=str, help='REQUIRES the "-fped" argument to work. Used to filter the search with a start date for the published date. Format: YYYY-MM-DDT00:00:00')
         filtering_group.add_argument('-fped', '--filter-published-end-date', type=str, help='REQUIRES the "-fped" argument to work. Used to filter the search with an end date for the published date. Format: YYYY-MM-DDT00:00:00')
 
+    # Watchlists work in both modes
+    filtering_group.add_argument('-wl', '--watchlist', type=str, nargs='+', help='Files with the products to watch: one keyword per line (.txt), CSV/TSV inventories (cpe, keyword, vendor/product or name columns), CycloneDX (.json, .xml) and SPDX (.json, .spdx) SBOMs')
+    filtering_group.add_argument('-nmz', '--no-minimize', action='store_true', help='Keep the watchlist terms that a broader term already covers (e.g. "apache tomcat" next to "apache")')
+    filtering_group.add_argument('-inv', '--inventory', type=str, nargs='+', help='Asset inventories (CSV/TSV with asset/host, vendor, product, version or cpe columns) or SBOMs (CycloneDX .json/.xml, SPDX .json/.spdx). Every CVE is checked against the CPE version ranges of NVD and the affected assets are reported')
+    filtering_group.add_argument('-oa', '--only-affected', action='store_true', help='REQUIRES the "-inv" argument to work. Only show the CVEs that apply to an asset of the inventory')
+
     # Only available in monitoring mode
     if monitoring:
         #options_group.add_argument('-lc', '--limit-cve', type=int, help='Limit the number of CVEs to be fetched', default=10)
-        options_group.add_argument('-lr', '--limit-requests', type=int, help='Limit the number of requests to be made')
-        options_group.add_argument('-up', '--update-period', type=int, help='Update period in seconds')
+        options_group.add_argument('-lr', '--limit-requests', type=int, help='Keyword polls allowed per update period, spread evenly over the period instead of being sent in one burst. Every keyword is polled at least once per period, a higher limit polls them more often')
+        options_group.add_argument('-up', '--update-period', type=int, help='Update period in seconds. Every keyword outside a tier is polled at least once per period')
+        options_group.add_argument('-kt', '--keyword-tier', type=str, nargs='+', action='append', metavar=('SECONDS', 'KEYWORD'), help='Poll these keywords every SECONDS seconds, no matter the update period. Can be given several times, e.g. -kt 60 "apache tomcat" openssl -kt 600 nginx')
+        options_group.add_argument('-st', '--strategy', type=str, choices=['keyword', 'delta'], help='"keyword" sends one request per keyword and cycle, "delta" fetches everything published since the last poll once and matches the keywords locally', default='keyword')
+        options_group.add_argument('-sf', '--state-file', type=str, help='Where the orbit keeps its watermarks and already seen CVEs between restarts', default='cveorbit_state.db')
+        options_group.add_argument('-ns', '--no-state', action='store_true', help='Do not persist the orbit state, every start begins at "now"')
+        options_group.add_argument('-dw', '--dedupe-window', type=int, help='How many days an already seen CVE is remembered', default=30)
+        options_group.add_argument('-c', '--concurrency', type=int, help='Number of keyword queries sent concurrently each cycle (asyncio engine). 1 keeps the sequential engine', default=1)
+        options_group.add_argument('-tu', '--track-updates', action='store_true', help='Also poll the CVEs modified since the last cycle and report the ones that were rescored or updated after their publication')
+        options_group.add_argument('-sh', '--shards', type=int, help='Split the keywords over this many worker processes sharing the NVD quota (keyword strategy only). 1 keeps a single process', default=1)
+        options_group.add_argument('-mp', '--metrics-port', type=int, help='Serve the metrics (requests, latencies, records, watermark lag, ...) in the Prometheus format on http://127.0.0.1:PORT/metrics')
+        options_group.add_argument('-mf', '--metrics-file', type=str, help='Write a JSON snapshot of the metrics to this file periodically')
+        options_group.add_argument('-mi', '--metrics-interval', type=int, help='Seconds between two metrics snapshots', default=60)
     
+    # Only available in search mode
+    if search:
+        options_group.add_argument('-w', '--workers', type=int, help='Number of pages fetched concurrently when a query has more results than one page holds', default=4)
+        options_group.add_argument('-ww', '--window-workers', type=int, help='Number of date windows fetched concurrently when a date range is longer than the 120 days NVD allows', default=2)
+        options_group.add_argument('-f', '--format', type=str, choices=['json', 'parquet', 'arrow'], help='Format of the files written with -o. parquet and arrow need pyarrow', default='json')
+        options_group.add_argument('-off', '--offline', action='store_true', help='Answer the search from the local mirror instead of the NVD API (see the "sync" mode)')
+        options_group.add_argument('-m', '--mirror', type=str, help='Path to the local mirror database', default='cveorbit_mirror.db')
+        options_group.add_argument('-ct', '--cache-ttl', type=int, help='How many seconds a cached NVD response is used without asking NVD again', default=600)
+        options_group.add_argument('-cd', '--cache-dir', type=str, help='Directory of the response cache', default='cveorbit_cache')
+        options_group.add_argument('-cs', '--cache-size', type=int, help='Maximum size of the response cache in MB (least recently used responses are evicted first)', default=256)
+        options_group.add_argument('-nca', '--no-cache', action='store_true', help='Always ask NVD, do not use or fill the response cache')
+
     # Globaly available option
     options_group.add_argument('-o', '--output', action='store_true', help='Output file to store the fetched CVEs (in JSON)')
 
+    # Only available in monitoring mode
+    if monitoring:
+        options_group.add_argument('-rs', '--rotate-size', type=int, help='Rotate the orbit output (cveorbit_monitoring.jsonl) into a new segment once it reaches this size in MB', default=200)
+        options_group.add_argument('-ra', '--rotate-age', type=int, help='Rotate the orbit output into a new segment after this many hours')
+        options_group.add_argument('-nc', '--no-compress', action='store_true', help='Keep the rotated segments uncompressed instead of gzipping them')
+        options_group.add_argument('-fs', '--fsync', type=str, choices=['always', 'cycle', 'never'], help='When the orbit output is fsynced to disk', default='cycle')
+    options_group.add_argument('-k', '--api-key', type=str, help='NVD API key, raises the quota from 5 to 50 requests per 30 seconds. Can also be set with the NVD_API_KEY environment variable')
+    options_group.add_argument('-r', '--retries', type=int, help='How many times a failed request (timeout, 5xx, 403/429) is retried with exponential backoff', default=5)
+    options_group.add_argument('-to', '--timeout', type=float, help='Read timeout of a single request in seconds', default=60.0)
+    options_group.add_argument('-ps', '--pool-size', type=int, help='Maximum number of kept-alive connections to the NVD API', default=10)
+
     # Only available in monitoring mode
     if monitoring:
         alert_group.add_argument('-ae', '--alert-email', type=str, help='Email address to send alerts to')
@@ -42,11 +82,91 @@ def common_args(parser, monitoring=True, search=True):
         alert_group.add_argument('-at', '--alert-telegram', type=str, help='Telegram bot token to send alerts to')
         alert_group.add_argument('-as', '--alert-slack', type=str, help='Slack webhook to send alerts to')
         alert_group.add_argument('-ate', '--alert-teams', type=str, help='Microsoft Teams webhook to send alerts to')
+        alert_group.add_argument('-atc', '--alert-telegram-chat', type=str, help='Telegram chat ID the bot sends the alerts to')
+        alert_group.add_argument('-aw', '--alert-window', type=int, help='New CVEs found within this many seconds are sent as one digest message per channel', default=60)
+        alert_group.add_argument('-smtp', '--smtp-server', type=str, help='SMTP server used for the email alerts. Format: host:port', default='localhost:25')
+        alert_group.add_argument('-smf', '--smtp-from', type=str, help='Sender address of the email alerts', default='cveorbit@localhost')
+        alert_group.add_argument('-smu', '--smtp-user', type=str, help='SMTP username')
+        alert_group.add_argument('-smp', '--smtp-password', type=str, help='SMTP password. Can also be set with the SMTP_PASSWORD environment variable')
+        alert_group.add_argument('-sms', '--smtp-starttls', action='store_true', help='Use STARTTLS for the SMTP connection')
 
     # Debugging args
     debug_group.add_argument('-v', '--version', action='version', help='Show version information', version='CVEOrbit v0.1.1')
     debug_group.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
     debug_group.add_argument('-si', '--silent', action='store_true', help='Enable silent mode')
+    debug_group.add_argument('-R', '--render', type=str, choices=['auto', 'human', 'plain', 'jsonl', 'none'], help='How the CVEs are printed. "auto" is colored on a terminal, plain lines otherwise and nothing in silent mode', default='auto')
+
+
+def sync_args(parser):
+
+    options_group = parser.add_argument_group('Options')
+    debug_group = parser.add_argument_group('Debugging')
+
+    options_group.add_argument('-m', '--mirror', type=str, help='Path to the local mirror database', default='cveorbit_mirror.db')
+    options_group.add_argument('-w', '--workers', type=int, help='Number of pages fetched concurrently', default=4)
+    options_group.add_argument('-k', '--api-key', type=str, help='NVD API key, raises the quota from 5 to 50 requests per 30 seconds. Can also be set with the NVD_API_KEY environment variable')
+    options_group.add_argument('-r', '--retries', type=int, help='How many times a failed request (timeout, 5xx, 403/429) is retried with exponential backoff', default=5)
+    options_group.add_argument('-to', '--timeout', type=float, help='Read timeout of a single request in seconds', default=60.0)
+    options_group.add_argument('-ps', '--pool-size', type=int, help='Maximum number of kept-alive connections to the NVD API', default=10)
+    options_group.add_argument('-F', '--full', action='store_true', help='Download the whole NVD database again instead of only the changes since the last sync')
+
+    debug_group.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    debug_group.add_argument('-si', '--silent', action='store_true', help='Enable silent mode')
+
+
+def convert_args(parser):
+
+    options_group = parser.add_argument_group('Options')
+    debug_group = parser.add_argument_group('Debugging')
+
+    options_group.add_argument('input', type=str, nargs='+', help='JSON outputs to convert: cveorbit_monitoring.jsonl (with its segments), the old cveorbit_monitoring.json or cveorbit_results_*.json')
+    options_group.add_argument('-f', '--format', type=str, choices=['parquet', 'arrow'], help='Target format', default='parquet')
+    options_group.add_argument('-of', '--output-file', type=str, help='Target file', required=True)
+
+    debug_group.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    debug_group.add_argument('-si', '--silent', action='store_true', help='Enable silent mode')
+
+
+def index_args(parser):
+
+    options_group = parser.add_argument_group('Options')
+    debug_group = parser.add_argument_group('Debugging')
+
+    options_group.add_argument('input', type=str, nargs='+', help='Outputs to index: cveorbit_monitoring.jsonl (with its segments), the old cveorbit_monitoring.json or cveorbit_results_*.json')
+    options_group.add_argument('-ix', '--index', type=str, help='Path to the index database', default='cveorbit_index.db')
+
+    debug_group.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    debug_group.add_argument('-si', '--silent', action='store_true', help='Enable silent mode')
+
+
+def query_args(parser):
+
+    options_group = parser.add_argument_group('Options')
+    debug_group = parser.add_argument_group('Debugging')
+
+    options_group.add_argument('query', type=str, help='Words, "phrases", AND/OR/NOT (or -word), (groups), prefix* and the fields id:, description:, vendor:, product:')
+    options_group.add_argument('-ix', '--index', type=str, help='Path to the index database', default='cveorbit_index.db')
+    options_group.add_argument('-n', '--limit', type=int, help='Maximum number of results', default=50)
+    options_group.add_argument('-ms', '--min-severity', type=str.upper, choices=['LOW', 'MEDIUM', 'HIGH', 'CRITICAL'], help='Only show CVEs at least this severe')
+    options_group.add_argument('-s', '--sort', type=str, choices=['severity', 'recent'], help='"severity" ranks by severity, score and then recency, "recent" by publication date', default='severity')
+
+    debug_group.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    debug_group.add_argument('-si', '--silent', action='store_true', help='Enable silent mode')
+    debug_group.add_argument('-R', '--render', type=str, choices=['auto', 'human', 'plain', 'jsonl', 'none'], help='How the CVEs are printed. "auto" is colored on a terminal, plain lines otherwise and nothing in silent mode', default='auto')
+
+
+def match_args(parser):
+    # Creating some groups for better readability
+    options_group = parser.add_argument_group('Options')
+    debug_group = parser.add_argument_group('Debugging')
+
+    options_group.add_argument('inventory', type=str, nargs='+', help='Asset inventories (CSV/TSV with asset/host, vendor, product, version or cpe columns) or SBOMs (CycloneDX .json/.xml, SPDX .json/.spdx)')
+    options_group.add_argument('-m', '--mirror', type=str, help='Path to the local mirror database (see the "sync" mode)', default='cveorbit_mirror.db')
+    options_group.add_argument('-ms', '--modified-since', type=str, help='Only check the CVEs modified since this date. Format: YYYY-MM-DDT00:00:00')
+    options_group.add_argument('-o', '--output', action='store_true', help='Save the affected assets to a JSON file')
+
+    debug_group.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    debug_group.add_argument('-si', '--silent', action='store_true', help='Enable silent mode')
 
 
 def parse_args():
@@ -64,5 +184,24 @@ def parse_args():
     continuous_group = subparsers.add_parser('orbit', help='Continuous monitoring mode')
     common_args(continuous_group, monitoring=True, search=False)
 
+    # Creating subparser for the local mirror
+    sync_group = subparsers.add_parser('sync', help='Download or update the local CVE mirror used by "search --offline"')
+    sync_args(sync_group)
+
+    # Creating subparser for the columnar converter
+    convert_group = subparsers.add_parser('convert', help='Convert existing JSON outputs to Parquet or Arrow')
+    convert_args(convert_group)
+
+    # Creating subparsers for the local inverted index
+    index_group = subparsers.add_parser('index', help='Index the orbit outputs and search exports for the "query" mode')
+    index_args(index_group)
+
+    query_group = subparsers.add_parser('query', help='Search the local index (see the "index" mode)')
+    query_args(query_group)
+
+    # Creating subparser for the inventory matching
+    match_group = subparsers.add_parser('match', help='Check an asset inventory against every CVE of the local mirror (see the "sync" mode)')
+    match_args(match_group)
+
     # Parse the arguments
     return parser.parse_args()
\ No newline at end of file
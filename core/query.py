@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from urllib.parse import urlencode, quote
+
+
+SEVERITIES = ('LOW', 'MEDIUM', 'HIGH', 'CRITICAL')
+
+# NVD rejects date ranges longer than this, longer ranges are split into several windows
+MAX_RANGE_DAYS = 120
+
+# (argument name, NVD parameter) of the severity filters
+SEVERITY_FILTERS = [
+    ('filter_severity_3', 'cvssV3Severity'),
+    ('filter_severity_4', 'cvssV4Severity')
+]
+
+# (start argument, end argument, NVD start parameter, NVD end parameter) of the date range filters
+DATE_FILTERS = [
+    ('filter_last_modified_start_date', 'filter_last_modified_end_date', 'lastModStartDate', 'lastModEndDate'),
+    ('filter_published_start_date', 'filter_published_end_date', 'pubStartDate', 'pubEndDate')
+]
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    label: str # The keyword or CVE ID the request is for, used in the messages and file names
+    url: str
+
+
+"""
+Normalizes a date to the format NVD wants (YYYY-MM-DDTHH:MM:SS.mmm). A plain date is accepted too: it becomes the start
+of the day for a start date and the end of the day for an end date.
+"""
+def normalize_date(value, end=False) -> str:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}. Format: YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS')
+
+    if 'T' not in value and ' ' not in value and end:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999000)
+
+    return parsed.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+
+"""
+Splits a date range into consecutive windows NVD accepts. A window never spans more than MAX_RANGE_DAYS and the next one
+starts one millisecond after it, so no CVE falls between two windows or lands in both.
+"""
+def split_range(start, end, max_days=MAX_RANGE_DAYS) -> list:
+    start_date = datetime.fromisoformat(start)
+    end_date = datetime.fromisoformat(end)
+    step = timedelta(days=max_days) - timedelta(milliseconds=1)
+
+    windows = []
+    while True:
+        window_end = min(start_date + step, end_date)
+        windows.append((start, window_end.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] if window_end < end_date else end))
+        if window_end >= end_date:
+            return windows
+        start_date = window_end + timedelta(milliseconds=1)
+        start = start_date.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+
+"""
+Expands a set of request parameters into one set per date window. With both a published and a last modified range,
+every combination of their windows is a request.
+"""
+def split_parameters(parameters) -> list:
+    expanded = [dict(parameters)]
+
+    for _, _, start_parameter, end_parameter in DATE_FILTERS:
+        if start_parameter not in parameters or end_parameter not in parameters:
+            continue
+
+        windows = split_range(parameters[start_parameter], parameters[end_parameter])
+        expanded = [dict(item, **{start_parameter: start, end_parameter: end}) for item in expanded for start, end in windows]
+
+    # A CVE can't be modified before it was published, those combinations would only cost a request for nothing
+    return [item for item in expanded if not ('pubStartDate' in item and 'lastModEndDate' in item and item['pubStartDate'] > item['lastModEndDate'])]
+
+
+@dataclass(frozen=True)
+class QuerySpec:
+    keywords: tuple = ()
+    cve_ids: tuple = ()
+    filters: tuple = () # (NVD parameter, value) pairs, sorted so two equal specs compare (and hash) equal
+
+
+    """
+    Turns the parsed arguments of the search or orbit mode into a spec. Every combination of filters ends up in one request
+    per keyword, nothing is silently ignored anymore. Half date ranges are rejected because NVD would reject them anyway.
+    """
+    @classmethod
+    def from_args(cls, args):
+        filters = {}
+
+        for argument, parameter in SEVERITY_FILTERS:
+            value = getattr(args, argument, None)
+            if value:
+                value = value.upper()
+                if value not in SEVERITIES:
+                    raise ValueError(f'Invalid severity: {value}. Use one of {", ".join(SEVERITIES)}')
+                filters[parameter] = value
+
+        for start_argument, end_argument, start_parameter, end_parameter in DATE_FILTERS:
+            start = getattr(args, start_argument, None)
+            end = getattr(args, end_argument, None)
+            if bool(start) != bool(end):
+                raise ValueError(f'"{start_parameter}" and "{end_parameter}" have to be given together')
+            if start:
+                filters[start_parameter] = normalize_date(start)
+                filters[end_parameter] = normalize_date(end, end=True)
+                if filters[start_parameter] > filters[end_parameter]:
+                    raise ValueError(f'"{start_parameter}" is after "{end_parameter}"')
+
+        return cls.create(getattr(args, 'filter_keywords', None), getattr(args, 'filter_id', None), filters)
+
+
+    """
+    Builds a spec from plain values. The keywords are stripped, whitespace is collapsed and duplicates (ignoring the case)
+    are dropped, so "Apache  Tomcat" and "apache tomcat" cost one request.
+    """
+    @classmethod
+    def create(cls, keywords=None, cve_ids=None, filters=None):
+        unique_keywords = {}
+        for keyword in keywords or []:
+            keyword = ' '.join(keyword.split())
+            if keyword:
+                unique_keywords.setdefault(keyword.lower(), keyword)
+
+        unique_ids = dict.fromkeys(cve_id.strip().upper() for cve_id in cve_ids or [] if cve_id.strip())
+
+        return cls(tuple(unique_keywords.values()), tuple(unique_ids), tuple(sorted((filters or {}).items())))
+
+
+    def url(self, base_url, parameters) -> str:
+        # quote() instead of the default quote_plus(): NVD wants "%20" for the spaces inside a keyword. The colons of the dates are kept readable.
+        return f'{base_url}?{urlencode(parameters, safe=":", quote_via=quote)}'
+
+
+    """
+    One request per keyword (with every filter) and one per CVE ID. "overrides" replaces filter values for single labels,
+    the orbit mode uses it for the per-keyword watermarks. A date range longer than NVD allows gives several requests with
+    the same label, one per window.
+    """
+    def plan(self, base_url, extra=None, overrides=None) -> list:
+        filters = dict(self.filters)
+        filters.update(extra or {})
+        overrides = overrides or {}
+
+        plans = []
+        for keyword in self.keywords:
+            parameters = {'keywordSearch': keyword}
+            parameters.update(filters)
+            parameters.update(overrides.get(keyword, {}))
+            for window in split_parameters(parameters):
+                plans.append(QueryPlan(keyword, self.url(base_url, window)))
+
+        for cve_id in self.cve_ids:
+            plans.append(QueryPlan(cve_id, self.url(base_url, {'cveId': cve_id})))
+
+        return plans
+
+
+    """
+    The URLs of the delta strategy: every filter but no "keywordSearch", split into windows like the keyword requests.
+    """
+    def window_urls(self, base_url, parameters) -> list:
+        return [self.url(base_url, window) for window in split_parameters(parameters)]
+
+
+    def describe(self) -> str:
+        parts = []
+        if self.keywords:
+            parts.append(f'keywords: {list(self.keywords)}')
+        if self.cve_ids:
+            parts.append(f'CVE-ID: {list(self.cve_ids)}')
+        for parameter, value in self.filters:
+            parts.append(f'{parameter}: {value}')
+        return ', '.join(parts)
+
+
+"""
+The plans only depend on the spec and the base URL, so the same search never builds its URLs twice.
+"""
+@lru_cache(maxsize=256)
+def cached_plan(spec, base_url) -> tuple:
+    return tuple(spec.plan(base_url))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+
+    # NVD quotas (https://nvd.nist.gov/developers/start-here): 5 requests in a rolling 30 second window without an API key,
+    # 50 requests with one.
+    PUBLIC_LIMIT = 5
+    API_KEY_LIMIT = 50
+    WINDOW = 30.0
+
+    def __init__(self, max_requests=PUBLIC_LIMIT, window=WINDOW):
+        self.max_requests = max(1, int(max_requests))
+        self.window = float(window)
+        self.timestamps = deque() # When the requests inside the current window were sent
+        self.lock = threading.Lock()
+
+
+    """
+    Returns a limiter matching the NVD quota for the given API key (or the public quota if there is none).
+    """
+    @classmethod
+    def for_api_key(cls, api_key=None):
+        return cls(cls.API_KEY_LIMIT if api_key else cls.PUBLIC_LIMIT, cls.WINDOW)
+
+
+    """
+    Blocks until a request can be sent without going over the quota, then books it. The window is rolling, so requests go out
+    as fast as they are allowed instead of in fixed bursts. Safe to call from several threads.
+    """
+    def acquire(self) -> float:
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+
+                # Dropping the requests that left the window
+                while self.timestamps and now - self.timestamps[0] >= self.window:
+                    self.timestamps.popleft()
+
+                if len(self.timestamps) < self.max_requests:
+                    self.timestamps.append(now)
+                    return waited
+
+                delay = self.window - (now - self.timestamps[0])
+
+            time.sleep(delay)
+            waited += delay
+
+
+class SharedRateLimiter(RateLimiter):
+
+    def __init__(self, max_requests=RateLimiter.PUBLIC_LIMIT, window=RateLimiter.WINDOW):
+        # Same quota, but shared by several processes (the shards of the supervisor). The send times of the last "max_requests"
+        # requests live in shared memory as a ring buffer: the slot we are about to overwrite is the oldest request, so a
+        # request may go out once that one left the window. Wall clock time, the monotonic clock is not comparable across processes.
+        self.max_requests = max(1, int(max_requests))
+        self.window = float(window)
+        self.lock = multiprocessing.Lock()
+        self.slots = multiprocessing.Array('d', self.max_requests, lock=False)
+        self.head = multiprocessing.Value('i', 0, lock=False)
+
+
+    def acquire(self) -> float:
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                now = time.time()
+                oldest = self.slots[self.head.value]
+
+                if now - oldest >= self.window:
+                    self.slots[self.head.value] = now
+                    self.head.value = (self.head.value + 1) % self.max_requests
+                    return waited
+
+                delay = self.window - (now - oldest)
+
+            time.sleep(delay)
+            waited += delay
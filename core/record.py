@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+
+
+# Which CVSS metric wins if a CVE has several of them, the higher the better
+METRIC_PRIORITY = {
+    'cvssMetricV2': 1,
+    'cvssMetricV30': 2,
+    'cvssMetricV31': 3,
+    'cvssMetricV40': 4
+}
+
+
+@dataclass(slots=True)
+class CveRecord:
+    cve_id: str
+    version: str
+    severity: str
+    base_score: object # float, or 'N/A' if NVD didn't score the CVE yet
+    published: str
+    last_modified: str
+    description: str
+    products: list = field(default_factory=list) # "vendor:product" of the CPE criteria, for the local index
+    event: str = None # "new", "rescored" or "updated" in orbit mode with --track-updates
+    affects: list = None # The inventory items the CVE applies to ({"Asset", "Product", "Version", "Constraint"}) with --inventory
+
+
+    """
+    8 bytes hash over everything NVD can change after the publication. Two versions with the same fingerprint look the same to us.
+    """
+    def fingerprint(self) -> str:
+        content = json.dumps([self.version, self.severity, self.base_score, self.description, self.products], separators=(',', ':'))
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+
+
+    def score(self) -> str:
+        return f'{self.severity} {self.base_score}'
+
+
+    """
+    The record in the format we always used for the JSON exports.
+    """
+    def to_dict(self) -> dict:
+        data = {
+            'CVE ID': self.cve_id,
+            'CVSS Version': self.version,
+            'Severity': self.severity,
+            'Base Score': self.base_score,
+            'Published': self.published,
+            'Last Modified': self.last_modified,
+            'Description': self.description,
+            'Products': self.products
+        }
+        if self.event is not None:
+            data['Event'] = self.event
+        if self.affects is not None:
+            data['Affects'] = self.affects
+        return data
+
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['CVE ID'],
+            data['CVSS Version'],
+            data['Severity'],
+            data['Base Score'],
+            data['Published'],
+            data['Last Modified'],
+            data['Description'],
+            data.get('Products', []), # Outputs written before we kept the products don't have them
+            data.get('Event'),
+            data.get('Affects')
+        )
+
+
+"""
+The unique "vendor:product" pairs of the CPE criteria ("cpe:2.3:a:apache:tomcat:9.0.1:...") of a CVE, in the order NVD lists them.
+"""
+def extract_products(cve) -> list:
+    products = {}
+    for configuration in cve.get('configurations', []):
+        for node in configuration.get('nodes', []):
+            for cpe_match in node.get('cpeMatch', []):
+                parts = cpe_match.get('criteria', '').split(':')
+                if len(parts) > 4:
+                    products[f'{parts[3]}:{parts[4]}'] = None
+    return list(products)
+
+
+"""
+Extracts a CveRecord from one entry of the NVD "vulnerabilities" array. The metrics are walked once and the highest
+priority one is kept, instead of checking every CVSS version one after the other.
+"""
+def extract_record(vulnerability) -> CveRecord:
+    cve = vulnerability['cve']
+
+    best = None
+    best_priority = 0
+    for key, entries in cve.get('metrics', {}).items():
+        priority = METRIC_PRIORITY.get(key, 0)
+        if priority > best_priority and entries:
+            best, best_priority = entries[0], priority
+
+    if best is None:
+        version = base_score = severity = 'N/A'
+    else:
+        cvss_data = best['cvssData']
+        version = cvss_data.get('version', 'N/A')
+        base_score = cvss_data.get('baseScore', 'N/A')
+        # CVSS 2.0 keeps the severity next to "cvssData" instead of inside of it
+        severity = cvss_data.get('baseSeverity') or best.get('baseSeverity', 'N/A')
+
+    descriptions = cve.get('descriptions')
+
+    return CveRecord(
+        cve['id'],
+        version,
+        severity,
+        base_score,
+        cve.get('published', 'N/A'),
+        cve.get('lastModified', 'N/A'),
+        descriptions[0]['value'] if descriptions else '',
+        extract_products(cve)
+    )
+
+
+"""
+Same as extract_record() over a whole page (or stream) of vulnerabilities.
+"""
+def extract_records(vulnerabilities) -> list:
+    return list(map(extract_record, vulnerabilities))
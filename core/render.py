@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import abc
+import json
+import sys
+import textwrap
+
+from core.colors import Colors
+
+
+class Renderer(abc.ABC):
+
+    # Records buffered before they are written out in one go
+    batch_size = 64
+
+    def __init__(self):
+        self.buffer = []
+        self.stream = None # Where the records go, None is whatever sys.stdout is when they are written
+
+
+    def header(self, keyword, amount) -> None:
+        pass
+
+
+    def record(self, record) -> None:
+        self.buffer.append(self.format(record))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+
+    """
+    The text of one record. Every renderer has to say how it looks, a missing one fails when the renderer is created.
+    """
+    @abc.abstractmethod
+    def format(self, record) -> str:
+        pass
+
+
+    def flush(self) -> None:
+        if self.buffer:
+            # Looking up sys.stdout at write time, the silent mode replaces it after the renderers are created
+            stream = self.stream or sys.stdout
+            stream.write(''.join(self.buffer))
+            stream.flush()
+            self.buffer = []
+
+
+class HumanRenderer(Renderer):
+
+    """
+    The colored output we always had, with the descriptions wrapped to the terminal.
+    """
+    def header(self, keyword, amount) -> None:
+        self.flush()
+        if amount is not None: # Unknown until the end when the search is split into date windows
+            print(Colors.blue(f'[INF] Found {amount} vulnerabilities for {keyword}'))
+        print(Colors.bold(Colors.green(f'\nResults for {keyword}:\n')))
+
+
+    def format(self, record) -> str:
+        # Using textwrap to align long descriptions properly
+        wrapped_desc = textwrap.fill(record.description, width=90, subsequent_indent=' ' * 24)
+
+        # Rescored/updated CVEs of the modification poll say so, new ones look like they always did
+        event = f'\tEvent: \t{Colors.bold(record.event)}\n' if record.event not in (None, 'new') else ''
+
+        # The assets of the --inventory the CVE applies to
+        affects = ''
+        if record.affects:
+            assets = textwrap.fill(', '.join(f'{item["Asset"]} ({item["Product"]} {item["Version"]})' for item in record.affects), width=90, subsequent_indent=' ' * 24)
+            affects = f'\tAffects: \t{Colors.bold(assets)}\n'
+
+        # Pretty printing everything :D
+        return (
+            f'\tCVE ID: \t{record.cve_id}\n'
+            f'{event}'
+            f'\tCVSS Version: \t{record.version}\n'
+            f'\tSeverity: \t{Colors.bold(record.severity)}\n'
+            f'\tBase Score: \t{record.base_score}\n'
+            f'\tPublished: \t{record.published}\n'
+            f'\tLast Modified: \t{record.last_modified}\n'
+            f'{affects}'
+            f'\tDescription: \t{wrapped_desc}\n\n'
+        )
+
+
+class PlainRenderer(Renderer):
+
+    """
+    One tab separated line per CVE, no colors and no wrapping. Meant for pipes and log files.
+    """
+    def header(self, keyword, amount) -> None:
+        self.flush()
+        print(f'# {amount} vulnerabilities for {keyword}' if amount is not None else f'# vulnerabilities for {keyword}')
+
+
+    def format(self, record) -> str:
+        description = record.description.replace('\t', ' ').replace('\n', ' ')
+        return f'{record.cve_id}\t{record.version}\t{record.severity}\t{record.base_score}\t{record.published}\t{record.last_modified}\t{description}\n'
+
+
+class JsonlRenderer(Renderer):
+
+    """
+    One JSON object per CVE, nothing else on stdout. The banner and the status lines go to stderr (see cveorbit.py).
+    """
+    def format(self, record) -> str:
+        return json.dumps(record.to_dict(), separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+class NullRenderer(Renderer):
+
+    """
+    Used when the output goes nowhere (silent mode). Skips all the formatting work.
+    """
+    def record(self, record) -> None:
+        pass
+
+
+    def format(self, record) -> str:
+        return ''
+
+
+RENDERERS = {
+    'human': HumanRenderer,
+    'plain': PlainRenderer,
+    'jsonl': JsonlRenderer,
+    'none': NullRenderer
+}
+
+
+"""
+Picks the renderer at startup. "auto" means nothing in silent mode, plain lines if stdout is not a terminal and the
+colored output otherwise.
+"""
+def get_renderer(name='auto', silent=False) -> Renderer:
+    if name == 'auto':
+        if silent:
+            name = 'none'
+        elif not sys.stdout.isatty():
+            name = 'plain'
+        else:
+            name = 'human'
+
+    return RENDERERS[name]()
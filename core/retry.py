@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from core.colors import Colors
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        # "failure_threshold" counts requests that failed after all their retries, not single attempts
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+
+    """
+    Tells if a request may go out. Once the breaker is open nothing goes through until "reset_timeout" has passed, after that
+    exactly one probe request is let through (half-open). Its outcome decides if the breaker closes again or stays open.
+    """
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+
+            return False
+
+
+    def probing(self) -> bool:
+        with self.lock:
+            return self.state == self.HALF_OPEN
+
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class RetryPolicy:
+
+    # Status codes worth retrying. NVD answers with 403 when the quota is exceeded, not only with 429.
+    retry_statuses = {403, 429, 500, 502, 503, 504}
+
+    def __init__(self, max_retries=5, backoff_base=1.0, backoff_max=60.0, connect_timeout=10.0, read_timeout=60.0, breaker=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = (connect_timeout, read_timeout) # Passed straight to requests, so a hung socket can't block us forever
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.colors = Colors()
+
+
+    """
+    Parses the "Retry-After" header, which is either a number of seconds or an HTTP date.
+    """
+    @staticmethod
+    def retry_after(response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+    """
+    Exponential backoff with "full jitter": a random delay between 0 and base * 2^attempt (capped). The jitter keeps several
+    workers from hammering the API in lockstep. If the server told us how long to wait, we wait at least that long.
+    """
+    def backoff(self, attempt, retry_after=None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+
+    """
+    Runs "send" (a callable taking the timeout and returning a requests response) until it succeeds or we run out of retries.
+    Connection errors, timeouts and the status codes above are retried, everything else is handed back to the caller as is.
+    """
+    def call(self, send, DEBUG=False):
+        attempt = 0
+
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f'NVD looks unavailable, not sending requests for up to {self.breaker.reset_timeout} seconds')
+
+            retry_after = None
+            try:
+                response = send(self.timeout)
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+
+            except Exception:
+                # Not retried (invalid URL, too many redirects, broken encoding, ...), but it still has to end a half-open
+                # probe. Otherwise the breaker would wait for its outcome forever and never let a request through again.
+                self.breaker.record_failure()
+                raise
+
+            else:
+                if response.status_code not in self.retry_statuses:
+                    self.breaker.record_success()
+                    return response
+
+                error = requests.exceptions.HTTPError(f'{response.status_code} Error for url: {response.url}', response=response)
+                retry_after = self.retry_after(response)
+                response.close() # Giving the connection back to the pool, streamed responses would keep it otherwise
+
+            # One failure per call and not per attempt, the retries of a single request would open the breaker on their own
+            # otherwise. A failed half-open probe opens it again right away.
+            if attempt >= self.max_retries or self.breaker.probing():
+                self.breaker.record_failure()
+
+            if attempt >= self.max_retries:
+                raise error
+
+            delay = self.backoff(attempt, retry_after)
+            if DEBUG:
+                print(self.colors.light_yellow(f'[DBG] {error} - retrying in {delay:.2f} seconds (attempt {attempt + 1}/{self.max_retries})'))
+
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import time
+from collections import deque
+
+
+"""
+Turns the --keyword-tier arguments (lists of "SECONDS KEYWORD [KEYWORD ...]") into a {keyword: interval} mapping.
+"""
+def parse_tiers(values) -> dict:
+    tiers = {}
+
+    for tier in values or []:
+        try:
+            interval = float(tier[0])
+        except ValueError:
+            raise ValueError(f'A tier starts with its poll interval in seconds, not "{tier[0]}"')
+        if interval <= 0:
+            raise ValueError(f'The poll interval of a tier has to be positive, not {tier[0]}')
+        if len(tier) < 2:
+            raise ValueError(f'The {tier[0]} seconds tier has no keywords')
+
+        for keyword in tier[1:]:
+            tiers[' '.join(keyword.split())] = interval
+
+    return tiers
+
+
+class KeywordScheduler:
+
+    def __init__(self, intervals, budget=None, window=3600, clock=time.monotonic):
+        # "intervals" maps every keyword to its poll interval in seconds. "budget" is how many keyword polls are allowed
+        # within "window" seconds (None for no limit). All the times are read from "clock", a monotonic clock, so changing
+        # the system time never makes a poll run twice or not at all.
+        self.intervals = dict(intervals)
+        self.budget = budget
+        self.window = window
+        self.clock = clock
+        self.booked = deque() # When the polls inside the budget window ran
+
+        # The queue holds (deadline, interval, keyword). Everything is due right away, the shorter intervals first.
+        now = clock()
+        self.queue = [(now, interval, keyword) for keyword, interval in self.intervals.items()]
+        heapq.heapify(self.queue)
+
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+
+    def available(self, now) -> int:
+        if self.budget is None:
+            return len(self.queue)
+
+        while self.booked and now - self.booked[0] >= self.window:
+            self.booked.popleft()
+        return max(0, int(self.budget) - len(self.booked))
+
+
+    """
+    Pops the keywords that are due and books them. If the budget can't take all of them, the shortest intervals (the
+    highest tiers) go first and the others stay queued with their deadline, so they are the first ones once it can.
+    Returns (keyword, delay) pairs, the delay being how late the poll starts after its deadline.
+    """
+    def due(self, now=None) -> list:
+        now = self.clock() if now is None else now
+
+        ready = []
+        while self.queue and self.queue[0][0] <= now:
+            ready.append(heapq.heappop(self.queue))
+
+        ready.sort(key=lambda entry: (entry[1], entry[0]))
+        allowed = self.available(now)
+        for entry in ready[allowed:]:
+            heapq.heappush(self.queue, entry)
+
+        polls = []
+        for deadline, interval, keyword in ready[:allowed]:
+            polls.append((keyword, now - deadline))
+            self.booked.append(now)
+            heapq.heappush(self.queue, (self.next_deadline(deadline, interval, now), interval, keyword))
+
+        return polls
+
+
+    """
+    The next deadline is counted from the last one, not from when the poll ran, so the cadence never drifts. A keyword
+    that fell behind by more than a whole interval skips the polls it missed instead of running them back to back.
+    """
+    @staticmethod
+    def next_deadline(deadline, interval, now) -> float:
+        deadline += interval
+        if deadline <= now:
+            deadline += ((now - deadline) // interval + 1) * interval
+        return deadline
+
+
+    """
+    Seconds until the next poll can run: the next deadline, or later if the budget is used up until then.
+    """
+    def wait(self, now=None) -> float:
+        now = self.clock() if now is None else now
+        if not self.queue:
+            return float('inf')
+
+        wake = self.queue[0][0]
+        if self.available(now) == 0:
+            wake = max(wake, self.booked[0] + self.window)
+        return max(0.0, wake - now)
@@ -1,226 +1,183 @@
 # -*- coding: utf-8 -*-
 
-import requests
 import json
 import datetime
-from functools import reduce
-import textwrap
+from itertools import groupby
 
 from core.colors import Colors
+from core.pager import Pager, release
+from core.transport import Transport
+from core.record import extract_record
+from core.applicability import by_cve
+from core.render import HumanRenderer
+from core.export import FORMATS, write_records
+from core.query import cached_plan
 
 class Fetcher:
 
-    def __init__(self):
+    def __init__(self, transport=None, max_workers=4):
         self.base_url = 'https://services.nvd.nist.gov/rest/json/cves/2.0'
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.80 Safari/537.36',
-            'Content-Type': 'application/json'
-        }
-        self.params = { }
-        self.names = { }
+        # The transport holds the pooled session, the rate limiter and the retry policy. It can be shared with the Orbit class.
+        # Streamed pages keep their connection until they are read, so the pool needs one more than the amount of workers
+        self.transport = transport if transport is not None else Transport(pool_size=max_workers + 1)
         self.colors = Colors()
+        self.renderer = HumanRenderer() # Replaced at startup depending on --render / --silent
+        self.pager = Pager(self.get_json, results_per_page=2000, max_workers=max_workers, get_stream=self.transport.get_stream)
+        self.mirror = None # Set to a core.mirror.Mirror to answer the queries offline
+        self.export_format = 'json' # Format of the files written with SAVE_TO_JSON: json, parquet or arrow
+        self.window_workers = 2 # How many date windows of a long range are fetched at the same time
+        self.inventory = None # Set to a core.applicability.Inventory to check the CVEs against the assets
+        self.only_affected = False # Only show the CVEs that apply to the inventory
 
 
     """
-    This function is used to flatten nested lists
+    Small helper so the pager can do the GET requests without knowing about the transport.
     """
-    @staticmethod
-    def flatten_list(lst) -> list:
-        return list(reduce(lambda x, y: x + (y if isinstance(y, list) else [y]), lst, []))
-    
-    
-    '''
-    I use this to check if the list is nested. If it is, I flatten it. 
-    '''
-    def flatten_if_nested(self, lst) -> list:
-        # Checking if any element in the list is a list itself
-        if any(isinstance(i, list) for i in lst):
-            return self.flatten_list(lst)
-        return lst
-    
+    def get_json(self, url) -> dict:
+        return self.transport.get_json(url)
+
 
     """
-    Function to fetch CVEs via the search mode. You can give as many filters as you want to the function. My goal was to make the filtering mechanism as flexible as possible by
-    "dynamically" constructing the URL depending on the filters you provide.
+    Renders one batch of raw CVEs and adds them to "results". The whole batch is checked against the inventory at once,
+    the matches are added to "found".
     """
-    def fetch_cve_keywords(self, names, filters=None,  SAVE_TO_JSON=False, DEBUG=False) -> None:
-        
-        # The "l_params" list is used to store each URL for each vendor or product
-        l_params = []
+    def process(self, vulnerabilities, results, found, DEBUG=False) -> None:
+        affected = None
+        if self.inventory is not None and vulnerabilities:
+            affected = by_cve(self.inventory.match(vulnerabilities))
 
-        # Debug info
-        if DEBUG:
-            print(self.colors.light_yellow(f'[DBG] Debug mode is set to: {DEBUG}'))
-            print(self.colors.light_yellow(f'[DBG] SAVE_TO_JSON is set to: {SAVE_TO_JSON}'))
+        for vulnerability in vulnerabilities:
+            # Extracting the fields (and the highest priority CVSS metric) from the JSON response
+            record = extract_record(vulnerability)
+
+            if DEBUG:
+                print(self.colors.light_yellow(f'[DBG] Found the following metrics: {json.dumps(vulnerability["cve"].get("metrics", {}), indent=5)}'))
 
-        # I have made two separate dictionaries for the so called "names", which are basically vendors and/or products you would search for. And then
-        # we have the filters, which are the filtering mechanism you can use to narrow down the search (refer to the -h flag).
-        # I'm not sure if this is the "elegant" way to do this, but for now it can "dnyamically" construct the URL depending on your filters.
-        if names:
-            for key, value in names.items():
-                self.names.update({ key: value })
+            if affected is not None and record.cve_id in affected:
+                record.affects = [match.to_dict() for match in affected[record.cve_id]]
+                found.extend(affected[record.cve_id])
+            elif affected is not None and self.only_affected:
+                continue
 
-        if filters:
-            for key, value in filters.items():
-                self.params.update({ key: value })
+            # The renderer does the (buffered) printing, or nothing at all in silent mode
+            self.renderer.record(record)
 
-        # Separating the key and the values for felixbility
-        keys = list(self.names.keys())
-        values = list(self.names.values())
+            # Saving the results into a list
+            results.append(record)
 
-        # Same as above but for the filters
-        f_keys = list(self.params.keys())
-        f_values = list(self.params.values())
 
-        # If you are unsure what those values are, use the -d flag to enable the DEBUG mode which will print the results below
+    """
+    Function to fetch CVEs via the search mode. The core.query.QuerySpec holds the keywords, CVE IDs and filters, and turns
+    any combination of them into one URL-encoded request per keyword or CVE ID.
+    """
+    def fetch_cve_keywords(self, spec, SAVE_TO_JSON=False, DEBUG=False) -> None:
+
+        # Debug info
         if DEBUG:
-            print(self.colors.light_yellow(f'[DBG] Found the following NAME keys: {keys}'))
-            print(self.colors.light_yellow(f'[DBG] Found the following NAME values: {values}'))
-            print(self.colors.light_yellow(f'[DBG] Found the following FILTER keys: {f_keys}'))
-            print(self.colors.light_yellow(f'[DBG] Found the following FILTER values: {f_values}'))
-
-        # Flattening the lists (it's a nested list)
-        f_value = self.flatten_if_nested(values)
-
-        # This is the URL "construction" mechanism. It will dynamically construct the URL depending on the filters you provide.
-        # If you do not provide any filters, the standard URL will be only based on the keywordSearch key, which contains the "names" you provide.
-        if not filters:
-            for x in values:
-                if isinstance(x, list): # If the value is a list, we need to iterate through it
-                    for y in x:
-                        l_params.append(f'{self.base_url}?{keys[0]}={y}')
-                else:
-                    l_params.append(f'{self.base_url}?{keys[0]}={x}')
-        
-        else:
-            for x in values:
-                if isinstance(x, list): # Same as above
-                    for y in x:
-                        url = f'{self.base_url}?{keys[0]}={y}'
-                        for z, n in zip(f_keys, f_values):
-                            url += f'&{z}={n}'
-                        l_params.append(url)
-                else:
-                    url = f'{self.base_url}?{keys[0]}={x}'
-                    for z, n in zip(f_keys, f_values):
-                        url += f'&{z}={n}'
-                    l_params.append(url)
+            print(self.colors.light_yellow(f'[DBG] Debug mode is set to: {DEBUG}'))
+            print(self.colors.light_yellow(f'[DBG] SAVE_TO_JSON is set to: {SAVE_TO_JSON}'))
+            print(self.colors.light_yellow(f'[DBG] Query: {spec.describe()}'))
+
+        # The plans are cached, running the same search twice does not build the URLs again
+        plans = cached_plan(spec, self.base_url)
 
         # Debug info
         if DEBUG:
-            print(self.colors.light_yellow(f'[DBG] Constructed the following URL: {l_params}'))
+            print(self.colors.light_yellow(f'[DBG] Constructed the following URL: {[plan.url for plan in plans]}'))
 
-        counter = 0 # Counter for tracking which vendor or product we are fetching the CVEs for
         # Fetching the CVEs
         try:
-            for param in l_params:
+            # The plans of a keyword follow each other, a long date range gives one plan per 120 days window
+            for label, group in groupby(plans, key=lambda plan: plan.label):
+                urls = [plan.url for plan in group]
 
                 # The "results" list is used to store the fetched CVEs if you want to save them to a JSON file
                 results = []
 
                 # Debug info
                 if DEBUG:
-                    print(self.colors.light_yellow(f'[DBG] Requesting the following URL: [{param}]'))
+                    for url in urls:
+                        print(self.colors.light_yellow(f'[DBG] Requesting the following URL: [{url}]'))
 
                 # Some error handling in case there is an issue with the API, internet connection, etc.
+                # The pager fetches every page of the query, not only the first one. In offline mode the local mirror answers instead
                 try:
-                    response = requests.get(param, headers=self.headers)
-                    response.raise_for_status()
-                    data = response.json()
+                    # The records are parsed one at a time from the response body, so a 2000 results page is never held in memory as a whole
+                    if self.mirror is not None:
+                        vulnerabilities = [vulnerability for url in urls for vulnerability in self.mirror.fetch(url)]
+                        amount = len(vulnerabilities)
+                    elif len(urls) == 1:
+                        amount, vulnerabilities = self.pager.stream(urls[0])
+                    else:
+                        # Several windows are fetched at once and merged, we only know the amount once they are all done
+                        print(self.colors.blue(f'[INF] Splitting the search for {label} into {len(urls)} date windows'))
+                        amount = None
+                        vulnerabilities = self.pager.stream_many(urls, self.window_workers)
 
                 except Exception as e:
                     print(self.colors.light_red(f'[ERR] An error occured while fetching the data: {e}'))
+                    continue
                 
-                # Getting the amount of vulnerabilities found (amount of keys inside the 'vulnerabilities' key)
-                amount = len(data['vulnerabilities'])
                 if amount == 0:
-                    print(self.colors.blue(f'[INF] Found 0 vulnerabilities for {f_value[counter]}'))
-                    counter += 1
+                    print(self.colors.blue(f'[INF] Found 0 vulnerabilities for {label}'))
                     continue
 
-                # Looping through the amount of vulnerabilities found
-                for i in range(amount):
-                    
-                    # Printing this only once. Quick and dirty way xD
-                    if i == 0:
-                        print(self.colors.blue(f'[INF] Found {amount} vulnerabilities for {f_value[counter]}'))
-                        print(Colors.bold(Colors.green(f'\nResults for {f_value[counter]}:\n')))
+                found = []
+
+                # Without an inventory every record goes straight to the renderer. With one, the records are collected
+                # a page at a time and the page is matched against the inventory in one pass, like the orbit does.
+                batch_size = self.pager.results_per_page if self.inventory is not None else 1
+                batch = []
+
+                # The pages are fetched while we iterate, so a failure on a later page (circuit breaker, broken stream,
+                # a window worker that gave up) shows up here. It only ends this keyword, like a failed first page does.
+                try:
+                    # Looping through the amount of vulnerabilities found
+                    for i, vulnerability in enumerate(vulnerabilities):
                     
-                    # We can now fetch the keys and values from the JSON response
-                    cve_id = data['vulnerabilities'][i]['cve']['id']
-                    description = data['vulnerabilities'][i]['cve']['descriptions'][0]['value']
-                    timestamp = data['vulnerabilities'][i]['cve']['published']
-                    last_modified = data['vulnerabilities'][i]['cve']['lastModified']
-
-                    # Default values for CVSS metrics
-                    base_score = 'N/A'
-                    base_severity = 'N/A'
-                    version = 'N/A'
-
-                    # I'm leaving it like this for now. Maybe I'll find a more elegant way to do this.
-                    if 'metrics' in data['vulnerabilities'][i]['cve']:
-                        metrics = data['vulnerabilities'][i]['cve']['metrics']
-
-                    if DEBUG:
-                        print(self.colors.light_yellow(f'[DBG] Found the following metrics: {json.dumps(metrics, indent=5)}'))
-
-                    # Here we are handling the case if the CVSS version is 2.0. The key arrangement is different
-                    # Depending on the CVSS Score version.
-                    if 'cvssMetricV2' in metrics:
-                        version = metrics['cvssMetricV2'][0]['cvssData']['version']
-                        base_score = metrics['cvssMetricV2'][0]['cvssData']['baseScore']
-                        base_severity = metrics['cvssMetricV2'][0]['baseSeverity']
-
-                    # Handling version 3.0
-                    if 'cvssMetricV30' in metrics:
-                        version = metrics['cvssMetricV30'][0]['cvssData']['version']
-                        base_score = metrics['cvssMetricV30'][0]['cvssData']['baseScore']
-                        base_severity = metrics['cvssMetricV30'][0]['cvssData']['baseSeverity']
-
-                    # Handling version 3.1
-                    if 'cvssMetricV31' in metrics:
-                        version = metrics['cvssMetricV31'][0]['cvssData']['version']
-                        base_score = metrics['cvssMetricV31'][0]['cvssData']['baseScore']
-                        base_severity = metrics['cvssMetricV31'][0]['cvssData']['baseSeverity']
-
-                    # I'm not sure for this one
-                    if 'cvssMetricV40' in metrics:
-                        version = metrics['cvssMetricV40'][0]['cvssData']['version']
-                        base_score = metrics['cvssMetricV40'][0]['cvssData']['baseScore']
-                        base_severity = metrics['cvssMetricV40'][0]['cvssData']['baseSeverity']
-
-                    # Using textwrap to align long descriptions properly
-                    wrapped_desc = textwrap.fill(description, width=90, subsequent_indent=' ' * 24)
-
-                    # Pretty printing everything :D                   
-                    print(f'\tCVE ID: \t{cve_id}')
-                    print(f'\tCVSS Version: \t{version}')
-                    print(f'\tSeverity: \t{Colors.bold(base_severity)}')
-                    print(f'\tBase Score: \t{base_score}')
-                    print(f'\tPublished: \t{timestamp}')
-                    print(f'\tLast Modified: \t{last_modified}')
-                    print(f'\tDescription: \t{wrapped_desc}\n')
-
-                   
-                    # Saving the results into a list
-                    results.append({
-                        'CVE ID': cve_id,
-                        'CVSS Version': version,
-                        'Severity': base_severity,
-                        'Base Score': base_score,
-                        'Published': timestamp,
-                        'Last Modified': last_modified,
-                        'Description': description
-                    })
+                        # Printing this only once. Quick and dirty way xD
+                        if i == 0:
+                            self.renderer.header(label, amount)
+
+                        batch.append(vulnerability)
+                        if len(batch) >= batch_size:
+                            pending, batch = batch, []
+                            self.process(pending, results, found, DEBUG)
+
+                    pending, batch = batch, []
+                    self.process(pending, results, found, DEBUG)
+
+                except Exception as e:
+                    # The page we were reading is not going to be read to the end, its connection goes back to the pool
+                    release(vulnerabilities)
+                    # The records read before the failure are still shown and exported
+                    self.process(batch, results, found, DEBUG)
+                    self.renderer.flush()
+                    print(self.colors.light_red(f'[ERR] An error occured while fetching the data for {label}, the results are incomplete ({len(results)} vulnerabilities): {e}'))
+
+                self.renderer.flush()
+
+                for match in found:
+                    print(self.colors.blue(f'[INF] {match}'))
+
+                if amount is None:
+                    print(self.colors.blue(f'[INF] Found {len(results)} vulnerabilities for {label}'))
+                    if not results:
+                        continue
                 
-                # Saving the results to a JSON file
-                if SAVE_TO_JSON:
-                   with open(f'cveorbit_results_{f_value[counter]}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.json', 'w') as f:
-                        json.dump(results, f, indent=4)
-                        print(self.colors.blue(f'[INF] Successfully exported the fetched CVEs to cveorbit_results_{f_value[counter]}_{datetime.datetime.now()}.json\n'))
-
-                # Incrementing the counter to fetch the next vendor or product
-                counter += 1
+                # Saving the results to a JSON (or Parquet/Arrow) file
+                if SAVE_TO_JSON and self.export_format in FORMATS:
+                    file_name = f'cveorbit_results_{label}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}{FORMATS[self.export_format]}'
+                    write_records(results, file_name, self.export_format)
+                    print(self.colors.blue(f'[INF] Successfully exported the fetched CVEs to {file_name}\n'))
+
+                elif SAVE_TO_JSON:
+                   with open(f'cveorbit_results_{label}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.json', 'w') as f:
+                        json.dump([record.to_dict() for record in results], f, indent=4)
+                        print(self.colors.blue(f'[INF] Successfully exported the fetched CVEs to cveorbit_results_{label}_{datetime.datetime.now()}.json\n'))
+
+            if DEBUG:
+                self.transport.print_stats()
 
         except KeyboardInterrupt:
             print(self.colors.blue('[INF] You aborted the fetching process. Exiting...'))
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import time
+
+
+class SeenIndex:
+
+    def __init__(self, window=30 * 24 * 3600):
+        # CVE ID -> when we saw it. Anything older than "window" seconds is evicted: by then the watermarks moved way past its
+        # publication date, so NVD won't send it again. This keeps the memory flat no matter how long the orbit runs.
+        self.window = window
+        self.entries = {}
+        self.dirty = set() # Added since the last save
+
+
+    def __contains__(self, cve_id) -> bool:
+        return cve_id in self.entries
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+    def add(self, cve_id, seen_at=None) -> None:
+        self.entries[cve_id] = seen_at if seen_at is not None else time.time()
+        self.dirty.add(cve_id)
+
+
+    def evict(self, now=None) -> int:
+        cutoff = (now if now is not None else time.time()) - self.window
+        expired = [cve_id for cve_id, seen_at in self.entries.items() if seen_at < cutoff]
+        for cve_id in expired:
+            del self.entries[cve_id]
+            self.dirty.discard(cve_id)
+        return len(expired)
+
+
+class FingerprintIndex:
+
+    def __init__(self, window=180 * 24 * 3600):
+        # CVE ID -> (fingerprint, score, when we stored it) of the last version we saw. The fingerprint is a 8 bytes hash of the
+        # record, "score" the "SEVERITY score" string, so a rescore can be shown as "N/A N/A -> CRITICAL 9.8" without keeping
+        # the documents. NVD enrichment can take months, so the window is longer than the one of the dedupe index.
+        self.window = window
+        self.entries = {}
+        self.dirty = set()
+
+
+    def __contains__(self, cve_id) -> bool:
+        return cve_id in self.entries
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+    def get(self, cve_id):
+        return self.entries.get(cve_id)
+
+
+    def add(self, cve_id, fingerprint, score, seen_at=None) -> None:
+        self.entries[cve_id] = (fingerprint, score, seen_at if seen_at is not None else time.time())
+        self.dirty.add(cve_id)
+
+
+    def evict(self, now=None) -> int:
+        cutoff = (now if now is not None else time.time()) - self.window
+        expired = [cve_id for cve_id, entry in self.entries.items() if entry[2] < cutoff]
+        for cve_id in expired:
+            del self.entries[cve_id]
+            self.dirty.discard(cve_id)
+        return len(expired)
+
+
+class StateStore:
+
+    def __init__(self, path='cveorbit_state.db'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS watermarks (keyword TEXT PRIMARY KEY, timestamp TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS seen (cve_id TEXT PRIMARY KEY, seen_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS seen_seen_at ON seen(seen_at);
+            CREATE TABLE IF NOT EXISTS fingerprints (cve_id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, score TEXT NOT NULL, seen_at REAL NOT NULL);
+        ''')
+        self.conn.commit()
+
+
+    """
+    Loads the "pubStartDate" watermark of every keyword.
+    """
+    def load_watermarks(self) -> dict:
+        return dict(self.conn.execute('SELECT keyword, timestamp FROM watermarks'))
+
+
+    """
+    Loads the dedupe index, without the entries that left the window while we were not running.
+    """
+    def load_seen(self, window) -> SeenIndex:
+        seen = SeenIndex(window)
+        for cve_id, seen_at in self.conn.execute('SELECT cve_id, seen_at FROM seen WHERE seen_at >= ?', (time.time() - window,)):
+            seen.entries[cve_id] = seen_at
+        return seen
+
+
+    """
+    Loads the fingerprints of the update tracking (--track-updates).
+    """
+    def load_fingerprints(self, window) -> FingerprintIndex:
+        fingerprints = FingerprintIndex(window)
+        for cve_id, fingerprint, score, seen_at in self.conn.execute('SELECT cve_id, fingerprint, score, seen_at FROM fingerprints WHERE seen_at >= ?', (time.time() - window,)):
+            fingerprints.entries[cve_id] = (fingerprint, score, seen_at)
+        return fingerprints
+
+
+    """
+    Writes the watermarks and the new dedupe entries (and fingerprints) in one transaction, so a crash never leaves a
+    watermark that is ahead of the CVEs we remember.
+    """
+    def save(self, watermarks, seen, fingerprints=None) -> None:
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO watermarks (keyword, timestamp) VALUES (?, ?)', watermarks.items())
+            self.conn.executemany('INSERT OR REPLACE INTO seen (cve_id, seen_at) VALUES (?, ?)', [(cve_id, seen.entries[cve_id]) for cve_id in seen.dirty])
+            self.conn.execute('DELETE FROM seen WHERE seen_at < ?', (time.time() - seen.window,))
+
+            if fingerprints is not None:
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO fingerprints (cve_id, fingerprint, score, seen_at) VALUES (?, ?, ?, ?)',
+                    [(cve_id, *fingerprints.entries[cve_id]) for cve_id in fingerprints.dirty]
+                )
+                self.conn.execute('DELETE FROM fingerprints WHERE seen_at < ?', (time.time() - fingerprints.window,))
+
+        seen.dirty.clear()
+        if fingerprints is not None:
+            fingerprints.dirty.clear()
+
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import codecs
+import json
+
+
+class StreamingPage:
+
+    # Bytes read from the socket at once. The records are a few KB each, so this holds a couple of them at most.
+    chunk_size = 64 * 1024
+
+    def __init__(self, chunks, key='vulnerabilities', response=None):
+        # "key" is the array the records are streamed from. Anything else with a big array works as well (the SBOMs of
+        # core.watchlist stream their "components" or "packages").
+        self.key = key
+        self.chunks = iter(chunks)
+        self.response = response # Closed by close(), so a page we stop reading gives its connection back to the pool
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.finished = False
+
+        try:
+            self.header = self.read_header()
+        except Exception:
+            self.close()
+            raise
+
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.iter_content(chunk_size=cls.chunk_size), response=response)
+
+
+    """
+    Releases the body of a page, read or not. The pager calls this on every page it is done with, including the ones it
+    abandons after an error: the transport's connection pool blocks when it is empty, so a page that is never released
+    would keep its connection for good. Closing twice is fine.
+    """
+    def close(self) -> None:
+        self.finished = True
+
+        # The chunks of a cached page are a generator, closing it also cleans up its half written cache file
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+        if self.response is not None:
+            self.response.close()
+
+
+    """
+    Reads more data from the body into the buffer. Returns False once the body is exhausted.
+    """
+    def read_more(self) -> bool:
+        if self.finished:
+            return False
+
+        # Throwing away what we already parsed, otherwise the buffer would grow to the size of the whole page
+        if self.position:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.buffer += self.decoder.decode(b'', final=True)
+            self.finished = True
+            return False
+
+        self.buffer += self.decoder.decode(chunk)
+        return True
+
+
+    """
+    Parses everything before the "vulnerabilities" array ("resultsPerPage", "startIndex", "totalResults", ...). NVD always sends
+    those keys first, so we know the paging information before reading a single record.
+    """
+    def read_header(self) -> dict:
+        marker = f'"{self.key}"'
+
+        while marker not in self.buffer:
+            if not self.read_more():
+                # No such key at all (error page, etc.), so the body is small enough to parse it normally
+                self.position = len(self.buffer)
+                return json.loads(self.buffer) if self.buffer.strip() else {}
+
+        index = self.buffer.index(marker)
+        header = self.buffer[:index].rstrip().rstrip(',') + '}'
+
+        # Moving to the opening bracket of the array
+        while '[' not in self.buffer[index:]:
+            if not self.read_more():
+                raise json.JSONDecodeError(f'Truncated "{self.key}" array', self.buffer, len(self.buffer))
+            index = self.buffer.index(marker)
+
+        self.position = self.buffer.index('[', index) + 1
+        return json.loads(header)
+
+
+    """
+    Yields the records of the array one at a time.
+    """
+    def __iter__(self):
+        while True:
+            # Skipping the separators between two records
+            while True:
+                while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n,':
+                    self.position += 1
+                if self.position < len(self.buffer) or not self.read_more():
+                    break
+
+            if self.position >= len(self.buffer) or self.buffer[self.position] == ']':
+                # Reading the few bytes after the array, so the connection goes back to the pool (and a cached body is complete)
+                while self.read_more():
+                    pass
+                return
+
+            try:
+                record, end = self.json.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # The record is cut in half by the chunk boundary, reading more and trying again
+                if not self.read_more():
+                    raise
+                continue
+
+            self.position = end
+            yield record
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import zlib
+
+from core.applicability import Inventory, Match
+from core.colors import Colors
+from core.metrics import Metrics, NullMetrics, SnapshotWriter
+from core.orbit import Orbit
+from core.async_orbit import AsyncOrbit
+from core.query import QuerySpec
+from core.record import CveRecord
+from core.render import HumanRenderer, NullRenderer
+from core.retry import RetryPolicy
+from core.state import SeenIndex, StateStore
+from core.transport import Transport
+
+
+class QueueWriter:
+
+    """
+    Stands in for the JsonlWriter inside a shard: the new records of a cycle go to the supervisor instead of a file.
+    """
+    def __init__(self, results, shard):
+        self.results = results
+        self.shard = shard
+
+    def write_many(self, records) -> None:
+        self.results.put((self.shard, list(records)))
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+"""
+Entry point of a shard process: a normal orbit over its part of the keywords, sharing the NVD quota with the other shards
+through the shared rate limiter. Printing is left to the supervisor, the shard only talks on its output in debug mode.
+"""
+def run_shard(shard, keywords, filters, options, rate_limiter, results) -> None:
+    if not options['DEBUG']:
+        sys.stdout = open(os.devnull, 'w')
+
+    retry_policy = RetryPolicy(max_retries=options['retries'], read_timeout=options['timeout'])
+    transport = Transport(api_key=options['api_key'], rate_limiter=rate_limiter, retry_policy=retry_policy, pool_size=options['pool_size'])
+
+    # Every shard keeps its own watermarks. The keywords are assigned by a stable hash, so a restarted shard resumes its own keywords.
+    state = None
+    if options['state_file']:
+        state = StateStore(f'{options["state_file"]}.shard{shard}')
+
+    if options['concurrency'] > 1:
+        orbit = AsyncOrbit(transport=transport, concurrency=options['concurrency'], strategy='keyword', state=state, dedupe_window=options['dedupe_window'])
+    else:
+        orbit = Orbit(transport=transport, strategy='keyword', state=state, dedupe_window=options['dedupe_window'])
+
+    if options.get('base_url'):
+        orbit.base_url = options['base_url']
+    if options.get('track_updates'):
+        orbit.track_updates()
+    if options.get('inventory'):
+        orbit.inventory = Inventory.from_files(options['inventory'])
+        orbit.only_affected = options.get('only_affected', False)
+    orbit.renderer = NullRenderer()
+    orbit.writer = QueueWriter(results, shard)
+
+    # The metrics of a shard can't be served next to the others, every shard writes its own snapshot file instead
+    snapshots = None
+    if options.get('metrics_file'):
+        orbit.metrics = transport.metrics = Metrics()
+        snapshots = SnapshotWriter(orbit.metrics, f'{options["metrics_file"]}.shard{shard}', options.get('metrics_interval', 60))
+        snapshots.start()
+
+    try:
+        orbit.continuous_monitoring(QuerySpec(tuple(keywords), (), filters), options['update_period'], options['request_limit'], SAVE_TO_JSON=True, DEBUG=options['DEBUG'], tiers=options.get('tiers'))
+    finally:
+        orbit.close()
+        if snapshots is not None:
+            snapshots.close()
+
+
+class Supervisor:
+
+    # A crashed shard is restarted after this many seconds, doubling up to the maximum while it keeps crashing. A shard
+    # running longer than the maximum counts as stable again and starts over from the first delay on its next crash.
+    restart_delay = 5.0
+    max_restart_delay = 300.0
+
+    def __init__(self, shards, rate_limiter, options, state=None, dedupe_window=30 * 24 * 3600):
+        # "options" are the settings every shard builds its transport and orbit from (see run_shard()). "rate_limiter" must be
+        # a core.ratelimit.SharedRateLimiter, so all the shards together stay inside the NVD quota.
+        self.shards = max(1, int(shards))
+        self.rate_limiter = rate_limiter
+        self.options = options
+        self.colors = Colors()
+        self.results = multiprocessing.Queue()
+        self.processes = {}
+        self.restarts = {}
+        self.started = {}
+
+        # The single writer: a CVE matching keywords of several shards is only printed, written and alerted once
+        self.state = state
+        self.seen_cve_ids = state.load_seen(dedupe_window) if state is not None else SeenIndex(dedupe_window)
+        self.renderer = HumanRenderer()
+        self.writer = None
+        self.alerts = None
+        self.metrics = NullMetrics() # The records after the dedupe across shards and the restarts
+
+
+    """
+    Assigns every keyword to a shard. CRC32 instead of hash(), which changes between runs, so a keyword always lands in the
+    same shard (and finds its watermark again) as long as the amount of shards stays the same.
+    """
+    def split(self, keywords) -> list:
+        shards = [[] for _ in range(self.shards)]
+        for keyword in keywords:
+            shards[zlib.crc32(keyword.lower().encode('utf-8')) % self.shards].append(keyword)
+        return shards
+
+
+    """
+    The part of the --limit-requests budget a shard gets, in proportion to its keywords. Handing every shard the whole
+    budget would poll N times as often as configured.
+    """
+    def request_limit(self, shard) -> int:
+        total = sum(len(keywords) for keywords, _ in self.assignments)
+        share = self.options['request_limit'] * len(self.assignments[shard][0]) / total if total else 0
+        return max(1, round(share))
+
+
+    def start(self, shard) -> None:
+        keywords, filters = self.assignments[shard]
+        options = dict(self.options, request_limit=self.request_limit(shard))
+        process = multiprocessing.Process(
+            target=run_shard,
+            args=(shard, keywords, filters, options, self.rate_limiter, self.results),
+            name=f'orbit-shard-{shard}',
+            daemon=True
+        )
+        process.start()
+        self.processes[shard] = process
+        self.started[shard] = time.monotonic()
+
+
+    """
+    Restarts the shards that died. Their watermarks are in their state file, so they pick up where they crashed.
+    A shard that ran for longer than max_restart_delay before crashing starts over from the first delay.
+    """
+    def check(self, DEBUG=False) -> None:
+        now = time.monotonic()
+
+        for shard, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+
+            delay, restart_at = self.restarts.get(shard, (self.restart_delay / 2, None))
+            if restart_at is None:
+                if now - self.started.get(shard, now) > self.max_restart_delay:
+                    delay = self.restart_delay / 2 # It ran stably before crashing, back to the first delay
+                delay = min(delay * 2, self.max_restart_delay)
+                self.restarts[shard] = (delay, now + delay)
+                print(self.colors.red(f'[ERR] Shard {shard} stopped (exit code {process.exitcode}), restarting it in {delay:.0f} seconds'))
+            elif now >= restart_at:
+                self.restarts[shard] = (delay, None)
+                self.start(shard)
+                self.metrics.inc('cveorbit_shard_restarts_total', shard=str(shard))
+                if DEBUG:
+                    print(self.colors.light_yellow(f'[DBG] Restarted shard {shard} (pid {self.processes[shard].pid})'))
+
+
+    """
+    Dedupes, prints, writes and alerts one batch of records coming from a shard.
+    """
+    def handle(self, shard, batch) -> None:
+        records = []
+        for data in batch:
+            # A rescored CVE was seen before, its modification date tells the versions apart
+            key = data['CVE ID'] if data.get('Event') in (None, 'new') else f'{data["CVE ID"]}@{data["Last Modified"]}'
+            if key in self.seen_cve_ids:
+                continue
+            self.seen_cve_ids.add(key)
+            records.append(CveRecord.from_dict(data))
+
+        self.metrics.inc('cveorbit_records_total', len(records), result='new')
+        self.metrics.inc('cveorbit_records_total', len(batch) - len(records), result='duplicate')
+        self.metrics.set('cveorbit_seen_cves', len(self.seen_cve_ids))
+
+        if not records:
+            return
+
+        self.renderer.header(f'shard {shard}', len(records))
+        for record in records:
+            self.renderer.record(record)
+            if self.alerts is not None:
+                self.alerts.submit(record)
+        self.renderer.flush()
+
+        # The shards check the CVEs against the inventory, printing what they found is up to us
+        for record in records:
+            for item in record.affects or []:
+                print(self.colors.blue(f'[INF] {Match(record.cve_id, item["Asset"], item["Product"], item["Version"], item["Constraint"])}'))
+
+        if self.writer is not None:
+            self.writer.write_many(record.to_dict() for record in records)
+
+        self.seen_cve_ids.evict()
+        if self.state is not None:
+            self.state.save({}, self.seen_cve_ids)
+
+
+    def drain(self) -> None:
+        while True:
+            try:
+                self.handle(*self.results.get_nowait())
+            except queue.Empty:
+                return
+
+
+    def run(self, spec, DEBUG=False) -> None:
+        self.assignments = [(keywords, spec.filters) for keywords in self.split(spec.keywords)]
+
+        for shard, (keywords, _) in enumerate(self.assignments):
+            if keywords:
+                self.start(shard)
+                if DEBUG:
+                    print(self.colors.light_yellow(f'[DBG] Shard {shard} (pid {self.processes[shard].pid}) watches {len(keywords)} keyword(s)'))
+
+        try:
+            while True:
+                try:
+                    self.handle(*self.results.get(timeout=1.0))
+                except queue.Empty:
+                    pass
+                self.check(DEBUG)
+
+        except KeyboardInterrupt:
+            # Ctrl+C reaches the shards as well, they save their state and exit on their own
+            deadline = time.monotonic() + 10
+            for process in self.processes.values():
+                while process.is_alive() and time.monotonic() < deadline:
+                    self.drain() # A shard can't exit while its last records are stuck in the queue
+                    process.join(0.2)
+                if process.is_alive():
+                    process.terminate()
+            self.drain()
+
+            if self.alerts is not None:
+                self.alerts.close()
+            if self.writer is not None:
+                self.writer.close()
+            if self.state is not None:
+                self.state.save({}, self.seen_cve_ids)
+                self.state.close()
+            print(self.colors.blue(f'\n[INF] You aborted the fetching process. Exiting...'))
+            sys.exit(0)
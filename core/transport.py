@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.colors import Colors
+from core.metrics import NullMetrics
+from core.ratelimit import RateLimiter
+from core.retry import RetryPolicy
+from core.stream import StreamingPage
+
+
+class Transport:
+
+    def __init__(self, api_key=None, rate_limiter=None, retry_policy=None, pool_size=10, cache=None):
+        self.colors = Colors()
+        self.cache = cache # A core.cache.ResponseCache, the search mode sets it so repeated queries don't go to NVD again
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter.for_api_key(api_key)
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.requests_sent = 0
+        self.metrics = NullMetrics() # Replaced by a core.metrics.Metrics when the orbit exports its metrics
+
+        # One session for the whole run: the TCP+TLS connection to NVD is opened once and then kept alive and reused.
+        # "pool_size" should be at least the amount of worker threads, otherwise connections get thrown away under load.
+        # The pool does not block when it runs empty, it opens one more connection and drops it afterwards. requests gives
+        # urllib3 no pool timeout, so a blocking pool would wait forever for a connection that is never given back, before
+        # the retry policy, the circuit breaker or the request timeouts even see the request. The streamed pages give theirs
+        # back through StreamingPage.close(), the non blocking pool is what keeps a page we missed from hanging the orbit.
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.80 Safari/537.36',
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip, deflate', # NVD pages compress really well
+            'Connection': 'keep-alive'
+        })
+        if api_key:
+            self.session.headers['apiKey'] = api_key
+
+
+    """
+    Sends one GET request. Waiting for the rate limiter here means every retry is counted against the quota as well.
+    """
+    def send(self, url, timeout, DEBUG=False, stream=False, headers=None):
+        # Waiting for the rate limiter, this keeps us inside the NVD quota instead of running into 403/429 responses
+        waited = self.rate_limiter.acquire()
+        if DEBUG and waited:
+            print(self.colors.light_yellow(f'[DBG] Rate limiter delayed the request by {waited:.2f} seconds'))
+
+        self.requests_sent += 1
+        try:
+            response = self.session.get(url, timeout=timeout, stream=stream, headers=headers)
+        except requests.exceptions.RequestException:
+            self.metrics.inc('cveorbit_requests_total', status='error')
+            raise
+
+        self.metrics.inc('cveorbit_requests_total', status=str(response.status_code))
+        return response
+
+
+    """
+    GET request with the retry policy around it. Returns the response, HTTP errors that are not retried are left to the caller.
+    """
+    def get(self, url, DEBUG=False):
+        return self.retry_policy.call(lambda timeout: self.send(url, timeout, DEBUG), DEBUG)
+
+
+    def get_json(self, url, DEBUG=False) -> dict:
+        if self.cache is not None:
+            return json.loads(b''.join(self.get_cached(url, DEBUG)))
+
+        response = self.get(url, DEBUG)
+        response.raise_for_status()
+        return response.json()
+
+
+    """
+    Same as get_json() but the body is not read yet. The returned page parses the records one at a time while they come in.
+    """
+    def get_stream(self, url, DEBUG=False) -> StreamingPage:
+        if self.cache is not None:
+            return StreamingPage(self.get_cached(url, DEBUG))
+
+        response = self.retry_policy.call(lambda timeout: self.send(url, timeout, DEBUG, stream=True), DEBUG)
+        response.raise_for_status()
+        return StreamingPage.from_response(response)
+
+
+    """
+    Returns the body of a URL as chunks, from the cache if we have a fresh copy. A stale copy is revalidated with
+    If-None-Match/If-Modified-Since when the server gave us an ETag or Last-Modified header, a 304 costs no body at all.
+    Everything else is fetched and written to the cache while it streams through.
+    """
+    def get_cached(self, url, DEBUG=False):
+        entry = self.cache.lookup(url)
+        headers = None
+
+        if entry is not None:
+            if self.cache.is_fresh(entry):
+                try:
+                    chunks = self.cache.open_body(url, entry)
+                    self.cache.count('hits')
+                    if DEBUG:
+                        print(self.colors.light_yellow(f'[DBG] Cache hit: [{url}]'))
+                    return chunks
+                except OSError:
+                    entry = None # Evicted in the meantime
+
+            if entry is not None:
+                headers = self.cache.conditional_headers(entry) or None
+
+        response = self.retry_policy.call(lambda timeout: self.send(url, timeout, DEBUG, stream=True, headers=headers), DEBUG)
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            try:
+                chunks = self.cache.open_body(url, entry)
+                self.cache.refresh(url)
+                self.cache.count('revalidated')
+                if DEBUG:
+                    print(self.colors.light_yellow(f'[DBG] Cache revalidated: [{url}]'))
+                return chunks
+            except OSError:
+                # The body is gone, asking again without the validators
+                response = self.retry_policy.call(lambda timeout: self.send(url, timeout, DEBUG, stream=True), DEBUG)
+
+        response.raise_for_status()
+        self.cache.count('misses')
+        if DEBUG:
+            print(self.colors.light_yellow(f'[DBG] Cache miss: [{url}]'))
+        return self.release(self.cache.store_chunks(url, response.iter_content(chunk_size=StreamingPage.chunk_size), response.headers), response)
+
+
+    """
+    Passes the chunks of a response through and closes the response once the caller is done with them, whether it read
+    them to the end or closed them early (see StreamingPage.close()).
+    """
+    @staticmethod
+    def release(chunks, response):
+        try:
+            yield from chunks
+        finally:
+            response.close()
+
+
+    """
+    Connection reuse statistics, read from the urllib3 pools behind the session.
+    """
+    def stats(self) -> dict:
+        connections = 0
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+
+        return {
+            'requests': self.requests_sent,
+            'connections': connections,
+            'reused': max(0, self.requests_sent - connections)
+        }
+
+
+    def print_stats(self) -> None:
+        stats = self.stats()
+        print(self.colors.light_yellow(f'[DBG] Transport: {stats["requests"]} request(s) over {stats["connections"]} connection(s), {stats["reused"]} reused'))
+        if self.cache is not None:
+            cache = self.cache.stats()
+            print(self.colors.light_yellow(f'[DBG] Cache: {cache["hits"]} hit(s), {cache["revalidated"]} revalidated, {cache["misses"]} miss(es)'))
+
+
+    def close(self) -> None:
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from itertools import combinations
+
+from core.stream import StreamingPage
+
+
+# CSV columns we take the terms from, the first one found wins. A CPE says the most, a plain name the least.
+CPE_COLUMNS = ('cpe', 'cpe23', 'cpe_name', 'cpe name')
+KEYWORD_COLUMNS = ('keyword', 'keywords', 'term', 'query')
+VENDOR_COLUMNS = ('vendor', 'manufacturer', 'publisher', 'supplier')
+PRODUCT_COLUMNS = ('product', 'product name', 'product_name', 'name', 'software', 'application', 'component', 'package')
+
+# "1.2.3", "v2.4", "1.1.1k", "9.0.50-rc1": inventories love to append versions, NVD descriptions rarely have them next to
+# the name. Only numbers with a letter or a release suffix, so names like "7-zip", "3com" or "v8" are not versions.
+VERSION = re.compile(r'^(v\d+(\.\d+)+|\d+(\.\d+)*)[a-z]?([._-]?(alpha|beta|rc|pre|dev|build|snapshot|final|ga|sp|update|u|p|r)\d*)*$')
+
+# Terms with more words are only checked against single words and pairs, 2^n subsets add up quickly
+MAX_SUBSET_WORDS = 8
+
+
+"""
+The vendor and product of a CPE (2.3 "cpe:2.3:a:apache:tomcat:9.0.1:..." or 2.2 "cpe:/a:apache:tomcat:9.0.1") as one term.
+"""
+def cpe_term(cpe) -> str:
+    if cpe.startswith('cpe:2.3:'):
+        parts = cpe.split(':')[3:5]
+    elif cpe.startswith('cpe:/'):
+        parts = cpe[5:].split(':')[1:3]
+    else:
+        return ''
+
+    parts = [part.replace('_', ' ').replace('\\', '') for part in parts if part not in ('', '*', '-')]
+    # "openssl:openssl" is one word, "apache:http_server" two
+    if len(parts) == 2 and parts[1].startswith(parts[0]):
+        parts = parts[1:]
+    return ' '.join(parts)
+
+
+"""
+Lower case, single spaces and no version numbers, so "Apache  Tomcat 9.0.50" and "apache tomcat" are the same term. A term
+made of nothing but version-looking words ("v8") is a name and stays as it is.
+"""
+def normalize(term) -> str:
+    words = term.lower().split()
+    return ' '.join([word for word in words if not VERSION.match(word)] or words)
+
+
+def text_terms(f):
+    for line in f:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            yield line
+
+
+def csv_terms(f):
+    sample = f.read(64 * 1024)
+    f.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.reader(f, dialect)
+    first = next(reader, [])
+    header = [column.strip().lower() for column in first]
+
+    def find(names):
+        return next((header.index(name) for name in names if name in header), None)
+
+    cpe, keyword, vendor, product = find(CPE_COLUMNS), find(KEYWORD_COLUMNS), find(VENDOR_COLUMNS), find(PRODUCT_COLUMNS)
+    if cpe is None and keyword is None and product is None:
+        # No header we know, the first column is the term (and the first row is one too)
+        if first:
+            yield first[0]
+        yield from (row[0] for row in reader if row)
+        return
+
+    def cell(row, index):
+        return row[index].strip() if index is not None and index < len(row) else ''
+
+    for row in reader:
+        if cell(row, cpe):
+            yield cpe_term(cell(row, cpe))
+        elif cell(row, keyword):
+            yield cell(row, keyword)
+        elif cell(row, product):
+            name = cell(row, product)
+            maker = cell(row, vendor)
+            # "Microsoft" + "Microsoft Exchange Server" should not become "microsoft microsoft exchange server"
+            yield name if not maker or name.lower().startswith(maker.lower()) else f'{maker} {name}'
+
+
+"""
+The term of a CycloneDX component or a SPDX package: its CPE if it has one and its name otherwise.
+"""
+def component_term(component) -> str:
+    cpe = component_cpe(component)
+    return (cpe_term(cpe) if cpe else '') or component.get('name', '')
+
+
+def component_cpe(component):
+    return component.get('cpe') or next(
+        (ref.get('referenceLocator') for ref in component.get('externalRefs', []) if ref.get('referenceType', '').startswith('cpe')),
+        None
+    )
+
+
+"""
+Streams the components of a CycloneDX JSON SBOM (nested ones included) or the packages of a SPDX JSON document.
+"""
+def sbom_components(path):
+    with open(path, 'rb') as f:
+        head = f.read(64 * 1024).decode('utf-8', errors='ignore')
+
+    # SPDX lists "packages", CycloneDX "components". The records are streamed from the file like the NVD pages.
+    key = 'packages' if '"spdxVersion"' in head else 'components'
+
+    def chunks():
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(StreamingPage.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    try:
+        items = iter(StreamingPage(chunks(), key))
+    except json.JSONDecodeError:
+        # A "components" array inside the metadata (CycloneDX 1.5 tools) comes before the real one, parsing it as a whole
+        with open(path, encoding='utf-8') as f:
+            items = iter(json.load(f).get(key, []))
+
+    def flatten(component):
+        yield component
+        for child in component.get('components', []):
+            yield from flatten(child)
+
+    for item in items:
+        yield from flatten(item)
+
+
+def json_terms(path):
+    for component in sbom_components(path):
+        yield component_term(component)
+
+
+def xml_terms(path):
+    # CycloneDX XML. iterparse hands us one component at a time and clearing it keeps the memory flat.
+    def child(element, name):
+        for item in element:
+            if item.tag.rsplit('}', 1)[-1] == name:
+                return (item.text or '').strip()
+        return ''
+
+    for _, element in ElementTree.iterparse(path, events=('end',)):
+        if element.tag.rsplit('}', 1)[-1] != 'component':
+            continue
+        cpe = child(element, 'cpe')
+        yield (cpe_term(cpe) if cpe else '') or child(element, 'name')
+        element.clear()
+
+
+def spdx_terms(f):
+    # SPDX tag-value: a package starts with "PackageName:", its CPE is an "ExternalRef: SECURITY cpe23Type <cpe>" line
+    name = cpe = None
+    for line in f:
+        tag, _, value = line.partition(':')
+        value = value.strip()
+
+        if tag == 'PackageName':
+            if name is not None:
+                yield cpe_term(cpe) if cpe else name
+            name, cpe = value, None
+        elif tag == 'ExternalRef' and name is not None and value.split()[1:2] in (['cpe23Type'], ['cpe22Type']):
+            cpe = value.split()[2]
+
+    if name is not None:
+        yield cpe_term(cpe) if cpe else name
+
+
+class Watchlist:
+
+    def __init__(self):
+        # Only the distinct (normalized) terms are kept, in the order we found them, never the rows of the inventories
+        self.rows = 0
+        self.terms = {}
+
+
+    """
+    Reads the terms of a file. The format comes from the extension: .csv/.tsv, .json (CycloneDX or SPDX), .xml (CycloneDX),
+    .spdx (SPDX tag-value) and anything else is one term per line ("#" starts a comment).
+    """
+    def add_file(self, path) -> int:
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension == '.json':
+            return self.add(json_terms(path))
+        if extension == '.xml':
+            return self.add(xml_terms(path))
+
+        with open(path, encoding='utf-8-sig', newline='' if extension in ('.csv', '.tsv') else None) as f:
+            if extension in ('.csv', '.tsv'):
+                return self.add(csv_terms(f))
+            if extension == '.spdx':
+                return self.add(spdx_terms(f))
+            return self.add(text_terms(f))
+
+
+    def add(self, terms) -> int:
+        added = 0
+        for term in terms:
+            self.rows += 1
+            term = normalize(term)
+            if len(term) > 1 and term not in self.terms:
+                self.terms[term] = None
+                added += 1
+        return added
+
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+
+"""
+Drops every term another term already covers. NVD matches a keyword when all of its words are in the description, so
+"apache" finds everything "apache tomcat" finds and the narrower term is only a wasted request. "keep" are terms that stay
+no matter what (the tiered keywords of the orbit). Returns the remaining terms, in their original order.
+"""
+def minimize(terms, keep=()) -> list:
+    keep = {normalize(term) for term in keep}
+    words = {term: frozenset(normalize(term).split()) for term in terms}
+    kept = set()
+    result = set()
+
+    # The broad terms first, they are the ones covering the others
+    for term in sorted(words, key=lambda term: len(words[term])):
+        term_words = words[term]
+        if normalize(term) in keep:
+            kept.add(term_words)
+            result.add(term)
+            continue
+        if not term_words:
+            continue
+
+        sizes = range(1, len(term_words)) if len(term_words) <= MAX_SUBSET_WORDS else range(1, 3)
+        covered = term_words in kept or any(frozenset(subset) in kept for size in sizes for subset in combinations(term_words, size))
+
+        if not covered:
+            kept.add(term_words)
+            result.add(term)
+
+    return [term for term in terms if term in result]
@@ -4,17 +4,243 @@ from core.parser import parse_args
 from core.colors import banner, Colors
 from core.search import Fetcher
 from core.orbit import Orbit
+from core.async_orbit import AsyncOrbit
+from core.mirror import Mirror
+from core.ratelimit import RateLimiter, SharedRateLimiter
+from core.retry import RetryPolicy
+from core.transport import Transport
+from core.state import StateStore
+from core.jsonl import JsonlWriter
+from core.export import convert, read_json_output
+from core.index import CveIndex, QuerySyntaxError
+from core.alerts import AlertDispatcher, channels_from_args
+from core.render import JsonlRenderer, get_renderer
+from core.query import QuerySpec
+from core.cache import ResponseCache
+from core.supervisor import Supervisor
+from core.metrics import Metrics, MetricsServer, SnapshotWriter
+from core.scheduler import parse_tiers
+from core.watchlist import Watchlist, minimize, normalize
+from core.applicability import Inventory
+import json
 import os
 import sys
+import time
 from datetime import datetime
 
+"""
+Reads the watchlist files into the keywords. The terms are normalized and deduplicated while the files are streamed, then
+the ones a broader term covers are dropped, so the requests grow with the distinct products and not with the rows.
+"""
+def load_watchlist(args, color, keep=()) -> None:
+    watchlist = Watchlist()
+    for path in args.watchlist:
+        try:
+            added = watchlist.add_file(path)
+        except (OSError, ValueError, SyntaxError) as e: # SyntaxError is what ElementTree raises for broken XML
+            print(color.light_red(f'[ERR] Could not read the watchlist {path}: {e}'))
+            sys.exit(1)
+        if args.debug:
+            print(color.light_yellow(f'[DBG] {path}: {added} new term(s)'))
+
+    # The -fkey spelling wins over the normalized one of the watchlist
+    keywords = {}
+    for keyword in (args.filter_keywords or []) + list(watchlist.terms):
+        keywords.setdefault(normalize(keyword), keyword)
+    keywords = list(keywords.values())
+    if not args.no_minimize:
+        # Only the watchlist terms are minimized, the -fkey keywords and the tiers were asked for explicitly
+        keywords = minimize(keywords, list(keep) + (args.filter_keywords or []))
+
+    print(color.blue(f'[INF] Watchlist: {watchlist.rows} row(s), {len(watchlist)} distinct term(s), {len(keywords)} keyword(s) to query'))
+    args.filter_keywords = keywords
+
+
+"""
+Reads the asset inventories the CVEs are checked against, or exits if one of them can't be read.
+"""
+def load_inventory(paths, color, DEBUG=False) -> Inventory:
+    inventory = Inventory()
+    for path in paths:
+        try:
+            added = inventory.add_file(path)
+        except (OSError, ValueError, SyntaxError) as e: # SyntaxError is what ElementTree raises for broken XML
+            print(color.light_red(f'[ERR] Could not read the inventory {path}: {e}'))
+            sys.exit(1)
+        if DEBUG:
+            print(color.light_yellow(f'[DBG] {path}: {added} item(s)'))
+
+    print(color.blue(f'[INF] Inventory: {len(inventory)} item(s) on {len(inventory.assets)} asset(s)'))
+    return inventory
+
+
+"""
+Turns the filter arguments into a query spec, or exits if they make no sense (half a date range, unknown severity, ...).
+"""
+def build_spec(args, color, keep=()) -> QuerySpec:
+    if getattr(args, 'watchlist', None):
+        load_watchlist(args, color, keep)
+
+    try:
+        spec = QuerySpec.from_args(args)
+    except ValueError as e:
+        print(color.light_red(f'[ERR] {e}'))
+        sys.exit(1)
+
+    if not spec.keywords and not spec.cve_ids:
+        print(color.light_red('[ERR] Nothing to search for. Give some keywords (-fkey) or CVE IDs (-fid).'))
+        sys.exit(1)
+
+    return spec
+
+
 def main():
 
     # Initializing some classes
     args = parse_args()
     color = Colors()
-    fetch = Fetcher()
-    orbit = Orbit()
+
+    # The converter works on local files only, no need for the NVD transport
+    if args.Mode == 'convert':
+        if args.silent:
+            sys.stdout = open(os.devnull, 'w')
+
+        try:
+            count = convert(args.input, args.output_file, args.format)
+        except (OSError, RuntimeError, ValueError, KeyError) as e:
+            print(color.light_red(f'[ERR] An error occured while converting: {e}'))
+            sys.exit(1)
+
+        print(color.blue(f'[INF] Converted {count} CVEs into {args.output_file}'))
+        return
+
+    # The inverted index works on local files only as well
+    if args.Mode == 'index':
+        if args.silent:
+            sys.stdout = open(os.devnull, 'w')
+
+        index = CveIndex(args.index)
+        start = time.perf_counter()
+        try:
+            for source in args.input:
+                count = index.add(read_json_output(source))
+                if args.debug:
+                    print(color.light_yellow(f'[DBG] Indexed {count} new or updated CVE(s) from {source}'))
+        except (OSError, ValueError, KeyError) as e:
+            print(color.light_red(f'[ERR] An error occured while indexing: {e}'))
+            sys.exit(1)
+        finally:
+            total = len(index)
+            index.close()
+
+        print(color.blue(f'[INF] {args.index} holds {total} CVEs (indexed in {time.perf_counter() - start:.2f} seconds)'))
+        return
+
+    if args.Mode == 'query':
+        if not os.path.exists(args.index):
+            print(color.light_red(f'[ERR] No index found at {args.index}. Run the "index" mode first.'))
+            sys.exit(1)
+
+        renderer = get_renderer(args.render, args.silent)
+        index = CveIndex(args.index)
+        start = time.perf_counter()
+        try:
+            records = index.search(args.query, limit=args.limit, min_severity=args.min_severity, sort=args.sort)
+        except QuerySyntaxError as e:
+            print(color.light_red(f'[ERR] Invalid query: {e}'))
+            sys.exit(1)
+        finally:
+            index.close()
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if args.debug:
+            print(color.light_yellow(f'[DBG] Query answered in {elapsed:.1f} ms'))
+
+        renderer.header(args.query, len(records))
+        for record in records:
+            renderer.record(record)
+        renderer.flush()
+        return
+
+    # Checking the inventory against the local mirror, no request will be sent to NVD either
+    if args.Mode == 'match':
+        if args.silent:
+            sys.stdout = open(os.devnull, 'w')
+
+        if not os.path.exists(args.mirror):
+            print(color.light_red(f'[ERR] No local mirror found at {args.mirror}. Run the "sync" mode first.'))
+            sys.exit(1)
+
+        inventory = load_inventory(args.inventory, color, args.debug)
+        mirror = Mirror(args.mirror)
+        start = time.perf_counter()
+        checked = 0
+        matches = []
+
+        # One index per batch of the mirror, the whole inventory is checked against it in one go
+        try:
+            for batch in mirror.documents(args.modified_since):
+                checked += len(batch)
+                for match in inventory.match(batch):
+                    print(color.blue(f'[INF] {match}'))
+                    matches.append(match)
+                if args.debug:
+                    print(color.light_yellow(f'[DBG] Checked {checked} CVEs so far'))
+        except KeyboardInterrupt:
+            print(color.blue('[INF] You aborted the matching. Exiting...'))
+            sys.exit(0)
+        finally:
+            mirror.close()
+
+        print(color.blue(f'[INF] Checked {checked} CVEs in {time.perf_counter() - start:.2f} seconds: {len(matches)} match(es) on {len({match.asset for match in matches})} asset(s)'))
+
+        if args.output and matches:
+            file_name = f'cveorbit_affected_{datetime.now().strftime("%Y%m%d%H%M%S")}.json'
+            with open(file_name, 'w') as f:
+                json.dump([{'CVE ID': match.cve_id, **match.to_dict()} for match in matches], f, indent=4)
+            print(color.blue(f'[INF] Successfully exported the affected assets to {file_name}'))
+        return
+
+    # One rate limiter for everything, so the search and orbit requests share the same NVD quota
+    api_key = args.api_key or os.environ.get('NVD_API_KEY')
+    rate_limiter = RateLimiter.for_api_key(api_key)
+
+    # Same for the retry policy, if NVD is down the circuit breaker stops both from sending requests
+    retry_policy = RetryPolicy(max_retries=args.retries, read_timeout=args.timeout)
+
+    # And one pooled session, so the connection to NVD is kept alive between the requests.
+    # Every date window in flight streams its pages over its own connections, so the pool grows with the window workers.
+    concurrency = getattr(args, 'concurrency', 1)
+    window_workers = max(1, getattr(args, 'window_workers', 2))
+    transport = Transport(api_key=api_key, rate_limiter=rate_limiter, retry_policy=retry_policy, pool_size=max(args.pool_size, window_workers * (getattr(args, 'workers', 4) + 1), concurrency))
+
+    fetch = Fetcher(transport=transport, max_workers=getattr(args, 'workers', 4))
+    fetch.window_workers = window_workers
+
+    # The asyncio engine polls all keywords of a cycle concurrently, the plain one does them one after the other
+    strategy = getattr(args, 'strategy', 'keyword')
+
+    # The orbit state (watermarks + seen CVEs) is only needed in orbit mode
+    state = None
+    if args.Mode == 'orbit' and not args.no_state:
+        state = StateStore(args.state_file)
+    dedupe_window = getattr(args, 'dedupe_window', 30) * 24 * 3600
+
+    if concurrency > 1:
+        orbit = AsyncOrbit(transport=transport, concurrency=concurrency, strategy=strategy, state=state, dedupe_window=dedupe_window)
+    else:
+        orbit = Orbit(transport=transport, strategy=strategy, state=state, dedupe_window=dedupe_window)
+
+    # Picking the renderer once, the fetch loops only hand it the records
+    if args.Mode in ('search', 'orbit'):
+        renderer = get_renderer(args.render, args.silent)
+        fetch.renderer = renderer
+        orbit.renderer = renderer
+
+        # The JSON Lines stream owns stdout: the records keep it, the banner, the status lines and the spinner go to stderr
+        if isinstance(renderer, JsonlRenderer) and not args.silent:
+            renderer.stream = sys.stdout
+            sys.stdout = sys.stderr
 
     # Debug info
     g_DEBUG = args.debug
@@ -28,275 +254,60 @@ def main():
         if not args.silent:
             banner()
 
-        # Dicts for the names and filters
-        # Names are basically the vendors or products you would search for
-        # Filters are the filtering mechanism you can use to narrow down the search (refer to the -h flag)
-        names = { }
-        filters = { }
-
-        # Handling this mess
-        if args.output is False:
-
-            # Supplying only keywords
-            if args.filter_keywords and not any([
-                args.filter_id,
-                args.filter_severity_3,
-                args.filter_severity_4,
-                args.filter_last_modified_start_date,
-                args.filter_last_modified_end_date,
-                args.filter_published_start_date,
-                args.filter_published_end_date
-            ]):
-                print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}'))
-                
-                names['keywordSearch'] = args.filter_keywords
-                fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-
-            # Supplying keywords and filters
-            if args.filter_keywords:
-
-                # Only keywords and severity v3
-                if args.filter_severity_3 and not any([
-                    args.filter_severity_4,
-                    args.filter_last_modified_start_date,
-                    args.filter_last_modified_end_date,
-                    args.filter_published_start_date,
-                    args.filter_published_end_date
-                    ]):
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords} and severity: {args.filter_severity_3}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV3Severity'] = args.filter_severity_3
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-
-                # Only keywords and severity v4
-                if args.filter_severity_4 and not any([
-                    args.filter_severity_3,
-                    args.filter_last_modified_start_date,
-                    args.filter_last_modified_end_date,
-                    args.filter_published_start_date,
-                    args.filter_published_end_date
-                    ]):
-
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords} and severity: {args.filter_severity_4}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV4Severity'] = args.filter_severity_4
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-
-                # Only keywords and last modified date
-                if args.filter_last_modified_start_date and args.filter_last_modified_end_date and not any([
-                    args.filter_severity_3,
-                    args.filter_severity_4,
-                    args.filter_published_start_date,
-                    args.filter_published_end_date
-                    ]):
-
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords} and last modified date: {args.filter_last_modified_start_date} - {args.filter_last_modified_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['lastModStartDate'] = args.filter_last_modified_start_date
-                    filters['lastModEndDate'] = args.filter_last_modified_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-                
-
-                # Only keywords and last published date
-                if args.filter_published_start_date and args.filter_published_end_date and not any([
-                    args.filter_severity_3,
-                    args.filter_severity_4,
-                    args.filter_last_modified_start_date,
-                    args.filter_last_modified_end_date
-                    ]):
-
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords} and published date: {args.filter_published_start_date} - {args.filter_published_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['pubStartDate'] = args.filter_published_start_date
-                    filters['pubEndDate'] = args.filter_published_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-
-                #-------------------------------------------------------------#
-
-                # Keywords, severity v3 and last modified date
-                if args.filter_severity_3 and args.filter_last_modified_start_date and args.filter_last_modified_end_date:
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}, severity: {args.filter_severity_3} and last modified date: {args.filter_last_modified_start_date} - {args.filter_last_modified_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV3Severity'] = args.filter_severity_3
-                    filters['lastModStartDate'] = args.filter_last_modified_start_date
-                    filters['lastModEndDate'] = args.filter_last_modified_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-                
-                # Keywords, severity v3 and last published date
-                if args.filter_severity_3 and args.filter_published_start_date and args.filter_published_end_date:
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}, severity: {args.filter_severity_3} and published date: {args.filter_published_start_date} - {args.filter_published_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV3Severity'] = args.filter_severity_3
-                    filters['pubStartDate'] = args.filter_published_start_date
-                    filters['pubEndDate'] = args.filter_published_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-
-                # Keywords, severity v4 and last modified date
-                if args.filter_severity_4 and args.filter_last_modified_start_date and args.filter_last_modified_end_date:
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}, severity: {args.filter_severity_4} and last modified date: {args.filter_last_modified_start_date} - {args.filter_last_modified_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV4Severity'] = args.filter_severity_4
-                    filters['lastModStartDate'] = args.filter_last_modified_start_date
-                    filters['lastModEndDate'] = args.filter_last_modified_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-
-                # Keywords, severity v4 and last published date
-                if args.filter_severity_4 and args.filter_published_start_date and args.filter_published_end_date:
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}, severity: {args.filter_severity_4} and published date: {args.filter_published_start_date} - {args.filter_published_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV4Severity'] = args.filter_severity_4
-                    filters['pubStartDate'] = args.filter_published_start_date
-                    filters['pubEndDate'] = args.filter_published_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-                
-
-
-            if args.filter_id:
-                print(color.blue(f'[INF] Filtering with CVE-ID: {args.filter_id}'))
-                
-                names['cveId'] = args.filter_id
-                fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-
-                
-
-        elif args.output is True:
-
-            # Supplying only keywords
-            if args.filter_keywords and not any([
-                args.filter_id,
-                args.filter_severity_3,
-                args.filter_severity_4,
-                args.filter_last_modified_start_date,
-                args.filter_last_modified_end_date,
-                args.filter_published_start_date,
-                args.filter_published_end_date
-            ]):
-                print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}'))
-                
-                names['keywordSearch'] = args.filter_keywords
-                fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-
-            # Supplying keywords and filters
-            if args.filter_keywords:
-
-                # Only keywords and severity v3
-                if args.filter_severity_3 and not any([
-                    args.filter_severity_4,
-                    args.filter_last_modified_start_date,
-                    args.filter_last_modified_end_date,
-                    args.filter_published_start_date,
-                    args.filter_published_end_date
-                    ]):
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords} and severity: {args.filter_severity_3}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV3Severity'] = args.filter_severity_3
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-
-                # Only keywords and severity v4
-                if args.filter_severity_4 and not any([
-                    args.filter_severity_3,
-                    args.filter_last_modified_start_date,
-                    args.filter_last_modified_end_date,
-                    args.filter_published_start_date,
-                    args.filter_published_end_date
-                    ]):
-
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords} and severity: {args.filter_severity_4}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV4Severity'] = args.filter_severity_4
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-
-                # Only keywords and last modified date
-                if args.filter_last_modified_start_date and args.filter_last_modified_end_date and not any([
-                    args.filter_severity_3,
-                    args.filter_severity_4,
-                    args.filter_published_start_date,
-                    args.filter_published_end_date
-                    ]):
-
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords} and last modified date: {args.filter_last_modified_start_date} - {args.filter_last_modified_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['lastModStartDate'] = args.filter_last_modified_start_date
-                    filters['lastModEndDate'] = args.filter_last_modified_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-                
-
-                # Only keywords and last published date
-                if args.filter_published_start_date and args.filter_published_end_date and not any([
-                    args.filter_severity_3,
-                    args.filter_severity_4,
-                    args.filter_last_modified_start_date,
-                    args.filter_last_modified_end_date
-                    ]):
-
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords} and published date: {args.filter_published_start_date} - {args.filter_published_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['pubStartDate'] = args.filter_published_start_date
-                    filters['pubEndDate'] = args.filter_published_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-
-                #-------------------------------------------------------------#
-
-                # Keywords, severity v3 and last modified date
-                if args.filter_severity_3 and args.filter_last_modified_start_date and args.filter_last_modified_end_date:
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}, severity: {args.filter_severity_3} and last modified date: {args.filter_last_modified_start_date} - {args.filter_last_modified_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV3Severity'] = args.filter_severity_3
-                    filters['lastModStartDate'] = args.filter_last_modified_start_date
-                    filters['lastModEndDate'] = args.filter_last_modified_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-                
-                # Keywords, severity v3 and last published date
-                if args.filter_severity_3 and args.filter_published_start_date and args.filter_published_end_date:
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}, severity: {args.filter_severity_3} and published date: {args.filter_published_start_date} - {args.filter_published_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV3Severity'] = args.filter_severity_3
-                    filters['pubStartDate'] = args.filter_published_start_date
-                    filters['pubEndDate'] = args.filter_published_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-
-                # Keywords, severity v4 and last modified date
-                if args.filter_severity_4 and args.filter_last_modified_start_date and args.filter_last_modified_end_date:
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}, severity: {args.filter_severity_4} and last modified date: {args.filter_last_modified_start_date} - {args.filter_last_modified_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV4Severity'] = args.filter_severity_4
-                    filters['lastModStartDate'] = args.filter_last_modified_start_date
-                    filters['lastModEndDate'] = args.filter_last_modified_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-
-                # Keywords, severity v4 and last published date
-                if args.filter_severity_4 and args.filter_published_start_date and args.filter_published_end_date:
-                    print(color.blue(f'[INF] Filtering with keywords: {args.filter_keywords}, severity: {args.filter_severity_4} and published date: {args.filter_published_start_date} - {args.filter_published_end_date}'))
-                    
-                    names['keywordSearch'] = args.filter_keywords
-                    filters['cvssV4Severity'] = args.filter_severity_4
-                    filters['pubStartDate'] = args.filter_published_start_date
-                    filters['pubEndDate'] = args.filter_published_end_date
-                    fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-                
-
-
-            if args.filter_id:
-                print(color.blue(f'[INF] Filtering with CVE-ID: {args.filter_id}'))
-                
-                names['cveId'] = args.filter_id
-                fetch.fetch_cve_keywords(names, filters, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
+        fetch.export_format = args.format
+
+        # Repeated searches within the TTL are answered from the response cache
+        if not args.no_cache and not args.offline:
+            transport.cache = ResponseCache(args.cache_dir, ttl=args.cache_ttl, max_bytes=args.cache_size * 1024 * 1024)
+
+        # Serving the search from the local mirror, no request will be sent to NVD
+
+        if args.offline:
+            if not os.path.exists(args.mirror):
+                print(color.light_red(f'[ERR] No local mirror found at {args.mirror}. Run the "sync" mode first.'))
+                sys.exit(1)
+
+            print(color.blue(f'[INF] Offline mode: searching the local mirror {args.mirror}'))
+            fetch.mirror = Mirror(args.mirror)
+
+        if args.only_affected and not args.inventory:
+            print(color.light_red('[ERR] --only-affected needs an inventory (-inv)'))
+            sys.exit(1)
+        if args.inventory:
+            fetch.inventory = load_inventory(args.inventory, color, g_DEBUG)
+            fetch.only_affected = args.only_affected
+
+        # Every combination of keywords, CVE IDs and filters ends up in one query spec, which builds the (URL-encoded) requests
+        spec = build_spec(args, color)
+        print(color.blue(f'[INF] Filtering with {spec.describe()}'))
+
+        fetch.fetch_cve_keywords(spec, SAVE_TO_JSON=args.output, DEBUG=g_DEBUG)
     
+    #-------------------------------------------------------------#
+    if args.Mode == 'sync':
+
+        if args.silent:
+            sys.stdout = open(os.devnull, 'w')
+
+        if not args.silent:
+            banner()
+
+        mirror = Mirror(args.mirror)
+        start = datetime.now()
+
+        try:
+            count = mirror.sync(fetch.pager, fetch.base_url, full=args.full, DEBUG=g_DEBUG)
+        except KeyboardInterrupt:
+            print(color.blue('[INF] You aborted the sync. The mirror keeps everything stored so far, run a full sync to complete it.'))
+            sys.exit(0)
+        except Exception as e:
+            print(color.light_red(f'[ERR] An error occured while syncing the mirror: {e}'))
+            sys.exit(1)
+        finally:
+            mirror.close()
+
+        print(color.blue(f'[INF] Synced {count} CVEs into {args.mirror} in {datetime.now() - start}'))
+
     #-------------------------------------------------------------#
     if args.Mode == 'orbit':
 
@@ -307,11 +318,22 @@ def main():
         if not args.silent:
             banner()
 
-        # Dicts for the names and filters
-        # Names are basically the vendors or products you would search for
-        # Filters are the filtering mechanism you can use to narrow down the search (refer to the -h flag)
-        names = { }
-        filters = { }
+        # The keywords of the tiers are watched as well, they don't have to be repeated in -fkey
+        try:
+            tiers = parse_tiers(args.keyword_tier)
+        except ValueError as e:
+            print(color.light_red(f'[ERR] {e}'))
+            sys.exit(1)
+        args.filter_keywords = (args.filter_keywords or []) + list(tiers)
+
+        spec = build_spec(args, color, keep=tiers)
+
+        if args.only_affected and not args.inventory:
+            print(color.light_red('[ERR] --only-affected needs an inventory (-inv)'))
+            sys.exit(1)
+        if args.inventory:
+            orbit.inventory = load_inventory(args.inventory, color, g_DEBUG)
+            orbit.only_affected = args.only_affected
 
         if args.update_period:
             update_period = args.update_period
@@ -322,60 +344,117 @@ def main():
         else:
             request_limit = 5
 
+        if args.output:
+            orbit.writer = JsonlWriter(
+                'cveorbit_monitoring.jsonl',
+                max_bytes=args.rotate_size * 1024 * 1024,
+                max_age=args.rotate_age * 3600 if args.rotate_age else None,
+                compress=not args.no_compress,
+                fsync=args.fsync
+            )
+
+        # Alert channels, each of them gets its own background worker
+        if not args.smtp_password:
+            args.smtp_password = os.environ.get('SMTP_PASSWORD')
+        try:
+            channels = channels_from_args(args)
+        except ValueError as e:
+            print(color.light_red(f'[ERR] {e}'))
+            sys.exit(1)
+
+        if channels:
+            orbit.alerts = AlertDispatcher(channels, window=args.alert_window, DEBUG=g_DEBUG)
+
+        if args.track_updates:
+            orbit.track_updates()
+
+        # The metrics are only collected if someone reads them: the Prometheus endpoint, the snapshot file or both
+        metrics_server = snapshots = None
+        if args.metrics_port is not None or args.metrics_file:
+            orbit.metrics = transport.metrics = Metrics()
+            if args.metrics_port is not None:
+                try:
+                    metrics_server = MetricsServer(orbit.metrics, args.metrics_port)
+                except OSError as e:
+                    print(color.light_red(f'[ERR] Could not serve the metrics on port {args.metrics_port}: {e}'))
+                    sys.exit(1)
+                metrics_server.start()
+            if args.metrics_file:
+                snapshots = SnapshotWriter(orbit.metrics, args.metrics_file, args.metrics_interval)
+                snapshots.start()
+
         print(color.blue(f'[INF] Orbit mode activated...'))
         print(color.blue(f'[INF] Start date: \t\t{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'))
         print(color.blue(f'[INF] Update period: \t\t{update_period} seconds'))
-        print(color.blue(f'[INF] Limiting requests to: \t{request_limit}'))
-
-        if args.output is False:
-
-            if args.filter_keywords and not any([
-                args.filter_severity_3,
-                args.filter_severity_4
-                ]):
-                print(color.blue(f'[INF] Filtering with keywords: \t{args.filter_keywords}'))
-                
-                names['keywordSearch'] = args.filter_keywords
-                orbit.continuous_monitoring(names, filters, update_period, request_limit, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-
-            if args.filter_keywords and args.filter_severity_3:
-                print(color.blue(f'[INF] Filtering with keywords: \t{args.filter_keywords} and severity: {args.filter_severity_3}'))
-                
-                names['keywordSearch'] = args.filter_keywords
-                filters['cvssV3Severity'] = args.filter_severity_3
-                orbit.continuous_monitoring(names, filters, update_period, request_limit, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-
-            if args.filter_keywords and args.filter_severity_4:
-                print(color.blue(f'[INF] Filtering with keywords: \t{args.filter_keywords} and severity: {args.filter_severity_4}'))
-                
-                names['keywordSearch'] = args.filter_keywords
-                filters['cvssV4Severity'] = args.filter_severity_4
-                orbit.continuous_monitoring(names, filters, update_period, request_limit, SAVE_TO_JSON=False, DEBUG=g_DEBUG)
-        
-        elif args.output is True:
-
-            if args.filter_keywords and not any([
-                args.filter_severity_3,
-                args.filter_severity_4
-                ]):
-                print(color.blue(f'[INF] Filtering with keywords: \t{args.filter_keywords}'))
-                
-                names['keywordSearch'] = args.filter_keywords
-                orbit.continuous_monitoring(names, filters, update_period, request_limit, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-
-            if args.filter_keywords and args.filter_severity_3:
-                print(color.blue(f'[INF] Filtering with keywords: \t{args.filter_keywords} and severity: {args.filter_severity_3}'))
-                
-                names['keywordSearch'] = args.filter_keywords
-                filters['cvssV3Severity'] = args.filter_severity_3
-                orbit.continuous_monitoring(names, filters, update_period, request_limit, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
-
-            if args.filter_keywords and args.filter_severity_4:
-                print(color.blue(f'[INF] Filtering with keywords: \t{args.filter_keywords} and severity: {args.filter_severity_4}'))
-                
-                names['keywordSearch'] = args.filter_keywords
-                filters['cvssV4Severity'] = args.filter_severity_4
-                orbit.continuous_monitoring(names, filters, update_period, request_limit, SAVE_TO_JSON=True, DEBUG=g_DEBUG)
+        print(color.blue(f'[INF] Limiting requests to: \t{request_limit} keyword poll(s) per period'))
+        for interval in sorted(set(tiers.values())):
+            print(color.blue(f'[INF] Every {interval:g} seconds: \t{", ".join(keyword for keyword, value in tiers.items() if value == interval)}'))
+        if concurrency > 1:
+            print(color.blue(f'[INF] Concurrent requests: \t{concurrency}'))
+        print(color.blue(f'[INF] Polling strategy: \t{strategy}'))
+        if args.track_updates:
+            print(color.blue(f'[INF] Tracking updates: \t{len(orbit.fingerprints)} known fingerprint(s)'))
+        if channels:
+            print(color.blue(f'[INF] Alerting: \t\t{", ".join(channel.name for channel in channels)} (digest every {args.alert_window} seconds)'))
+        if metrics_server is not None:
+            print(color.blue(f'[INF] Metrics endpoint: \thttp://127.0.0.1:{metrics_server.port}/metrics'))
+        if snapshots is not None:
+            print(color.blue(f'[INF] Metrics snapshots: \t{args.metrics_file} (every {args.metrics_interval} seconds)'))
+        if state is not None and orbit.watermarks:
+            print(color.blue(f'[INF] Resuming from: \t\t{args.state_file} ({len(orbit.watermarks)} watermark(s), {len(orbit.seen_cve_ids)} seen CVE(s))'))
+
+        print(color.blue(f'[INF] Filtering with: \t\t{spec.describe()}'))
+
+        # Sharded mode: the keywords are split over several processes, this one only collects, dedupes and writes their results
+        if args.shards > 1 and strategy == 'delta':
+            print(color.blue('[INF] The delta strategy fetches the same window in every shard, running it in a single process'))
+
+        elif args.shards > 1:
+            print(color.blue(f'[INF] Shards: \t\t\t{args.shards} processes'))
+
+            supervisor = Supervisor(
+                args.shards,
+                SharedRateLimiter.for_api_key(api_key),
+                {
+                    'api_key': api_key,
+                    'retries': args.retries,
+                    'timeout': args.timeout,
+                    'pool_size': max(args.pool_size, concurrency),
+                    'concurrency': concurrency,
+                    'dedupe_window': dedupe_window,
+                    'state_file': None if args.no_state else args.state_file,
+                    'update_period': update_period,
+                    'request_limit': request_limit,
+                    'track_updates': args.track_updates,
+                    'metrics_file': args.metrics_file,
+                    'metrics_interval': args.metrics_interval,
+                    'tiers': tiers,
+                    'inventory': args.inventory,
+                    'only_affected': args.only_affected,
+                    'DEBUG': g_DEBUG
+                },
+                state=state,
+                dedupe_window=dedupe_window
+            )
+            supervisor.renderer = orbit.renderer
+            supervisor.writer = orbit.writer
+            supervisor.alerts = orbit.alerts
+            supervisor.metrics = orbit.metrics
+            try:
+                supervisor.run(spec, DEBUG=g_DEBUG)
+            finally:
+                orbit.close()
+                if snapshots is not None:
+                    snapshots.close()
+            return
+
+        try:
+            orbit.continuous_monitoring(spec, update_period, request_limit, SAVE_TO_JSON=args.output, DEBUG=g_DEBUG, tiers=tiers)
+        finally:
+            orbit.close()
+            # One last snapshot with the numbers up to the exit
+            if snapshots is not None:
+                snapshots.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core.alerts import AlertDispatcher, Channel, DiscordChannel, EmailChannel, SlackChannel, TeamsChannel, TelegramChannel
+from core.record import CveRecord
+
+
+def record(cve_id='CVE-2024-0001'):
+    return CveRecord(cve_id, '3.1', 'CRITICAL', 9.8, '2024-01-01T00:00:00.000', '2024-01-01T00:00:00.000', 'Remote code execution in the stub.')
+
+
+"""
+Local webhook: remembers every JSON body it gets and answers with "status".
+"""
+@pytest.fixture
+def webhook():
+    received = []
+    settings = {'status': 200}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            received.append((self.path, json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+            self.send_response(settings['status'])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}', received, settings
+    server.shutdown()
+    server.server_close()
+
+
+"""
+Local SMTP server speaking just enough of the protocol for smtplib, remembers the DATA of every message.
+"""
+@pytest.fixture
+def smtp_server():
+    messages = []
+
+    class Handler(socketserver.StreamRequestHandler):
+        def reply(self, line):
+            self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+        def handle(self):
+            self.reply('220 stub ESMTP')
+            while True:
+                line = self.rfile.readline().decode('utf-8').strip()
+                command = line.split(' ', 1)[0].upper()
+                if not line or command == 'QUIT':
+                    self.reply('221 bye')
+                    return
+                if command == 'EHLO':
+                    self.reply('250 stub')
+                elif command == 'DATA':
+                    self.reply('354 go ahead')
+                    data = []
+                    while (body := self.rfile.readline().decode('utf-8')) != '.\r\n':
+                        data.append(body)
+                    messages.append(''.join(data))
+                    self.reply('250 queued')
+                else:
+                    self.reply('250 ok')
+
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'127.0.0.1:{server.server_address[1]}', messages
+    server.shutdown()
+    server.server_close()
+
+
+def test_channel_send_is_abstract():
+    with pytest.raises(TypeError):
+        Channel()
+
+
+def test_webhook_channels_post_the_digest(webhook):
+    url, received, _ = webhook
+
+    DiscordChannel(f'{url}/discord').send([record()])
+    SlackChannel(f'{url}/slack').send([record(), record('CVE-2024-0002')])
+    TeamsChannel(f'{url}/teams').send([record()])
+
+    paths = dict(received)
+    assert paths['/discord']['content'].startswith('CVEOrbit: 1 new CVE(s)\n- CVE-2024-0001 [CRITICAL 9.8]')
+    assert 'CVE-2024-0002' in paths['/slack']['text']
+    assert '\n\n- CVE-2024-0001' in paths['/teams']['text']
+
+
+def test_telegram_posts_to_the_bot_api(webhook, monkeypatch):
+    url, received, _ = webhook
+    monkeypatch.setattr(TelegramChannel, 'api_url', url)
+
+    TelegramChannel('123:SECRET', '42').send([record()])
+
+    path, body = received[0]
+    assert path == '/bot123:SECRET/sendMessage'
+    assert body['chat_id'] == '42'
+
+
+def test_telegram_token_is_redacted_from_errors(webhook, monkeypatch, capsys):
+    url, _, settings = webhook
+    settings['status'] = 404
+    monkeypatch.setattr(TelegramChannel, 'api_url', url)
+
+    dispatcher = AlertDispatcher([], retries=0)
+    assert not dispatcher.deliver(TelegramChannel('123:SECRET', '42'), [record()])
+
+    output = capsys.readouterr().out
+    assert 'Could not send the telegram alert' in output
+    assert '404' in output
+    assert 'SECRET' not in output
+
+
+def test_dispatcher_sends_one_digest_per_window(webhook):
+    url, received, _ = webhook
+
+    dispatcher = AlertDispatcher([SlackChannel(f'{url}/slack')], window=0.2)
+    for i in range(3):
+        dispatcher.submit(record(f'CVE-2024-000{i}'))
+    dispatcher.close()
+
+    assert len(received) == 1
+    assert received[0][1]['text'].startswith('CVEOrbit: 3 new CVE(s)')
+
+
+def test_email_channel_sends_through_smtp(smtp_server):
+    server, messages = smtp_server
+
+    EmailChannel('soc@example.com', server, 'cveorbit@example.com').send([record()])
+
+    assert len(messages) == 1
+    assert 'Subject: CVEOrbit: 1 new CVE(s)' in messages[0]
+    assert 'To: soc@example.com' in messages[0]
+    assert 'CVE-2024-0001' in messages[0]
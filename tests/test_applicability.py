@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+from core.applicability import Inventory, version_key
+
+
+def cpe(vendor, product, version='*'):
+    return f'cpe:2.3:a:{vendor}:{product}:{version}:*:*:*:*:*:*:*'
+
+
+def vulnerability(cve_id, configurations):
+    return {'cve': {'id': cve_id, 'configurations': configurations}}
+
+
+def node(*matches, operator='OR'):
+    return {'operator': operator, 'negate': False, 'cpeMatch': list(matches)}
+
+
+def affected(inventory, vulnerabilities):
+    return sorted((match.cve_id, match.asset, match.version) for match in inventory.match(vulnerabilities))
+
+
+def test_versions_compare_like_versions():
+    assert version_key('1.10') > version_key('1.9')
+    assert version_key('1.2') == version_key('1.2.0')
+    assert version_key('2.0-rc1') < version_key('2.0') < version_key('2.0.1')
+    assert version_key('1.1.1k') > version_key('1.1.1')
+
+
+def test_version_ranges():
+    inventory = Inventory()
+    inventory.add('web01', 'apache', 'tomcat', '9.0.40')
+    inventory.add('web02', 'apache', 'tomcat', '9.0.50')
+    inventory.add('web03', 'Apache', 'Apache Tomcat', '8.5.1')
+
+    tomcat = vulnerability('CVE-1', [{'nodes': [node(
+        {'vulnerable': True, 'criteria': cpe('apache', 'tomcat'), 'versionStartIncluding': '9.0.0', 'versionEndExcluding': '9.0.50'},
+        {'vulnerable': True, 'criteria': cpe('apache', 'tomcat'), 'versionEndIncluding': '8.5.1'}
+    )]}])
+
+    assert affected(inventory, [tomcat]) == [('CVE-1', 'web01', '9.0.40'), ('CVE-1', 'web03', '8.5.1')]
+
+
+def test_and_configuration_needs_every_vulnerable_node():
+    inventory = Inventory()
+    inventory.add('tomcat-only', 'apache', 'tomcat', '9.0.30')
+    inventory.add('both', 'apache', 'tomcat', '9.0.30')
+    inventory.add('both', 'acme', 'plugin', '1.0')
+
+    cve = vulnerability('CVE-2', [{'operator': 'AND', 'nodes': [
+        node({'vulnerable': True, 'criteria': cpe('apache', 'tomcat', '9.0.30')}),
+        node({'vulnerable': True, 'criteria': cpe('acme', 'plugin', '1.0')})
+    ]}])
+
+    assert [asset for _, asset, _ in affected(inventory, [cve])] == ['both', 'both']
+
+    # No asset has the plugin at all, so its node is never indexed. It still has to fail.
+    tomcat_only = Inventory()
+    tomcat_only.add('tomcat-only', 'apache', 'tomcat', '9.0.30')
+    assert affected(tomcat_only, [cve]) == []
+
+
+def test_platform_only_rules_out_when_the_inventory_contradicts_it():
+    inventory = Inventory()
+    inventory.add('unknown-os', 'acme', 'widget', '3.2')
+    inventory.add('other-os', 'acme', 'widget', '3.2')
+    inventory.add('other-os', 'microsoft', 'windows_11', '1')
+
+    cve = vulnerability('CVE-3', [{'operator': 'AND', 'nodes': [
+        node({'vulnerable': True, 'criteria': cpe('acme', 'widget', '3.2')}),
+        node({'vulnerable': False, 'criteria': 'cpe:2.3:o:microsoft:windows_11:2:*:*:*:*:*:*:*'})
+    ]}])
+
+    assert affected(inventory, [cve]) == [('CVE-3', 'unknown-os', '3.2')]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import threading
+
+import pytest
+
+from core.pager import Pager
+from core.ratelimit import RateLimiter
+from core.retry import RetryPolicy
+from core.transport import Transport
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+from stub_server import Dataset, serve, synthetic
+
+
+"""
+Local NVD with 500 records. The pages are uncompressed and ~400 KB each, so a page we only read the header of still holds
+its connection.
+"""
+@pytest.fixture
+def nvd():
+    server = serve(Dataset(synthetic(500, 30)), port=0, page_size=100, compress=False)
+    yield f'http://127.0.0.1:{server.server_address[1]}/rest/json/cves/2.0'
+    server.shutdown()
+    server.server_close()
+
+
+"""
+Runs "call" in a thread and gives up after "timeout" seconds, a leaked connection makes the next request hang.
+"""
+def finishes(call, timeout=10):
+    result = []
+    worker = threading.Thread(target=lambda: result.append(call()), daemon=True)
+    worker.start()
+    worker.join(timeout)
+    return bool(result)
+
+
+def test_failed_page_releases_the_pages_in_flight(nvd):
+    transport = Transport(rate_limiter=RateLimiter(10000, 1), retry_policy=RetryPolicy(max_retries=0), pool_size=2)
+
+    def get_stream(url):
+        if 'startIndex=200' in url:
+            raise RuntimeError('NVD went away')
+        return transport.get_stream(url)
+
+    pager = Pager(transport.get_json, results_per_page=100, max_workers=2, get_stream=get_stream)
+    total, records = pager.stream(nvd)
+    assert total == 500
+
+    with pytest.raises(RuntimeError):
+        for _ in records:
+            pass
+
+    # The page after the failed one was in flight and never read, it must not keep the connection
+    assert finishes(lambda: transport.get_json(pager.page_url(nvd, 0)))
+    assert finishes(lambda: transport.get_json(pager.page_url(nvd, 100)))
+
+
+def test_abandoned_streams_give_their_connections_back(nvd):
+    transport = Transport(rate_limiter=RateLimiter(10000, 1), retry_policy=RetryPolicy(max_retries=0), pool_size=2)
+    pager = Pager(transport.get_json, results_per_page=100, max_workers=2, get_stream=transport.get_stream)
+
+    # Stopping after the first record of every query, the rest of the pages is never read
+    for _ in range(3):
+        total, records = pager.stream(nvd)
+        next(records)
+        records.close()
+
+    assert finishes(lambda: transport.get_json(pager.page_url(nvd, 0)))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+
+import pytest
+
+from core.record import CveRecord
+from core.render import RENDERERS, JsonlRenderer, Renderer
+
+
+def test_renderer_format_is_abstract():
+    class Incomplete(Renderer):
+        pass
+
+    with pytest.raises(TypeError):
+        Renderer()
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_every_renderer_can_be_created():
+    for renderer in RENDERERS.values():
+        renderer()
+
+
+def test_jsonl_records_go_to_their_own_stream():
+    renderer = JsonlRenderer()
+    renderer.stream = io.StringIO()
+
+    renderer.record(CveRecord('CVE-2024-0001', '3.1', 'CRITICAL', 9.8, '2024-01-01T00:00:00.000', '2024-01-01T00:00:00.000', 'Stub.'))
+    renderer.flush()
+
+    assert [json.loads(line) for line in renderer.stream.getvalue().splitlines()][0]['CVE ID'] == 'CVE-2024-0001'
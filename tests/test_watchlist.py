@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from argparse import Namespace
+
+from core.colors import Colors
+from core.watchlist import Watchlist, cpe_term, minimize, normalize
+from cveorbit import load_watchlist
+
+
+def test_normalize_drops_versions_next_to_a_name():
+    assert normalize('Apache  Tomcat 9.0.50') == 'apache tomcat'
+    assert normalize('openssl 1.1.1k') == 'openssl'
+    assert normalize('node 18.2.0-rc1') == 'node'
+    assert normalize('nginx v2.4') == 'nginx'
+
+
+def test_normalize_keeps_names_that_look_like_versions():
+    assert normalize('7-Zip') == '7-zip'
+    assert normalize('v8') == 'v8'
+    assert normalize('google v8') == 'google v8'
+    assert normalize('3com') == '3com'
+
+
+def test_cpe_of_a_numeric_product_is_a_term(tmp_path):
+    assert cpe_term('cpe:2.3:a:7-zip:7-zip:19.00:*:*:*:*:*:*:*') == '7-zip'
+
+    path = tmp_path / 'inventory.csv'
+    path.write_text('cpe\ncpe:2.3:a:7-zip:7-zip:19.00:*:*:*:*:*:*:*\ncpe:2.3:a:google:v8:10.2:*:*:*:*:*:*:*\n')
+    watchlist = Watchlist()
+    watchlist.add_file(str(path))
+    assert list(watchlist.terms) == ['7-zip', 'google v8']
+
+
+def test_minimize_drops_covered_terms():
+    assert minimize(['apache tomcat', 'apache', 'openssl', 'apache http server']) == ['apache', 'openssl']
+
+
+def test_minimize_never_drops_kept_terms():
+    assert minimize(['apache', 'apache tomcat', 'v8'], keep=('Apache Tomcat', 'v8')) == ['apache', 'apache tomcat', 'v8']
+
+
+def test_load_watchlist_keeps_filter_keywords_and_tiers(tmp_path):
+    path = tmp_path / 'watchlist.txt'
+    path.write_text('openssl\napache tomcat\n# comment\n')
+
+    args = Namespace(watchlist=[str(path)], debug=False, no_minimize=False, filter_keywords=['7-Zip', 'v8', 'apache'])
+    load_watchlist(args, Colors(), keep=('v8',))
+
+    assert args.filter_keywords == ['7-Zip', 'v8', 'apache', 'openssl']